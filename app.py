@@ -3,6 +3,19 @@ from flask_socketio import SocketIO
 from src.Lib.Hardening.APKProcessor import APKProcessor
 from src.Lib.Hardening.APKProcessorTest import APKProcessorTest
 from src.Lib.Hardening.APKTool import APKTool
+from src.Lib.Hardening.DecodeCache import DecodeCache
+from src.Lib.Hardening.ApkSigner import ApkSigner
+from src.Lib.Hardening.KeystorePool import KeystorePool
+from src.Lib.Hardening.Downloader import Downloader
+from src.Lib.Hardening.DownloadCoalescer import DownloadCoalescer
+from src.Lib.Hardening.SourceCache import SourceCache
+from src.Lib.Hardening.WorkspaceJanitor import WorkspaceJanitor
+from src.Lib.Hardening.WorkspaceTiers import WorkspaceTiers
+from src.Lib.Hardening.SmaliRewriter import SmaliRewriter
+from src.Lib.Hardening.Autoscaler import Autoscaler, ConcurrencyLimit
+from src.Lib.Hardening.JobRegistry import JobRegistry
+from src.Lib.Hardening.JobStore import JobStore
+from src.Lib.Callback.CallbackOutbox import CallbackOutbox
 from src.Controllers.APKController import APKController
 from flask import Flask, jsonify, request
 import os
@@ -13,77 +26,265 @@ load_dotenv()
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 
-app = Flask(__name__)
+def create_app():
+    """
+    Builds the Flask/Socket.IO app and every service behind it (apktool daemons, caches,
+    outbox, pipeline, ...). Kept out of module scope so that importing this file — which
+    spawn-context worker processes do as __mp_main__ — starts nothing.
+    """
+    app = Flask(__name__)
 
-cors_origins = os.getenv("SOCKETIO_CORS_ORIGINS", "*").split(",")
+    cors_origins = os.getenv("SOCKETIO_CORS_ORIGINS", "*").split(",")
 
-socketio = SocketIO(
-    app,
-    async_mode='eventlet',
-    cors_allowed_origins=cors_origins,
-)
+    socketio = SocketIO(
+        app,
+        async_mode='eventlet',
+        cors_allowed_origins=cors_origins,
+    )
 
-init_socketio(socketio)
+    init_socketio(socketio)
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+    BASE_URL = os.getenv("HARDENING_BASE_URL", "http://localhost:8000")
+    DOWNLOAD_DIR = os.getenv("HARDENING_DOWNLOAD_DIR",
+                             os.path.join(BASE_DIR, "downloads"))
 
-BASE_URL = os.getenv("HARDENING_BASE_URL", "http://localhost:8000")
-DOWNLOAD_DIR = os.getenv("HARDENING_DOWNLOAD_DIR",
-                         os.path.join(BASE_DIR, "downloads"))
+    apktool_path = os.path.join(BASE_DIR, "apktool/Apktool/apktool_2.12.1.jar")
+    jobs_dir = os.path.join(BASE_DIR, "jobs")
 
-apktool_path = os.path.join(BASE_DIR, "apktool/Apktool/apktool_2.12.1.jar")
-jobs_dir = os.path.join(BASE_DIR, "jobs")
+    os.makedirs(jobs_dir, exist_ok=True)
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
-os.makedirs(jobs_dir, exist_ok=True)
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    apktool = APKTool(
+        jar_path=apktool_path,
+        daemon_workers=int(os.getenv("APKTOOL_WORKERS", "2")),
+        daemon_max_jobs=int(os.getenv("APKTOOL_WORKER_MAX_JOBS", "50")),
+        daemon_max_rss_mb=int(os.getenv("APKTOOL_WORKER_MAX_RSS_MB", "2048")),
+        # a decode/build waits this long for a warm JVM before running cold
+        daemon_idle_wait=float(os.getenv("APKTOOL_WORKER_WAIT_SEC", "1")),
+    )
 
-apktool = APKTool(jar_path=apktool_path)
+    decode_cache_mb = int(os.getenv("HARDENING_DECODE_CACHE_MAX_MB", "20480"))
+    decode_cache = DecodeCache(
+        cache_dir=os.getenv("HARDENING_DECODE_CACHE_DIR", os.path.join(jobs_dir, "decode_cache")),
+        max_bytes=decode_cache_mb * 1024 * 1024,
+    ) if decode_cache_mb > 0 else None
 
-processor = APKProcessor(
-    jobs_dir=jobs_dir,
-    download_dir=DOWNLOAD_DIR,
-    apktool=apktool,
-    base_url=BASE_URL
-)
+    # In-process v1/v2/v3 signing (needs `cryptography`); HARDENING_NATIVE_SIGNER=0 keeps apksigner
+    apk_signer = ApkSigner(
+        digest_workers=int(os.getenv("APK_SIGNER_DIGEST_WORKERS", "0")) or None,
+    ) if os.getenv("HARDENING_NATIVE_SIGNER", "1") != "0" else None
 
-test_processor = APKProcessorTest(
-    jobs_dir=jobs_dir,
-    download_dir=DOWNLOAD_DIR,
-    apktool=apktool,
-    base_url=BASE_URL
-)
+    # Spare keystores generated in the background and bound to a job id on first use
+    keystore_pool = KeystorePool(
+        keystore_dir=os.path.join(jobs_dir, "keystores"),
+        spares=int(os.getenv("HARDENING_KEYSTORE_SPARES", "8")),
+    )
 
-apk_controller = APKController(processor)
+    # Pooled per-host sessions, Range segments and resume for source APK downloads
+    http_downloader = Downloader(
+        segments=int(os.getenv("HARDENING_DOWNLOAD_SEGMENTS", "4")),
+        segment_threshold=int(os.getenv("HARDENING_DOWNLOAD_SEGMENT_MIN_MB", "32")) * 1024 * 1024,
+        retries=int(os.getenv("HARDENING_DOWNLOAD_RETRIES", "3")),
+    )
 
-apk_test_controller = APKController(test_processor)
+    # Source APKs kept across restarts and reused while the origin answers 304 Not Modified
+    source_cache_mb = int(os.getenv("HARDENING_SOURCE_CACHE_MAX_MB", "10240"))
+    source_cache = SourceCache(
+        http_downloader,
+        cache_dir=os.path.join(DOWNLOAD_DIR, ".source_cache"),
+        max_bytes=source_cache_mb * 1024 * 1024,
+    ) if source_cache_mb > 0 else None
 
+    # Jobs for the same apk_url share one download; finished downloads are reused for a short TTL
+    downloader = DownloadCoalescer(
+        source_cache or http_downloader,
+        shared_dir=os.path.join(jobs_dir, "shared_downloads"),
+        ttl=float(os.getenv("HARDENING_DOWNLOAD_TTL_SEC", "300")),
+    )
 
-@app.route("/", methods=["GET"])
-def home():
-    return "404 not found - 1.1.18"
+    # Job results are persisted before delivery and retried with backoff until the callback host accepts them
+    callback_outbox = CallbackOutbox(
+        db_path=os.path.join(jobs_dir, "callbacks.db"),
+        workers=int(os.getenv("HARDENING_CALLBACK_WORKERS", "4")),
+        max_attempts=int(os.getenv("HARDENING_CALLBACK_MAX_ATTEMPTS", "8")),
+    )
 
+    # Job workspaces go to tmpfs while the RAM budget allows, else to jobs/
+    ram_workspace_dir = os.getenv("HARDENING_RAM_WORKSPACE_DIR",
+                                  "/dev/shm/apk_jobs" if os.path.isdir("/dev/shm") else "")
+    workspaces = WorkspaceTiers(
+        disk_dir=jobs_dir,
+        ram_dir=ram_workspace_dir or None,
+        ram_budget=int(os.getenv("HARDENING_RAM_WORKSPACE_MB", "2048")) * 1024 * 1024,
+        size_factor=float(os.getenv("HARDENING_RAM_WORKSPACE_FACTOR", "6")),
+    )
 
-@app.route("/harden", methods=["POST"])
-def harden():
-    return apk_controller.harden_background()
+    # Finished/orphaned job workspaces are renamed into .trash and deleted in the background
+    janitor = WorkspaceJanitor(
+        roots=[jobs_dir]
+        + ([str(workspaces.ram_dir)] if workspaces.ram_dir else [])
+        + ([apktool.tmp_root()] if apktool.tmp_root() else []),
+        workers=int(os.getenv("HARDENING_JANITOR_WORKERS", "2")),
+        files_per_sec=int(os.getenv("HARDENING_JANITOR_FILES_PER_SEC", "5000")),
+        orphan_age=float(os.getenv("HARDENING_JANITOR_ORPHAN_AGE_SEC", "3600")),
+    )
 
-@app.route("/test-harden", methods=["POST"])
-def test_harden():
-    return apk_test_controller.harden_background()
+    # One job-concurrency budget for /harden and /test-harden, resized from host load and memory
+    concurrency = ConcurrencyLimit(int(os.getenv("HARDENING_MAX_CONCURRENT_JOBS", "4")))
 
+    autoscaler = Autoscaler(
+        concurrency,
+        min_jobs=int(os.getenv("HARDENING_AUTOSCALE_MIN", "1")),
+        max_jobs=int(os.getenv("HARDENING_AUTOSCALE_MAX", "10")),
+        interval=float(os.getenv("HARDENING_AUTOSCALE_INTERVAL_SEC", "5")),
+        cooldown=float(os.getenv("HARDENING_AUTOSCALE_COOLDOWN_SEC", "30")),
+        min_free_mb=int(os.getenv("HARDENING_AUTOSCALE_MIN_FREE_MB", "1024")),
+        backlog=lambda: len(processor.pipeline.scheduler),
+    ) if os.getenv("HARDENING_AUTOSCALE", "1") != "0" and os.path.exists("/proc/meminfo") else None
 
-@app.route("/job-completed", methods=["POST"])
-def jobStatus():
-    data = request.get_json(silent=True) or {}
-    socketio.emit('job_completed', data)
-    return jsonify({"status": "ok"}), 200
+    # State of every accepted job for GET /jobs; finished ones are kept in a bounded JSONL tail
+    registry = JobRegistry(
+        os.path.join(jobs_dir, "job_history.jsonl"),
+        history=int(os.getenv("HARDENING_JOB_HISTORY", "100000")),
+    )
 
+    # Accepted-but-unfinished jobs with their last stage checkpoint, resumed after a restart
+    job_store = JobStore(os.path.join(jobs_dir, "jobs.db"))
 
-@socketio.on('notify')
-def handle_notify(data):
-    socketio.emit('notify', data)
+    processor = APKProcessor(
+        jobs_dir=jobs_dir,
+        download_dir=DOWNLOAD_DIR,
+        apktool=apktool,
+        base_url=BASE_URL,
+        decode_cache=decode_cache,
+        apk_signer=apk_signer,
+        keystore_pool=keystore_pool,
+        downloader=downloader,
+        callback_outbox=callback_outbox,
+        janitor=janitor,
+        workspaces=workspaces,
+        concurrency=concurrency,
+        memory_guard=autoscaler.has_memory_headroom if autoscaler else None,
+        registry=registry,
+        job_store=job_store
+    )
+
+    # Package-rename smali rewrites run in worker processes instead of under the server's GIL
+    smali_rewriter = SmaliRewriter(
+        workers=int(os.getenv("HARDENING_SMALI_WORKERS", "0")) or None,
+    )
+
+    test_processor = APKProcessorTest(
+        jobs_dir=jobs_dir,
+        download_dir=DOWNLOAD_DIR,
+        apktool=apktool,
+        base_url=BASE_URL,
+        apk_signer=apk_signer,
+        keystore_pool=keystore_pool,
+        downloader=downloader,
+        callback_outbox=callback_outbox,
+        janitor=janitor,
+        smali_rewriter=smali_rewriter,
+        job_core=processor.pipeline  # test jobs are admitted by the production pipeline, lowest class
+    )
+
+    resumed = processor.resume_interrupted()
+    if resumed:
+        print(f"[Startup] Resumed {resumed} jobs interrupted by the last shutdown")
+
+    apk_controller = APKController(processor)
+
+    apk_test_controller = APKController(test_processor)
+
+    @app.route("/", methods=["GET"])
+    def home():
+        return "404 not found - 1.1.18"
+
+    @app.route("/harden", methods=["POST"])
+    def harden():
+        return apk_controller.harden_background()
+
+    @app.route("/harden/batch", methods=["POST"])
+    def harden_batch():
+        return apk_controller.harden_batch()
+
+    @app.route("/harden/variants", methods=["POST"])
+    def harden_variants():
+        return apk_controller.harden_variants()
+
+    @app.route("/test-harden", methods=["POST"])
+    def test_harden():
+        return apk_test_controller.harden_background()
+
+    # operator endpoints; /harden* check the key in APKController
+    api_key_endpoints = {"metrics", "autoscaler_metrics", "job_status", "jobs", "retry_dead_callbacks"}
+
+    @app.before_request
+    def require_api_key():
+        required_key = os.getenv("HARDENING_API_KEY")
+        if (request.endpoint in api_key_endpoints and required_key
+                and request.headers.get("X-API-Key") != required_key):
+            return jsonify({"status": "failed", "error": "Unauthorized"}), 401
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return jsonify({
+            "downloads": http_downloader.stats(),
+            "download_coalescing": downloader.stats(),
+            "source_cache": source_cache.stats() if source_cache else None,
+            "pipeline": processor.pipeline.stats(),
+            "decode_cache": decode_cache.stats() if decode_cache else None,
+            "keystore_pool": keystore_pool.stats(),
+            "callbacks": callback_outbox.stats(),
+            "janitor": janitor.stats(),
+            "workspaces": workspaces.stats(),
+            "concurrency": concurrency_stats(),
+            "jobs": registry.stats(),
+            "job_store": job_store.stats(),
+        }), 200
+
+    def concurrency_stats() -> dict:
+        if autoscaler is None:
+            return {"enabled": False, "concurrency": concurrency.limit, "active_jobs": concurrency.active}
+        return dict(autoscaler.stats(), enabled=True)
+
+    @app.route("/metrics/autoscaler", methods=["GET"])
+    def autoscaler_metrics():
+        return jsonify(concurrency_stats()), 200
+
+    @app.route("/jobs/<job_id>", methods=["GET"])
+    def job_status(job_id):
+        record = processor.job_status(job_id)
+        if record is None:
+            return jsonify({"status": "failed", "error": "Unknown job"}), 404
+        return jsonify(record), 200
+
+    @app.route("/jobs", methods=["GET"])
+    def jobs():
+        limit = min(request.args.get("limit", 100, type=int), 1000)
+        found = registry.by(domain=request.args.get("domain"), state=request.args.get("state"), limit=limit)
+        return jsonify({"jobs": found, "count": len(found)}), 200
+
+    @app.route("/callbacks/retry-dead", methods=["POST"])
+    def retry_dead_callbacks():
+        return jsonify({"status": "ok", "requeued": callback_outbox.retry_dead()}), 200
+
+    @app.route("/job-completed", methods=["POST"])
+    def jobStatus():
+        data = request.get_json(silent=True) or {}
+        socketio.emit('job_completed', data)
+        return jsonify({"status": "ok"}), 200
+
+    @socketio.on('notify')
+    def handle_notify(data):
+        socketio.emit('notify', data)
+
+    return app, socketio
 
 
 if __name__ == "__main__":
-    socketio.run(app, host="0.0.0.0", port=8000, debug=True)
+    app, socketio = create_app()
+    # no reloader: its watcher process would run create_app() too and resume the same jobs
+    socketio.run(app, host="0.0.0.0", port=8000, debug=True, use_reloader=False)
@@ -1,5 +1,7 @@
 from flask import request, jsonify
+import json
 import os
+from typing import List, Optional, Tuple, Union
 from src.Lib.Socket.emitter import emit
 from src.Lib.Hardening.Job import Job
 
@@ -8,13 +10,19 @@ class APKController:
     def __init__(self, processor):
         self.processor = processor
 
-    def harden_background(self):
-        data = request.get_json(silent=True) or {}
+    MAX_VARIANTS = int(os.getenv("HARDENING_MAX_VARIANTS", "50"))
+    MAX_BATCH = int(os.getenv("HARDENING_MAX_BATCH", "5000"))
+    NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+    @staticmethod
+    def _authorized(data: dict) -> bool:
         required_key = os.getenv("HARDENING_API_KEY")
         provided_key = data.get("api_key") or request.headers.get("X-API-Key")
-        if required_key and provided_key != required_key:
-            return jsonify({"status": "failed", "error": "Unauthorized"}), 401
+        return not required_key or provided_key == required_key
 
+    @staticmethod
+    def _parse_job(data: dict) -> Tuple[Optional[Job], Optional[str]]:
+        """Builds a Job from request fields; returns (None, error) when a field is missing or invalid."""
         apk_url = data.get("apk_url")
         callback_url = data.get("callback_url")
         id = data.get("id")
@@ -28,20 +36,23 @@ class APKController:
         app_key = data.get("app_key")
         apk_key = data.get("apk_key")
         op_call_back = data.get("op_call_back")
+        priority = data.get("priority", "interactive")
 
         if not apk_url:
-            return jsonify({"status": "failed", "error": "apk_url is required"}), 400
+            return None, "apk_url is required"
         if not callback_url:
-            return jsonify({"status": "failed", "error": "callback_url is required"}), 400
+            return None, "callback_url is required"
         if not id:
-            return jsonify({"status": "failed", "error": "id required"}), 400
+            return None, "id required"
         if not domain:
-            return jsonify({"status": "failed", "error": "domain required"}), 400
+            return None, "domain required"
         if not file_name:
-            return jsonify({"status": "failed", "error": "File name required"}), 400
+            return None, "File name required"
 
         if not package_name_method:
-            return jsonify({"status": "failed", "error": "Package name Method required"}), 400
+            return None, "Package name Method required"
+        if priority not in ("interactive", "bulk"):
+            return None, "priority must be 'interactive' or 'bulk'"
 
         # Create Job object
         job = Job(
@@ -57,14 +68,155 @@ class APKController:
             app_key = app_key,
             apk_key=apk_key,
             op_call_back=op_call_back,
+            priority=priority,
         )
+        return job, None
+
+    def harden_background(self):
+        data = request.get_json(silent=True) or {}
+        if not self._authorized(data):
+            return jsonify({"status": "failed", "error": "Unauthorized"}), 401
+
+        job, error = self._parse_job(data)
+        if error:
+            return jsonify({"status": "failed", "error": error}), 400
 
-        job_id = self.processor.start_background_hardening(job)
+        try:
+            job_id = self.processor.start_background_hardening(job)
+        except RuntimeError as e:
+            return jsonify({"status": "failed", "error": str(e)}), 503
         response = {
             "status": "accepted",
             "job_id": job_id,
-            "id": id,
+            "id": job.id,
+            "priority": job.priority,
+            **self.processor.queue_status(job_id),
             "message": "Hardening started in background. You will receive result via callback."
         }
         emit('job_accepted', response)
         return jsonify(response), 202
+
+    def harden_variants(self):
+        """
+        One source APK, many branded variants. Top-level fields are shared; each entry of
+        `variants` overrides them (id, file_name, name, apk_key, current_version, ...).
+        Every variant gets its own job_id and callback.
+        """
+        data = request.get_json(silent=True) or {}
+        if not self._authorized(data):
+            return jsonify({"status": "failed", "error": "Unauthorized"}), 401
+
+        variants = data.get("variants")
+        if not isinstance(variants, list) or not variants:
+            return jsonify({"status": "failed", "error": "variants must be a non-empty list"}), 400
+        if len(variants) > self.MAX_VARIANTS:
+            return jsonify({"status": "failed", "error": f"At most {self.MAX_VARIANTS} variants per request"}), 400
+
+        base = {key: value for key, value in data.items() if key not in ("variants", "api_key")}
+        jobs = []
+        for index, variant in enumerate(variants):
+            if not isinstance(variant, dict):
+                return jsonify({"status": "failed", "error": f"variants[{index}] must be an object"}), 400
+            if variant.get("apk_url", base.get("apk_url")) != base.get("apk_url"):
+                return jsonify({"status": "failed", "error": f"variants[{index}]: apk_url must match the group"}), 400
+            job, error = self._parse_job({**base, **variant})
+            if error:
+                return jsonify({"status": "failed", "error": f"variants[{index}]: {error}"}), 400
+            jobs.append(job)
+
+        try:
+            group_id = self.processor.start_variant_hardening(jobs)
+        except RuntimeError as e:
+            return jsonify({"status": "failed", "error": str(e)}), 503
+        response = {
+            "status": "accepted",
+            "group_id": group_id,
+            "variants": [
+                {"job_id": job.job_id, "id": job.id, **self.processor.queue_status(job.job_id)}
+                for job in jobs
+            ],
+            "message": "Variants started in background. You will receive one callback per variant."
+        }
+        emit('job_accepted', response)
+        return jsonify(response), 202
+
+    def _read_batch(self) -> Tuple[dict, Optional[List[Union[dict, str]]], Optional[str]]:
+        """
+        (envelope, specs, error) from a JSON array, a {"jobs": [...]} object or NDJSON. NDJSON
+        is parsed line by line as it streams in; a line that is not valid JSON becomes an
+        error string in `specs` so it is reported per item.
+        """
+        if request.mimetype in self.NDJSON_TYPES:
+            specs = []
+            for number, line in enumerate(request.stream, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                if len(specs) >= self.MAX_BATCH:
+                    return {}, None, f"At most {self.MAX_BATCH} jobs per batch"
+                try:
+                    specs.append(json.loads(line))
+                except ValueError as e:
+                    specs.append(f"line {number}: invalid JSON ({e})")
+            return {}, specs, None
+
+        data = request.get_json(silent=True)
+        envelope = data if isinstance(data, dict) else {}
+        specs = data if isinstance(data, list) else envelope.get("jobs")
+        if not isinstance(specs, list):
+            return envelope, None, "Body must be a JSON array, {\"jobs\": [...]} or NDJSON"
+        if len(specs) > self.MAX_BATCH:
+            return envelope, None, f"At most {self.MAX_BATCH} jobs per batch"
+        return envelope, specs, None
+
+    def harden_batch(self):
+        """
+        Many jobs in one request. Every item is validated first, then the valid ones are
+        queued in order in one go; if the pending queue fills up, the remaining items are
+        reported as rejected and can be resubmitted. Items never depend on each other.
+        """
+        if request.mimetype in self.NDJSON_TYPES and not self._authorized({}):
+            return jsonify({"status": "failed", "error": "Unauthorized"}), 401  # before reading the stream
+        envelope, specs, error = self._read_batch()
+        if not self._authorized(envelope):
+            return jsonify({"status": "failed", "error": "Unauthorized"}), 401
+        if error:
+            return jsonify({"status": "failed", "error": error}), 400
+
+        items, jobs = [], []
+        for index, spec in enumerate(specs):
+            if isinstance(spec, str):
+                job, error = None, spec
+            elif not isinstance(spec, dict):
+                job, error = None, "job spec must be an object"
+            else:
+                job, error = self._parse_job(spec)
+            if error:
+                items.append({"index": index, "status": "invalid", "error": error})
+            else:
+                items.append({"index": index, "status": "accepted", "job_id": job.job_id, "id": job.id})
+                jobs.append(job)
+
+        try:
+            queued = self.processor.start_batch_hardening(jobs) if jobs else 0
+        except RuntimeError as e:
+            queued, queue_error = 0, str(e)
+        else:
+            queue_error = "Queue is full"
+        accepted = 0
+        for item in items:
+            if item["status"] != "accepted":
+                continue
+            if accepted >= queued:
+                item.update(status="rejected", error=queue_error)
+                item.pop("job_id")
+            else:
+                accepted += 1
+
+        counts = {status: sum(1 for item in items if item["status"] == status)
+                  for status in ("accepted", "invalid", "rejected")}
+        response = {"status": "accepted" if accepted else "failed", **counts, "items": items}
+        emit('batch_accepted', counts)
+        if accepted:
+            return jsonify(response), 202
+        return jsonify(response), 503 if counts["rejected"] else 400
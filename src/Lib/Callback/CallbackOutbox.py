@@ -0,0 +1,302 @@
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_error TEXT,
+    claimed_by TEXT,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+"""
+
+CLAIM_COLUMNS = (("claimed_by", "TEXT"), ("claimed_at", "REAL"))
+
+
+class CallbackOutbox:
+    """
+    Durable job-result callbacks: results are written to a SQLite outbox and delivered by
+    a fixed pool of dispatcher threads over per-host keep-alive sessions. Failed posts are
+    retried with exponential backoff; after `max_attempts` (or a non-retryable 4xx) the
+    row is kept as a dead letter. A claimed row carries its owner (host:pid) and claim time,
+    refreshed while its post is in flight; it is only re-queued once that lease is stale or
+    the owning local process is gone, so several processes can share one outbox.
+    """
+
+    def __init__(self, db_path: str, workers: int = 4, max_attempts: int = 8, base_delay: float = 2.0,
+                 max_delay: float = 600.0, connect_timeout: int = 5, read_timeout: int = 12,
+                 lease: Optional[float] = None):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = (connect_timeout, read_timeout)
+        # claims of in-flight posts are refreshed every lease / 3, so an older one was abandoned
+        self.lease = lease if lease is not None else max(60.0, 2.0 * (connect_timeout + read_timeout))
+        self.host = socket.gethostname()
+        self.owner = f"{self.host}:{os.getpid()}"
+        self.next_recovery = 0.0
+        self.in_flight = set()
+        self.stopped = threading.Event()  # not `wakeup`: enqueue's notify() must reach a dispatcher
+
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition()
+        self.closed = False
+        self.sessions: Dict[str, requests.Session] = {}
+        self.delivered = 0
+        self.failed_attempts = 0
+        self.dead = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+        db = self._db()
+        db.executescript(SCHEMA)
+        columns = {row[1] for row in db.execute("PRAGMA table_info(outbox)")}
+        for name, kind in CLAIM_COLUMNS:
+            if name not in columns:
+                db.execute(f"ALTER TABLE outbox ADD COLUMN {name} {kind}")
+        recovered = self._recover()
+        if recovered:
+            print(f"[CallbackOutbox] Re-queued {recovered} callbacks interrupted by a restart")
+
+        self.threads = [
+            threading.Thread(target=self._dispatch_loop, name=f"Callback-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        self.threads.append(threading.Thread(target=self._lease_loop, name="Callback-lease", daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    def enqueue(self, job_id: str, url: str, result: dict):
+        """Stores `result` for delivery to `url`; returns once it is durable."""
+        now = time.time()
+        self._db().execute(
+            "INSERT INTO outbox (job_id, url, payload, next_attempt, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, url, json.dumps(result), now, now))
+        with self.wakeup:
+            self.wakeup.notify()
+
+    # --- dispatch -------------------------------------------------------------
+
+    def _claim(self) -> Optional[tuple]:
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute(
+                "SELECT id, job_id, url, payload, attempts, created_at FROM outbox "
+                "WHERE status = 'pending' AND next_attempt <= ? ORDER BY next_attempt LIMIT 1",
+                (time.time(),)).fetchone()
+            if row is not None:
+                db.execute("UPDATE outbox SET status = 'sending', claimed_by = ?, claimed_at = ? WHERE id = ?",
+                           (self.owner, time.time(), row[0]))
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        return row
+
+    def _owner_gone(self, owner: str) -> bool:
+        """True for a claim made by a process on this host that no longer runs."""
+        host, _, pid = owner.rpartition(":")
+        if host != self.host or not pid.isdigit() or owner == self.owner:
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass  # alive, just not ours to signal
+        return False
+
+    def _recover(self) -> int:
+        """Re-queues 'sending' rows whose lease went stale or whose local owner died."""
+        db = self._db()
+        owners = [row[0] for row in db.execute("SELECT DISTINCT claimed_by FROM outbox WHERE status = 'sending'")]
+        recovered = db.execute(
+            "UPDATE outbox SET status = 'pending', claimed_by = NULL, claimed_at = NULL "
+            "WHERE status = 'sending' AND (claimed_at IS NULL OR claimed_at < ?)",
+            (time.time() - self.lease,)).rowcount
+        for owner in owners:
+            if owner and self._owner_gone(owner):
+                recovered += db.execute(
+                    "UPDATE outbox SET status = 'pending', claimed_by = NULL, claimed_at = NULL "
+                    "WHERE status = 'sending' AND claimed_by = ?", (owner,)).rowcount
+        return recovered
+
+    def _maybe_recover(self):
+        now = time.time()
+        with self.lock:
+            if now < self.next_recovery:
+                return
+            self.next_recovery = now + self.lease / 2
+        recovered = self._recover()
+        if recovered:
+            print(f"[CallbackOutbox] Re-queued {recovered} callbacks with a stale claim")
+            with self.wakeup:
+                self.wakeup.notify_all()
+
+    def _lease_loop(self):
+        # requests' read timeout is per socket read, so a slowly trickling response can keep
+        # a post going well past the lease; keep its claim fresh until _deliver is done
+        while not self.stopped.wait(self.lease / 3):
+            with self.lock:
+                row_ids = list(self.in_flight)
+            if not row_ids:
+                continue
+            try:
+                self._db().execute(
+                    f"UPDATE outbox SET claimed_at = ? WHERE claimed_by = ? AND status = 'sending' "
+                    f"AND id IN ({','.join('?' * len(row_ids))})",
+                    [time.time(), self.owner] + row_ids)
+            except sqlite3.Error as e:
+                print(f"[CallbackOutbox] Lease refresh failed: {e}")
+
+    def _next_due(self) -> Optional[float]:
+        row = self._db().execute("SELECT MIN(next_attempt) FROM outbox WHERE status = 'pending'").fetchone()
+        return row[0] if row else None
+
+    def _dispatch_loop(self):
+        while not self.closed:
+            try:
+                self._maybe_recover()
+                row = self._claim()
+                if row is not None:
+                    with self.lock:
+                        self.in_flight.add(row[0])
+                    try:
+                        self._deliver(*row)
+                    finally:
+                        with self.lock:
+                            self.in_flight.discard(row[0])
+                    continue
+                due = self._next_due()
+                wait = 5.0 if due is None else min(5.0, max(0.0, due - time.time()))
+            except Exception as e:
+                # a claimed row left in 'sending' here is picked up again once its lease is stale
+                print(f"[CallbackOutbox] Dispatch failed: {e}")
+                wait = 1.0
+            with self.wakeup:
+                if not self.closed:
+                    self.wakeup.wait(wait)
+
+    def _session(self, url: str) -> requests.Session:
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+            return session
+
+    def _deliver(self, row_id: int, job_id: str, url: str, payload: str, attempts: int, created_at: float):
+        attempts += 1
+        retryable = True
+        try:
+            resp = self._session(url).post(url, data=payload, headers={"Content-Type": "application/json"},
+                                           timeout=self.timeout)
+            resp.close()
+            if resp.status_code < 400:
+                self._db().execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                latency = time.time() - created_at
+                with self.lock:
+                    self.delivered += 1
+                    self.latency_total += latency
+                    self.latency_max = max(self.latency_max, latency)
+                return
+            error = f"HTTP {resp.status_code}"
+            retryable = resp.status_code in RETRYABLE_STATUS
+        except requests.RequestException as e:
+            error = str(e)
+
+        with self.lock:
+            self.failed_attempts += 1
+        if not retryable or attempts >= self.max_attempts:
+            self._db().execute("UPDATE outbox SET status = 'dead', attempts = ?, last_error = ? WHERE id = ?",
+                               (attempts, error, row_id))
+            with self.lock:
+                self.dead += 1
+            print(f"[CallbackOutbox] Giving up on callback for job {job_id} after {attempts} attempts: {error}")
+            return
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+        self._db().execute(
+            "UPDATE outbox SET status = 'pending', attempts = ?, next_attempt = ?, last_error = ?, "
+            "claimed_by = NULL, claimed_at = NULL WHERE id = ?",
+            (attempts, time.time() + delay, error, row_id))
+        print(f"[CallbackOutbox] Callback for job {job_id} failed ({error}), retry {attempts} in {delay:.1f}s")
+
+    def retry_dead(self) -> int:
+        """Moves every dead letter back to the queue; returns how many."""
+        count = self._db().execute(
+            "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt = ? WHERE status = 'dead'",
+            (time.time(),)).rowcount
+        with self.wakeup:
+            self.wakeup.notify_all()
+        return count
+
+    # --- introspection / lifecycle ----------------------------------------------
+
+    def stats(self) -> dict:
+        counts = dict(self._db().execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        oldest = self._db().execute("SELECT MIN(created_at) FROM outbox WHERE status != 'dead'").fetchone()[0]
+        with self.lock:
+            return {
+                "pending": counts.get("pending", 0),
+                "sending": counts.get("sending", 0),
+                "dead_letters": counts.get("dead", 0),
+                "oldest_pending_age": round(time.time() - oldest, 1) if oldest else 0.0,
+                "delivered": self.delivered,
+                "failed_attempts": self.failed_attempts,
+                "dead_lettered": self.dead,
+                "avg_latency_ms": round(self.latency_total / self.delivered * 1000, 1) if self.delivered else 0.0,
+                "max_latency_ms": round(self.latency_max * 1000, 1),
+                "workers": self.workers,
+            }
+
+    def shutdown(self, wait: bool = True):
+        with self.wakeup:
+            self.closed = True
+            self.wakeup.notify_all()
+        self.stopped.set()
+        if wait:
+            for thread in self.threads:
+                thread.join(timeout=self.timeout[0] + self.timeout[1])
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
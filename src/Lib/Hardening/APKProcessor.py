@@ -3,19 +3,36 @@ import uuid
 import shutil
 import random
 import string
-import requests
 import subprocess
 import base64
 import time
 import yaml
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Thread
 from pathlib import Path
 import xml.etree.ElementTree as ET
-from typing import Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from ftplib import FTP
 from src.Lib.Hardening.Job import Job
 from src.Lib.Hardening.APKTool import APKTool
+from src.Lib.Hardening.DecodeCache import DecodeCache
+from src.Lib.Hardening.DecodePlanner import DecodePlan, DecodePlanner
+from src.Lib.Hardening.ApkZip import ApkZip, ApkZipError, is_signature_file, zipalign_with_fallback
+from src.Lib.Hardening.BinaryManifest import BinaryManifest, BinaryManifestError
+from src.Lib.Hardening.ResourceTable import ResourceTable, ResourceTableError
+from src.Lib.Hardening.ApkSigner import ApkSigner, ApkSignerError
+from src.Lib.Hardening.KeystorePool import KeystorePool
+from src.Lib.Hardening.Downloader import Downloader, DownloadError
+from src.Lib.Hardening.JobContext import JobContext
+from src.Lib.Hardening.JobRegistry import QUEUED, JobRegistry
+from src.Lib.Hardening.JobStore import BUILT, DECODED, DOWNLOADED, EDITED, SIGNED, JobStore
+from src.Lib.Hardening.RetryPolicy import RetryPolicy
+from src.Lib.Hardening.StagePipeline import StagePipeline
+from src.Lib.Hardening.FairScheduler import TEST, FairScheduler, parse_tenant_map
+from src.Lib.Hardening.Autoscaler import ConcurrencyLimit
+from src.Lib.Hardening.WorkspaceJanitor import WorkspaceJanitor
+from src.Lib.Hardening.WorkspaceTiers import WorkspaceTiers
+from src.Lib.Hardening.VariantGroup import VariantGroup
+from src.Lib.Callback.CallbackOutbox import CallbackOutbox
 
 
 def timer_step(name):
@@ -33,49 +50,109 @@ def timer_step(name):
 
 class APKProcessor:
 
-    def __init__(self, jobs_dir: str, download_dir: str, apktool: APKTool, base_url: str, max_workers: int = 3):
+    # stage -> worker count (None: max_workers); HARDENING_STAGE_<NAME>_WORKERS overrides
+    STAGE_WORKERS = {
+        "download": 4,
+        "decode": None,
+        "edit": 2,
+        "build": None,
+        "sign": 2,
+        "upload": 2,
+        "callback": 4,
+    }
+
+    # stage -> default "attempts:base_delay:max_delay"; HARDENING_RETRY_<STAGE> overrides.
+    # Downloads already retry dropped connections inside the Downloader; this re-runs the
+    # stage after it gave up on a transient error. "callback" covers queueing the result.
+    RETRY_DEFAULTS = {
+        "download": "2:15:120",
+        "build": "2:5:60",
+        "sign": "2:2:30",
+        "callback": "3:0.5:5",
+    }
+
+    # last completed checkpoint -> stage to resume with. The edit stage rewrites the decoded
+    # tree in place, so a job interrupted after "decoded" checks the tree out again.
+    RESUME_STAGE = {DOWNLOADED: "decode", DECODED: "decode", EDITED: "build", BUILT: "sign", SIGNED: "upload"}
+
+    def __init__(self, jobs_dir: str, download_dir: str, apktool: APKTool, base_url: str, max_workers: int = 3,
+                 decode_cache: Optional[DecodeCache] = None, apk_signer: Optional[ApkSigner] = None,
+                 keystore_pool: Optional[KeystorePool] = None, downloader: Optional[Downloader] = None,
+                 callback_outbox: Optional[CallbackOutbox] = None, janitor: Optional[WorkspaceJanitor] = None,
+                 workspaces: Optional[WorkspaceTiers] = None, concurrency: Optional[ConcurrencyLimit] = None,
+                 memory_guard: Optional[Callable[[], bool]] = None, registry: Optional[JobRegistry] = None,
+                 job_store: Optional[JobStore] = None):
         self.jobs_dir = Path(jobs_dir)
         self.download_dir = Path(download_dir)
         self.apktool = apktool
+        self.decode_cache = decode_cache
+        self.downloader = downloader or Downloader()
+        self.decode_planner = DecodePlanner()
+        self.apk_signer = apk_signer
         self.base_url = base_url.rstrip("/")
         self.max_workers = max_workers
 
         self.jobs_dir.mkdir(parents=True, exist_ok=True)
         self.download_dir.mkdir(parents=True, exist_ok=True)
-
-        self.executor = ThreadPoolExecutor(
-            max_workers=self.max_workers, thread_name_prefix="APKHardener")
+        self.keystore_pool = keystore_pool or KeystorePool(str(self.jobs_dir / "keystores"))
+        self.callback_outbox = callback_outbox or CallbackOutbox(str(self.jobs_dir / "callbacks.db"))
+        self.janitor = janitor or WorkspaceJanitor([str(self.jobs_dir)])
+        self.workspaces = workspaces or WorkspaceTiers(str(self.jobs_dir))
+        self.registry = registry or JobRegistry(str(self.jobs_dir / "job_history.jsonl"))
+        self.job_store = job_store or JobStore(str(self.jobs_dir / "jobs.db"))
+        self.max_resume_attempts = int(os.getenv("HARDENING_RESUME_MAX_ATTEMPTS", "3"))
+        self.retry_policies = {stage: RetryPolicy.from_env(stage, default)
+                               for stage, default in self.RETRY_DEFAULTS.items()}
+        # the callback stage is last and always runs, so it retries inline (see _stage_callback)
+        self.callback_retry = self.retry_policies.pop("callback")
+        # 4xx and other permanent download failures are not worth another round
+        self.retry_policies["download"].retry_on = (DownloadError,)
+
+        # One bounded pool per stage: network (download/upload/callback), JVM/CPU (decode/build), disk
+        self.pipeline = StagePipeline(
+            [(name, getattr(self, f"_stage_{name}"), self._stage_workers(name)) for name in self.STAGE_WORKERS],
+            on_error=self._stage_failed,
+            max_in_flight=int(os.getenv("HARDENING_MAX_IN_FLIGHT", str(self.max_workers * 3))),
+            scheduler=FairScheduler(
+                weights=parse_tenant_map(os.getenv("HARDENING_TENANT_WEIGHTS", "")),
+                caps=parse_tenant_map(os.getenv("HARDENING_TENANT_CAPS", ""), int),
+                default_cap=int(os.getenv("HARDENING_TENANT_MAX_IN_FLIGHT", "0")),
+                class_caps={TEST: int(os.getenv("HARDENING_TEST_MAX_CONCURRENT", "1"))},
+            ),
+            limit=concurrency,
+            test_reserved_slots=int(os.getenv("HARDENING_TEST_RESERVED_SLOTS", "1")),
+            memory_guard=memory_guard,
+            max_pending=int(os.getenv("HARDENING_MAX_PENDING", "10000")),
+            registry=self.registry,
+            retry_policies=self.retry_policies,
+        )
+        # APK-independent preparation (keystore, signer keys) that overlaps download/decode
+        self.prep_executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="APKPrep")
 
     def _keystore_for_package(self, job: Job) -> Path:
-        keystore_dir = self.jobs_dir / "keystores"
-        keystore_dir.mkdir(parents=True, exist_ok=True)
-        keystore_path = keystore_dir / f"{job.id}.keystore"
-        if not keystore_path.exists():
-            cmd = [
-                "keytool", "-genkeypair", "-v",
-                "-keystore", str(keystore_path),
-                "-storepass", "android",
-                "-keypass", "android",
-                "-alias", "androiddebugkey",
-                "-keyalg", "RSA",
-                "-keysize", "2048",
-                "-validity", "10000",
-                "-dname", "CN=Hardening,O=APK,L=Local,C=US"
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                raise Exception(f"Keystore generation failed: {result.stderr}")
-        return keystore_path
+        return self.keystore_pool.get(job.id)
+
+    def _prepare_signing(self, job: Job) -> dict:
+        """Keystore lookup and signing-key load; started at job start and joined at the sign step."""
+        timings = {}
+        start = time.perf_counter()
+        keystore = self._keystore_for_package(job)
+        timings["load_keystore"] = time.perf_counter() - start
+        if self.apk_signer is not None and self.apk_signer.available:
+            start = time.perf_counter()
+            try:
+                self.apk_signer.load_key(keystore)
+            except ApkSignerError as e:
+                print(f"[ApkSigner] {e} — job will be signed with apksigner")
+            timings["signer_warmup"] = time.perf_counter() - start
+        return {"keystore": keystore, "timings": timings}
 
     def _generate_random_package(self) -> str:
         return f"com.{''.join(random.choices(string.ascii_lowercase, k=3))}.{''.join(random.choices(string.ascii_lowercase + string.digits, k=10))}"
 
-    def _download_apk(self, url: str, save_path: Path):
-        cmd = ["curl", "-L", "--fail", "--connect-timeout",
-               "30", "--silent", url, "-o", str(save_path)]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"Download failed: {result.stderr}")
+    def _download_apk(self, url: str, save_path: Path) -> dict:
+        return self.downloader.download(url, save_path)
 
     def _rename_package(self, src_dir: Path, old_package: str, new_package: str):
         if old_package == new_package:
@@ -98,7 +175,7 @@ class APKProcessor:
         try:
             with open(yml_path, 'r', encoding='utf-8') as f:
                 lines = f.readlines()
-            with open(yml_path, 'w', encoding='utf-8') as f:
+            with open(DecodeCache.detach(yml_path), 'w', encoding='utf-8') as f:
                 updated = False
                 for line in lines:
                     stripped = line.strip()
@@ -167,6 +244,19 @@ class APKProcessor:
 
     def _cleanup_manifest_permissions(self, root):
         ANDROID_NS = "{http://schemas.android.com/apk/res/android}"
+        permissions_to_remove = self._risky_permissions()
+        removed_count = 0
+        for perm in list(root.findall("uses-permission")) + list(root.findall("uses-permission-sdk-23")):
+            name = perm.get(f"{ANDROID_NS}name")
+            if name and (name in permissions_to_remove or name.lower() in permissions_to_remove):
+                root.remove(perm)
+                removed_count += 1
+        if removed_count > 0:
+            print(f"[Hardening] Removed {removed_count} risky permissions")
+        return removed_count
+
+    @staticmethod
+    def _risky_permissions() -> set:
         critical_permissions = {
             "android.permission.READ_PRIVILEGED_PHONE_STATE",
             "android.permission.MOUNT_UNMOUNT_FILESYSTEMS",
@@ -196,16 +286,7 @@ class APKProcessor:
             "android.permission.READ_EXTERNAL_STORAGE",
             "android.permission.WRITE_EXTERNAL_STORAGE",
         }
-        permissions_to_remove = critical_permissions | dangerous_permissions
-        removed_count = 0
-        for perm in list(root.findall("uses-permission")) + list(root.findall("uses-permission-sdk-23")):
-            name = perm.get(f"{ANDROID_NS}name")
-            if name and (name in permissions_to_remove or name.lower() in permissions_to_remove):
-                root.remove(perm)
-                removed_count += 1
-        if removed_count > 0:
-            print(f"[Hardening] Removed {removed_count} risky permissions")
-        return removed_count
+        return critical_permissions | dangerous_permissions
 
     def _update_string_resource(self, src_dir: Path, res_name: str, new_value: str) -> bool:
         strings_path = src_dir / "res" / "values" / "strings.xml"
@@ -218,7 +299,7 @@ class APKProcessor:
                 elem.text = new_value
                 updated = True
             if updated:
-                tree.write(strings_path, encoding="utf-8",
+                tree.write(DecodeCache.detach(strings_path), encoding="utf-8",
                            xml_declaration=True)
                 return True
         except:
@@ -271,7 +352,7 @@ class APKProcessor:
                             elem.text = new_name
                             changed = True
                     if changed:
-                        tree.write(strings_path, encoding="utf-8",
+                        tree.write(DecodeCache.detach(strings_path), encoding="utf-8",
                                    xml_declaration=True)
                         updated = True
                 except:
@@ -303,14 +384,35 @@ class APKProcessor:
                 break
         if not icon_source:
             return None
+        icon_path, icon_url = self._icon_output(job)
+        shutil.copy(icon_source, icon_path)
+        return icon_url
+
+    def _icon_output(self, job: Job) -> Tuple[Path, str]:
         public_output_dir = Path(
             os.getenv("HARDENED_APK_OUTPUT_DIR", self.download_dir))
         apk_folder = public_output_dir / f"uploads/{job.domain}/app/apk"
         apk_folder.mkdir(parents=True, exist_ok=True)
         icon_path = apk_folder / f"{job.file_name}.png"
-        shutil.copy(icon_source, icon_path)
         base_url = os.getenv('PUBLIC_DOMAIN', self.base_url).rstrip('/')
-        return f"{base_url}/hardened/{job.file_name}.png"
+        return icon_path, f"{base_url}/hardened/{job.file_name}.png"
+
+    def _extract_icon_from_apk(self, job: Job, apk: ApkZip) -> Optional[str]:
+        # compiled APKs keep res/ paths but may add a -vNN qualifier to the folder
+        density_order = ["xxxhdpi", "xxhdpi", "xhdpi", "hdpi", "mdpi"]
+        possible_names = ["ic_launcher", "ic_launcher_round"]
+        names = set(apk.names())
+        for density in density_order:
+            for name in possible_names:
+                for prefix in ["mipmap-", "drawable-"]:
+                    for suffix in ["", "-v4", "-v26"]:
+                        for ext in [".png", ".webp"]:
+                            candidate = f"res/{prefix}{density}{suffix}/{name}{ext}"
+                            if candidate in names:
+                                icon_path, icon_url = self._icon_output(job)
+                                icon_path.write_bytes(apk.read(candidate))
+                                return icon_url
+        return None
 
     def _harden_manifest(self, job: Job, root, tree, manifest_path: Path, original_version_code: int, original_version_name: str):
         application = root.find('application')
@@ -323,6 +425,18 @@ class APKProcessor:
             ]:
                 application.attrib.pop(attr, None)
 
+        new_version_code, new_version_name = self._next_versions(
+            job, original_version_code, original_version_name)
+
+        ns = "{http://schemas.android.com/apk/res/android}"
+        root.set(ns + "versionCode", str(new_version_code))
+        root.set(ns + "versionName", new_version_name)
+
+        tree.write(DecodeCache.detach(manifest_path), encoding="utf-8", xml_declaration=True)
+
+        return new_version_code, new_version_name, original_version_code, original_version_name
+
+    def _next_versions(self, job: Job, original_version_code: int, original_version_name: str) -> Tuple[int, str]:
         new_version_code = original_version_code
         if hasattr(job, "current_version") and job.current_version:
             current_str = str(job.current_version).strip()
@@ -337,20 +451,13 @@ class APKProcessor:
             new_version_name = f"{prefix}.{random_suffix}"
         else:
             new_version_name = f"{base}.{random_suffix}"
-
-        ns = "{http://schemas.android.com/apk/res/android}"
-        root.set(ns + "versionCode", str(new_version_code))
-        root.set(ns + "versionName", new_version_name)
-
-        tree.write(manifest_path, encoding="utf-8", xml_declaration=True)
-
-        return new_version_code, new_version_name, original_version_code, original_version_name
+        return new_version_code, new_version_name
 
     def _inject_protection_stub(self, src_dir: Path, package: str):
         package_path = package.replace(".", "/")
         stub_path = src_dir / "smali" / package_path / "ProtectionLog.smali"
         stub_path.parent.mkdir(parents=True, exist_ok=True)
-        stub_path.write_text(f'''.class public L{package_path}/ProtectionLog;
+        DecodeCache.detach(stub_path).write_text(f'''.class public L{package_path}/ProtectionLog;
         .super Ljava/lang/Object;
         .method public static log()V
             .locals 2
@@ -608,8 +715,8 @@ class APKProcessor:
             .end method
             """.rstrip() + "\n"
 
-        (cls_dir / "LaunchReporter.smali").write_text(main_content, encoding="utf-8")
-        (cls_dir / "LaunchReporter$1.smali").write_text(inner_content, encoding="utf-8")
+        DecodeCache.detach(cls_dir / "LaunchReporter.smali").write_text(main_content, encoding="utf-8")
+        DecodeCache.detach(cls_dir / "LaunchReporter$1.smali").write_text(inner_content, encoding="utf-8")
 
     def _hook_launcher_activities(self, src_dir: Path, package: str):
         package_path = package.replace(".", "/")
@@ -672,7 +779,7 @@ class APKProcessor:
                         in_oncreate = False
 
                 if inserted:
-                    smali_path.write_text(
+                    DecodeCache.detach(smali_path).write_text(
                         "\n".join(new_lines) + "\n", encoding="utf-8")
             except Exception:
                 pass
@@ -680,6 +787,10 @@ class APKProcessor:
     def _add_random_text_file(self, src_dir: Path):
         assets_dir = src_dir / "assets"
         assets_dir.mkdir(parents=True, exist_ok=True)
+        filename, content = self._random_text_asset()
+        DecodeCache.detach(assets_dir / filename).write_text(content, encoding="utf-8")
+
+    def _random_text_asset(self) -> Tuple[str, str]:
         realistic_names = [
             "remote_config.txt", "app_params.txt", "fallback_strings.txt",
             "build_metadata.txt", "version_info.txt", "updated_api_call.txt",
@@ -692,15 +803,18 @@ class APKProcessor:
         ]
         content = random.choice(content_options) + "\n" + ''.join(
             random.choices(string.ascii_letters + string.digits, k=random.randint(30, 120)))
-        (assets_dir / filename).write_text(content, encoding="utf-8")
+        return filename, content
 
     def _add_random_dummy_image(self, src_dir: Path):
-        res_dir = src_dir / "res"
+        chosen_density, image_name, dummy_png = self._random_dummy_image()
+        folder = src_dir / "res" / chosen_density
+        folder.mkdir(parents=True, exist_ok=True)
+        DecodeCache.detach(folder / image_name).write_bytes(dummy_png)
+
+    def _random_dummy_image(self) -> Tuple[str, str, bytes]:
         densities = ["drawable-mdpi", "drawable-hdpi",
                      "drawable-xhdpi", "drawable-xxhdpi", "drawable-xxxhdpi"]
         chosen_density = random.choice(densities)
-        folder = res_dir / chosen_density
-        folder.mkdir(parents=True, exist_ok=True)
         realistic_names = [
             "ic_bg_splash.png", "bg_gradient.png", "placeholder.png",
             "default_thumb.png", "loading_bg.png", "empty_state.png",
@@ -710,16 +824,20 @@ class APKProcessor:
         image_name = random.choice(realistic_names)
         dummy_base64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVQYV2NgYAAAAAMAAWgmWQ0AAAAASUVORK5CYII="
         dummy_png = base64.b64decode(dummy_base64)
-        (folder / image_name).write_bytes(dummy_png)
+        return chosen_density, image_name, dummy_png
 
-    def _zipalign_apk(self, unsigned_apk: Path, aligned_apk: Path):
-        zipalign_path = os.getenv("APK_Z", "zipalign")
-        result = subprocess.run([zipalign_path, "-f", "4", str(unsigned_apk), str(aligned_apk)],
-                                capture_output=True, text=True)
-        if result.returncode != 0 or not aligned_apk.exists():
-            raise Exception(f"zipalign failed: {result.stderr}")
+    def _zipalign_apk(self, unsigned_apk: Path, aligned_apk: Path) -> bool:
+        return zipalign_with_fallback(unsigned_apk, aligned_apk, consume_input=True)
 
-    def _sign_apk(self, aligned_apk: Path, signed_apk: Path, keystore: Path):
+    def _sign_apk(self, aligned_apk: Path, signed_apk: Path, keystore: Path, timings: Optional[dict] = None):
+        if self.apk_signer is not None and self.apk_signer.available:
+            try:
+                sign_timings = self.apk_signer.sign(aligned_apk, signed_apk, keystore)
+                if timings is not None:
+                    timings.update(sign_timings)
+                return
+            except (ApkSignerError, ApkZipError) as e:
+                print(f"[ApkSigner] {e} — falling back to apksigner")
         base_cmd = ["java", "-jar", os.getenv("APK_S", "apksigner")] if os.getenv(
             'SERVER_TYPE') == "LOCAL" else [os.getenv("APK_S", "apksigner")]
         cmd = base_cmd + [
@@ -743,229 +861,672 @@ class APKProcessor:
         except Exception as e:
             print(f"[FTP ERROR] {local_path.name} → {e}")
 
-    def harden_and_notify(self, job: Job):
-        temp_file = self.jobs_dir / f"temp_{job.job_id}.apk"
-        job_folder = self.jobs_dir / job.job_id
-        src_dir = job_folder / "src"
-        rebuilt_apk = job_folder / "rebuilt.apk"
-        unsigned_apk = job_folder / "unsigned.apk"
-        aligned_apk = job_folder / "aligned.apk"
-
-        public_output_dir = Path(
-            os.getenv("HARDENED_APK_OUTPUT_DIR", self.download_dir))
-        final_apk_dir = public_output_dir / f"uploads/{job.domain}/app/apk"
-        final_apk_dir.mkdir(parents=True, exist_ok=True)
-        final_apk_path = final_apk_dir / f"{job.file_name}.apk"
-
-        result = {
-            "job_id": job.job_id,
-            "original_url": job.apk_url,
-            "status": "failed",
-            "error": "Unknown error",
-            "id": job.id,
-            "icon_url": None,
-            "old_display_name": "Unknown",
-            "new_display_name": "Unknown",
-            "old_version_code": None,
-            "new_version_code": None,
-            "old_version_name": None,
-            "new_version_name": None,
-            "timings": {}
-        }
-
-        job_start = time.perf_counter()
-
-        try:
-            # --- Download APK ---
+    def _decompile(self, apk_path: Path, out_dir: Path, plan: DecodePlan, result: dict):
+        decompile_log = self.apktool.decompile(
+            str(apk_path), str(out_dir), job_id=result["job_id"], timings=result["timings"], extra_flags=plan.flags)
+        if "ERROR" in decompile_log or "Exception" in decompile_log:
+            raise Exception(decompile_log)
+
+    def _target_package(self, job: Job, current_package: str) -> str:
+        target_package = current_package
+        if job.package_name_method == "random":
+            target_package = self._generate_random_package()
+        elif job.package_name_method == "no_random" and job.package_name and job.package_name != current_package:
+            target_package = job.package_name
+        return target_package
+
+    def _harden_binary(self, job: Job, temp_file: Path, rebuilt_apk: Path, result: dict) -> dict:
+        """Applies the manifest-only edits straight to the compiled manifest inside the APK zip."""
+        with ApkZip(temp_file) as apk:
             start = time.perf_counter()
-            self._download_apk(job.apk_url, temp_file)
-            result["timings"]["download_apk"] = time.perf_counter() - start
-
-            # --- Decompile ---
-            start = time.perf_counter()
-            decompile_log = self.apktool.decompile(
-                str(temp_file), str(src_dir))
-            result["timings"]["decompile"] = time.perf_counter() - start
-            if "ERROR" in decompile_log or "Exception" in decompile_log:
-                raise Exception(decompile_log)
-
-            # --- Read apktool.yml ---
-            start = time.perf_counter()
-            yml_path = src_dir / "apktool.yml"
-            with open(yml_path, 'r', encoding='utf-8') as f:
-                apktool_data = yaml.safe_load(f)
-            result["timings"]["read_apktool_yml"] = time.perf_counter() - start
-
-            version_info = apktool_data.get('versionInfo', {})
-            orig_vcode = int(version_info.get('versionCode', 1))
-            orig_vname = str(version_info.get('versionName', '1.0')).strip()
-            current_package = apktool_data.get(
-                'renameManifestPackage') or apktool_data.get('package', 'unknown.package')
-
-            # --- Load manifest ---
-            start = time.perf_counter()
-            manifest_path = src_dir / "AndroidManifest.xml"
-            tree = ET.parse(manifest_path)
-            root = tree.getroot()
-            ET.register_namespace(
-                'android', 'http://schemas.android.com/apk/res/android')
+            manifest = BinaryManifest(apk.read("AndroidManifest.xml"))
+            root = manifest.root
+            application = root.find("application")
             result["timings"]["load_manifest"] = time.perf_counter() - start
 
+            orig_vcode = manifest.get_attr(root, "versionCode")
+            orig_vname = manifest.get_attr(root, "versionName")
+            current_package = manifest.package
+            if not isinstance(orig_vcode, int) or not isinstance(orig_vname, str) or orig_vname.startswith("@"):
+                raise BinaryManifestError("versionCode/versionName are not literal values")
+            if not current_package:
+                raise BinaryManifestError("manifest has no package attribute")
+            orig_vname = orig_vname.strip()
+
+            table = None
+            if "resources.arsc" in apk.by_name:
+                start = time.perf_counter()
+                table = ResourceTable(apk.read("resources.arsc"))
+                result["timings"]["load_resource_table"] = time.perf_counter() - start
+
             # --- Cleanup permissions ---
             start = time.perf_counter()
-            self._cleanup_manifest_permissions(root)
-            result["timings"]["cleanup_permissions"] = time.perf_counter() - \
-                start
+            permissions_to_remove = self._risky_permissions()
+            removed_count = 0
+            for perm in root.findall("uses-permission") + root.findall("uses-permission-sdk-23"):
+                name = manifest.get_attr(perm, "name")
+                if isinstance(name, str) and (name in permissions_to_remove or name.lower() in permissions_to_remove):
+                    manifest.remove_element(perm)
+                    removed_count += 1
+            if removed_count > 0:
+                print(f"[Hardening] Removed {removed_count} risky permissions")
+            result["timings"]["cleanup_permissions"] = time.perf_counter() - start
 
             # --- Inject app key ---
-            if job.app_key and str(job.app_key).strip():
-                start = time.perf_counter()
-                ANDROID_NS = "{http://schemas.android.com/apk/res/android}"
-                for meta in root.findall(".//application/meta-data"):
-                    if meta.get(f"{ANDROID_NS}name") == "com.openinstall.APP_KEY":
-                        meta.set(f"{ANDROID_NS}value",
-                                 str(job.app_key).strip())
+            if job.app_key and str(job.app_key).strip() and application is not None:
+                for meta in application.findall("meta-data"):
+                    if manifest.get_attr(meta, "name") == "com.openinstall.APP_KEY":
+                        manifest.set_string_attr(meta, "value", str(job.app_key).strip())
                         break
-                result["timings"]["inject_app_key"] = time.perf_counter() - \
-                    start
 
             # --- Rename package ---
-            start = time.perf_counter()
-            target_package = current_package
-            if job.package_name_method == "random":
-                target_package = self._generate_random_package()
-            elif job.package_name_method == "no_random" and job.package_name and job.package_name != current_package:
-                target_package = job.package_name
-
+            target_package = self._target_package(job, current_package)
             if target_package != current_package:
-                root.set("package", target_package)
-                tree.write(manifest_path, encoding="utf-8",
-                           xml_declaration=True)
-                self._rename_package(src_dir, current_package, target_package)
-            result["timings"]["rename_package"] = time.perf_counter() - start
+                manifest.rename_package(target_package)
 
             # --- Update display name ---
             start = time.perf_counter()
-            old_display_name, new_display_name = self._update_app_display_name(
-                job, root, src_dir)
-            result["timings"]["update_display_name"] = time.perf_counter() - \
-                start
+            old_display_name, new_display_name = self._update_binary_display_name(job, manifest, table)
+            result["timings"]["update_display_name"] = time.perf_counter() - start
 
             # --- Harden manifest ---
-            start = time.perf_counter()
-            new_vcode, new_vname, old_vcode, old_vname = self._harden_manifest(
-                job, root, tree, manifest_path, orig_vcode, orig_vname)
-            result["timings"]["harden_manifest"] = time.perf_counter() - start
+            if application is not None:
+                for attr in ["debuggable", "allowBackup", "fullBackupContent", "networkSecurityConfig"]:
+                    manifest.remove_attr(application, attr)
+            new_vcode, new_vname = self._next_versions(job, orig_vcode, orig_vname)
+            manifest.set_int_attr(root, "versionCode", new_vcode)
+            manifest.set_string_attr(root, "versionName", new_vname)
+
+            # --- Dummy files + icon ---
+            asset_name, asset_content = self._random_text_asset()
+            density, image_name, image_bytes = self._random_dummy_image()
+            icon_url = self._extract_icon_from_apk(job, apk)
+
+            replace = {"AndroidManifest.xml": manifest.to_bytes()}
+            if table is not None and table.pool.modified:
+                replace["resources.arsc"] = table.to_bytes()
 
-            # --- Inject protection stub ---
             start = time.perf_counter()
-            self._inject_protection_stub(src_dir, target_package)
-            result["timings"]["inject_protection_stub"] = time.perf_counter() - \
-                start
+            apk.rewrite(
+                rebuilt_apk,
+                replace=replace,
+                add={
+                    f"assets/{asset_name}": asset_content.encode("utf-8"),
+                    f"res/{density}/{image_name}": image_bytes,
+                },
+                remove=is_signature_file,
+                align=True,
+            )
+            result["timings"]["rewrite_apk"] = time.perf_counter() - start
+
+        return {
+            "current_package": current_package,
+            "target_package": target_package,
+            "old_display_name": old_display_name,
+            "new_display_name": new_display_name,
+            "new_vcode": new_vcode,
+            "new_vname": new_vname,
+            "old_vcode": orig_vcode,
+            "orig_vname": orig_vname,
+            "icon_url": icon_url,
+        }
 
-            # --- Optional launch hooks ---
-            if job.op_call_back and job.op_call_back.strip() and job.apk_key and job.apk_key.strip():
-                start = time.perf_counter()
-                self._inject_launch_reporter(src_dir, target_package, job)
-                self._hook_launcher_activities(src_dir, target_package)
-                result["timings"]["launcher_hooks"] = time.perf_counter() - \
-                    start
+    def _binary_label(self, manifest: BinaryManifest, table: Optional[ResourceTable], element) -> Optional[str]:
+        label = manifest.get_attr(element, "label")
+        if not isinstance(label, str) or not label.startswith("@"):
+            return label
+        resource_id = manifest.get_reference(element, "label")
+        value = table.resolve(resource_id) if table is not None else None
+        if value:
+            return value
+        key = table.key_for(resource_id) if table is not None else None
+        return f"@string/{key}" if key else label
+
+    def _update_binary_display_name(self, job: Job, manifest: BinaryManifest,
+                                    table: Optional[ResourceTable]) -> Tuple[str, str]:
+        """Same rules as _update_app_display_name, against the compiled manifest and resources.arsc."""
+        launchers = manifest.launcher_components()
+        application = manifest.root.find("application")
+        old_name = "Unknown App"
+        for owner in ([launchers[0]] if launchers else []) + [application]:
+            if owner is not None:
+                label = self._binary_label(manifest, table, owner)
+                if label:
+                    old_name = label
+                    break
+        if not job.app_name:
+            return old_name, old_name
 
-            # --- Add dummy files ---
+        new_name = job.app_name.strip()
+        updated = False
+        for owner in launchers + [application]:
+            if owner is None or manifest.get_attr(owner, "label") is None:
+                continue
+            resource_id = manifest.get_reference(owner, "label")
+            if resource_id is None:
+                manifest.set_string_attr(owner, "label", new_name)
+                updated = True
+                continue
+            if table is None:
+                raise ResourceTableError("label references a resource but the APK has no resources.arsc")
+            for entry in table.entries_for(resource_id):
+                if entry.default_config:
+                    table.set_value(entry, new_name)
+                    updated = True
+        if launchers and not updated:
+            if not manifest.set_string_attr(launchers[0], "label", new_name):
+                raise BinaryManifestError("launcher has no label attribute to set")
+        if table is not None:
+            for entry in table.string_entries():
+                name = entry.key.lower()
+                if "app_name" in name or "label" in name:
+                    table.set_value(entry, new_name)
+        return old_name, new_name
+
+    def _checkout_decoded(self, plan: DecodePlan, temp_file: Path, src_dir: Path, result: dict,
+                          apk_sha256: Optional[str] = None, decode_cache: Optional[DecodeCache] = None,
+                          in_place: bool = False):
+        # --- Decompile ---
+        start = time.perf_counter()
+        decode_cache = decode_cache or self.decode_cache
+        if decode_cache is not None:
+            if apk_sha256 is None:
+                apk_sha256 = DecodeCache.sha256_file(temp_file)
+                result["timings"]["hash_apk"] = time.perf_counter() - start
             start = time.perf_counter()
-            self._add_random_text_file(src_dir)
-            self._add_random_dummy_image(src_dir)
-            result["timings"]["dummy_files"] = time.perf_counter() - start
+            cache_hit = decode_cache.checkout(
+                f"{apk_sha256}-{plan.mode}", src_dir,
+                lambda staging: self._decompile(temp_file, staging, plan, result), in_place=in_place)
+            cache_stats = decode_cache.stats()
+            result["timings"]["decode_cache_hit"] = 1 if cache_hit else 0
+            result["timings"]["decode_cache_hits"] = cache_stats["hits"]
+            result["timings"]["decode_cache_misses"] = cache_stats["misses"]
+        else:
+            self._decompile(temp_file, src_dir, plan, result)
+        result["timings"]["decompile"] = time.perf_counter() - start
 
-            # --- Extract icon ---
+    def _edit_decoded(self, job: Job, plan: DecodePlan, src_dir: Path, result: dict) -> dict:
+        # --- Read apktool.yml ---
+        start = time.perf_counter()
+        yml_path = src_dir / "apktool.yml"
+        with open(yml_path, 'r', encoding='utf-8') as f:
+            apktool_data = yaml.safe_load(f)
+        result["timings"]["read_apktool_yml"] = time.perf_counter() - start
+
+        version_info = apktool_data.get('versionInfo', {})
+        orig_vcode = int(version_info.get('versionCode', 1))
+        orig_vname = str(version_info.get('versionName', '1.0')).strip()
+        current_package = apktool_data.get(
+            'renameManifestPackage') or apktool_data.get('package', 'unknown.package')
+
+        # --- Load manifest ---
+        start = time.perf_counter()
+        manifest_path = src_dir / "AndroidManifest.xml"
+        tree = ET.parse(manifest_path)
+        root = tree.getroot()
+        ET.register_namespace(
+            'android', 'http://schemas.android.com/apk/res/android')
+        result["timings"]["load_manifest"] = time.perf_counter() - start
+
+        # --- Cleanup permissions ---
+        start = time.perf_counter()
+        self._cleanup_manifest_permissions(root)
+        result["timings"]["cleanup_permissions"] = time.perf_counter() - \
+            start
+
+        # --- Inject app key ---
+        if plan.enabled("inject_app_key"):
             start = time.perf_counter()
-            icon_url = self._extract_and_copy_icon(job, src_dir)
-            result["timings"]["extract_icon"] = time.perf_counter() - start
+            ANDROID_NS = "{http://schemas.android.com/apk/res/android}"
+            for meta in root.findall(".//application/meta-data"):
+                if meta.get(f"{ANDROID_NS}name") == "com.openinstall.APP_KEY":
+                    meta.set(f"{ANDROID_NS}value",
+                             str(job.app_key).strip())
+                    break
+            result["timings"]["inject_app_key"] = time.perf_counter() - \
+                start
 
-            # --- Recompile ---
+        # --- Rename package ---
+        start = time.perf_counter()
+        target_package = self._target_package(job, current_package)
+
+        if target_package != current_package:
+            root.set("package", target_package)
+            tree.write(DecodeCache.detach(manifest_path), encoding="utf-8",
+                       xml_declaration=True)
+            self._rename_package(src_dir, current_package, target_package)
+        result["timings"]["rename_package"] = time.perf_counter() - start
+
+        # --- Update display name ---
+        start = time.perf_counter()
+        old_display_name, new_display_name = self._update_app_display_name(
+            job, root, src_dir)
+        result["timings"]["update_display_name"] = time.perf_counter() - \
+            start
+
+        # --- Harden manifest ---
+        start = time.perf_counter()
+        new_vcode, new_vname, old_vcode, old_vname = self._harden_manifest(
+            job, root, tree, manifest_path, orig_vcode, orig_vname)
+        result["timings"]["harden_manifest"] = time.perf_counter() - start
+
+        # --- Inject protection stub (only when smali was decoded; -s keeps classes.dex raw) ---
+        if plan.enabled("protection_stub"):
             start = time.perf_counter()
-            recompile_log = self.apktool.recompile(str(src_dir), str(rebuilt_apk))
-            result["timings"]["recompile"] = time.perf_counter() - start
-            if not rebuilt_apk.exists():
-                raise Exception(recompile_log or "Recompile failed")
+            self._inject_protection_stub(src_dir, target_package)
+            result["timings"]["inject_protection_stub"] = time.perf_counter() - \
+                start
 
-            # --- Keystore ---
+        # --- Optional launch hooks ---
+        if plan.enabled("launcher_hooks"):
             start = time.perf_counter()
-            keystore = self._keystore_for_package(job)
-            result["timings"]["load_keystore"] = time.perf_counter() - start
+            self._inject_launch_reporter(src_dir, target_package, job)
+            self._hook_launcher_activities(src_dir, target_package)
+            result["timings"]["launcher_hooks"] = time.perf_counter() - \
+                start
 
-            # --- Zipalign ---
+        # --- Add dummy files ---
+        start = time.perf_counter()
+        self._add_random_text_file(src_dir)
+        self._add_random_dummy_image(src_dir)
+        result["timings"]["dummy_files"] = time.perf_counter() - start
+
+        # --- Extract icon ---
+        start = time.perf_counter()
+        icon_url = self._extract_and_copy_icon(job, src_dir)
+        result["timings"]["extract_icon"] = time.perf_counter() - start
+
+        return {
+            "current_package": current_package,
+            "target_package": target_package,
+            "old_display_name": old_display_name,
+            "new_display_name": new_display_name,
+            "new_vcode": new_vcode,
+            "new_vname": new_vname,
+            "old_vcode": old_vcode,
+            "orig_vname": orig_vname,
+            "icon_url": icon_url,
+        }
+
+    def _build_decoded(self, src_dir: Path, rebuilt_apk: Path, result: dict):
+        # --- Recompile ---
+        start = time.perf_counter()
+        recompile_log = self.apktool.recompile(
+            str(src_dir), str(rebuilt_apk), job_id=result["job_id"], timings=result["timings"])
+        result["timings"]["recompile"] = time.perf_counter() - start
+        if not rebuilt_apk.exists():
+            raise Exception(recompile_log or "Recompile failed")
+
+    # --- Pipeline stages ---
+
+    def _new_context(self, job: Job) -> JobContext:
+        public_output_dir = Path(
+            os.getenv("HARDENED_APK_OUTPUT_DIR", self.download_dir))
+        final_apk_dir = public_output_dir / f"uploads/{job.domain}/app/apk"
+        final_apk_dir.mkdir(parents=True, exist_ok=True)
+        return JobContext(job, self.jobs_dir, final_apk_dir / f"{job.file_name}.apk")
+
+    def _stage_download(self, ctx: JobContext):
+        job, result = ctx.job, ctx.result
+        if ctx.signing_prep is None:  # not on a retry of this stage
+            ctx.job_start = time.perf_counter()
+            self.janitor.track(job.job_id)
+            ctx.signing_prep = self.prep_executor.submit(self._prepare_signing, job)
+
+        # --- Download APK (once per variant group) ---
+        start = time.perf_counter()
+        if ctx.variant_group is not None:
+            download = ctx.variant_group.fetch_source(
+                lambda path: self._download_apk(job.apk_url, path), ctx.temp_file)
+            result["timings"]["variant_source_shared"] = 1 if download["variant_shared"] else 0
+        else:
+            download = self._download_apk(job.apk_url, ctx.temp_file)
+        ctx.apk_sha256 = download["sha256"]
+        ctx.apk_size = download["size"]
+        result["timings"]["download_apk"] = time.perf_counter() - start
+        result["timings"]["download_segments"] = download["segments"]
+        result["timings"]["download_resumed_bytes"] = download["resumed_bytes"]
+        result["timings"]["download_coalesced"] = 1 if download.get("coalesced") else 0
+        result["timings"]["download_cache_hit"] = 1 if download.get("cache_hit") else 0
+        result["timings"]["download_not_modified"] = 1 if download.get("source_cache_hit") else 0
+
+        # --- Plan decode mode ---
+        ctx.plan = self.decode_planner.plan(job)
+        result["decode_mode"] = ctx.plan.mode
+        print(f"[JOB {job.job_id}] {ctx.plan}")
+
+        # --- Place workspace (RAM tier when the budget allows) ---
+        binary = ctx.plan.mode == DecodePlan.BINARY
+        # a cached decode is cloned with hardlinks on disk, which beats copying it into RAM
+        decode_cache = self._decode_cache_for(ctx)
+        cached = (not binary and decode_cache is not None
+                  and decode_cache.contains(f"{ctx.apk_sha256}-{ctx.plan.mode}"))
+        self.workspaces.release(job.job_id)  # a retried download places the workspace again
+        job_folder, ctx.workspace_tier = self.workspaces.place(
+            job.job_id, download["size"], size_factor=3.0 if binary else None, prefer_disk=cached)
+        ctx.relocate(job_folder)
+        ctx.job_folder.mkdir(parents=True, exist_ok=True)
+        result["workspace_tier"] = ctx.workspace_tier
+        result["timings"]["workspace_ram"] = 1 if ctx.workspace_tier == "ram" else 0
+        self._checkpoint(ctx, DOWNLOADED)
+
+    def _stage_decode(self, ctx: JobContext):
+        if ctx.plan.mode == DecodePlan.BINARY:
+            return None  # the edit stage patches the APK zip directly
+        # a RAM workspace decodes in place on a cache miss instead of being cloned across filesystems
+        self._checkout_decoded(ctx.plan, ctx.temp_file, ctx.src_dir, ctx.result, ctx.apk_sha256,
+                               self._decode_cache_for(ctx), in_place=ctx.workspace_tier == "ram")
+        self._checkpoint(ctx, DECODED)
+
+    def _stage_edit(self, ctx: JobContext):
+        job, result = ctx.job, ctx.result
+        if ctx.plan.mode == DecodePlan.BINARY:
+            try:
+                start = time.perf_counter()
+                ctx.edits = self._harden_binary(job, ctx.temp_file, ctx.rebuilt_apk, result)
+                result["timings"]["binary_patch"] = time.perf_counter() - start
+            except (BinaryManifestError, ResourceTableError) as e:
+                print(f"[JOB {job.job_id}] Binary patch not possible ({e}) — falling back to apktool")
+                ctx.plan = ctx.plan.fallback()
+                result["decode_mode"] = ctx.plan.mode
+                return "decode"
+        else:
+            ctx.edits = self._edit_decoded(job, ctx.plan, ctx.src_dir, result)
+        self._checkpoint(ctx, EDITED)
+
+    def _stage_build(self, ctx: JobContext):
+        if ctx.plan.mode != DecodePlan.BINARY:  # else _harden_binary already wrote rebuilt.apk
+            self._build_decoded(ctx.src_dir, ctx.rebuilt_apk, ctx.result)
+        self._checkpoint(ctx, BUILT)
+
+    def _stage_sign(self, ctx: JobContext):
+        result = ctx.result
+
+        # --- Keystore (prepared since job start) ---
+        if ctx.retries.get("sign") and ctx.signing_prep.exception() is not None:
+            ctx.signing_prep = self.prep_executor.submit(self._prepare_signing, ctx.job)
+        start = time.perf_counter()
+        prepared = ctx.signing_prep.result()
+        prep_wait = time.perf_counter() - start
+        result["timings"].update(prepared["timings"])
+        result["timings"]["signing_prep_wait"] = prep_wait
+        result["timings"]["signing_prep_saved"] = max(0.0, sum(prepared["timings"].values()) - prep_wait)
+        keystore = prepared["keystore"]
+
+        # --- Zipalign ---
+        if self._aligned_by_earlier_try(ctx):
+            result["timings"]["zipalign_skipped"] = 1
+        else:
             start = time.perf_counter()
-            self._zipalign_apk(rebuilt_apk, aligned_apk)
+            realigned = self._zipalign_apk(ctx.rebuilt_apk, ctx.aligned_apk)
+            result["timings"]["zipalign_skipped"] = 0 if realigned else 1
             result["timings"]["zipalign"] = time.perf_counter() - start
 
-            # --- Sign APK ---
-            start = time.perf_counter()
-            self._sign_apk(aligned_apk, final_apk_path, keystore)
-            result["timings"]["sign_apk"] = time.perf_counter() - start
+        # --- Sign APK ---
+        start = time.perf_counter()
+        self._sign_apk(ctx.aligned_apk, ctx.final_apk_path, keystore, result["timings"])
+        result["timings"]["sign_apk"] = time.perf_counter() - start
+        self._checkpoint(ctx, SIGNED)
 
-            # --- FTP upload ---
-            if hasattr(job, 'host_name') and job.host_name:
-                start = time.perf_counter()
-                self._upload_to_ftp(final_apk_path, job.host_name,  getattr(job, 'user_name', 'anonymous'),getattr(job, 'password', ''),getattr(job, 'ftp_remote_dir', '/'))
-                result["timings"]["ftp_upload"] = time.perf_counter() - start
+    @staticmethod
+    def _aligned_by_earlier_try(ctx: JobContext) -> bool:
+        # zipalign only consumes rebuilt.apk by atomically moving an already aligned archive
+        # into place, so a missing rebuilt.apk next to aligned.apk means that one is complete
+        return not ctx.rebuilt_apk.exists() and ctx.aligned_apk.exists()
 
-            # --- Update timestamp ---
+    def _stage_upload(self, ctx: JobContext):
+        job, result, edits = ctx.job, ctx.result, ctx.edits
+        final_apk_path = ctx.final_apk_path
+
+        # --- FTP upload ---
+        if hasattr(job, 'host_name') and job.host_name:
             start = time.perf_counter()
-            now = time.time() + random.randint(-1800, 1800)
-            os.utime(final_apk_path, (now, now))
-            result["timings"]["update_timestamp"] = time.perf_counter() - start
-
-            # --- Final result ---
-            public_download_url = f"{os.getenv('PUBLIC_DOMAIN', self.base_url).rstrip('/')}/hardened/{job.job_id}.apk"
-            keystore_url = f"{self.base_url}/hardened/{job.id}.keystore"
-            result.update({
-                "status": "success",
-                "download_url": public_download_url,
-                "public_path": str(final_apk_path),
-                "file_name": f"{job.file_name}.apk",
-                "icon_url": icon_url,
-                "old_display_name": old_display_name,
-                "new_display_name": new_display_name,
-                "message": "APK hardened successfully",
-                "original_package": current_package,
-                "new_package": target_package,
-                "new_version_code": new_vcode,
-                "old_version_code": old_vcode,
-                "new_version_name": new_vname,
-                "old_version_name": orig_vname,
-                "icon_name": f"{job.file_name}",
-                "keystore_url": keystore_url,
-                "total_job_time": time.perf_counter() - job_start
-            })
+            self._upload_to_ftp(final_apk_path, job.host_name,  getattr(job, 'user_name', 'anonymous'),getattr(job, 'password', ''),getattr(job, 'ftp_remote_dir', '/'))
+            result["timings"]["ftp_upload"] = time.perf_counter() - start
+
+        # --- Update timestamp ---
+        start = time.perf_counter()
+        now = time.time() + random.randint(-1800, 1800)
+        os.utime(final_apk_path, (now, now))
+        result["timings"]["update_timestamp"] = time.perf_counter() - start
+
+        # --- Final result ---
+        public_download_url = f"{os.getenv('PUBLIC_DOMAIN', self.base_url).rstrip('/')}/hardened/{job.job_id}.apk"
+        keystore_url = f"{self.base_url}/hardened/{job.id}.keystore"
+        result.update({
+            "status": "success",
+            "download_url": public_download_url,
+            "public_path": str(final_apk_path),
+            "file_name": f"{job.file_name}.apk",
+            "icon_url": edits["icon_url"],
+            "old_display_name": edits["old_display_name"],
+            "new_display_name": edits["new_display_name"],
+            "message": "APK hardened successfully",
+            "original_package": edits["current_package"],
+            "new_package": edits["target_package"],
+            "new_version_code": edits["new_vcode"],
+            "old_version_code": edits["old_vcode"],
+            "new_version_name": edits["new_vname"],
+            "old_version_name": edits["orig_vname"],
+            "icon_name": f"{job.file_name}",
+            "keystore_url": keystore_url,
+            "total_job_time": time.perf_counter() - ctx.job_start
+        })
+
+    def _stage_callback(self, ctx: JobContext):
+        result = ctx.result
+        print(
+            f"[TIMER] TOTAL JOB TIME: {result.get('total_job_time', 0):.3f}s")
+        def retrying(attempt: int, error: Exception):
+            result["timings"]["retry_callback"] = attempt
+            print(f"[JOB {ctx.job.job_id}] Queueing callback failed ({error}) — retry {attempt}")
+
+        try:
+            self.callback_retry.run(
+                lambda: self.callback_outbox.enqueue(ctx.job.job_id, ctx.job.callback_url, result), retrying)
+        except Exception as e:
+            print(f"[JOB {ctx.job.job_id}] Could not queue callback: {e}")
+        else:
+            self._forget(ctx.job.job_id)
+        job_id = ctx.job.job_id
+        partial = [ctx.temp_file.with_name(ctx.temp_file.name + suffix) for suffix in (".part", ".part.json")]
+        self.janitor.discard(job_id, [ctx.temp_file, self.apktool.tmp_dir_for(job_id)] + partial)
+        if ctx.workspace_tier == "ram":
+            # tmpfs memory only comes back once the tree is unlinked; keep the reservation until then
+            self.janitor.discard(job_id, [ctx.job_folder], on_purged=lambda: self.workspaces.release(job_id))
+        else:
+            self.janitor.discard(job_id, [ctx.job_folder])
+            self.workspaces.release(job_id)
+        group = ctx.variant_group
+        if group is not None and group.finish():
+            self.janitor.discard(group.group_id, [group.folder])
+
+    # --- Durable queue ---
+
+    @staticmethod
+    def _job_spec(job: Job) -> dict:
+        return {name: getattr(job, name) for name in Job.__slots__}
+
+    def _checkpoint(self, ctx: JobContext, checkpoint: str):
+        plan = ctx.plan
+        state = {
+            "job_folder": str(ctx.job_folder),
+            "workspace_tier": ctx.workspace_tier,
+            "apk_sha256": ctx.apk_sha256,
+            "apk_size": ctx.apk_size,
+            "plan": {"mode": plan.mode, "steps": sorted(plan.steps)} if plan is not None else None,
+            "edits": ctx.edits,
+            "result": ctx.result,
+        }
+        try:
+            self.job_store.checkpoint(ctx.job.job_id, checkpoint, state)
+        except Exception as e:
+            print(f"[JOB {ctx.job.job_id}] Could not record checkpoint {checkpoint}: {e}")
 
+    def _forget(self, job_id: str):
+        try:
+            self.job_store.remove(job_id)
         except Exception as e:
-            result["error"] = str(e)
+            print(f"[JOB {job_id}] Could not remove from job store: {e}")
+
+    def _submit(self, contexts: List[JobContext], partial: bool = True) -> int:
+        """Records `contexts` durably, then queues them; rows for jobs that did not fit are dropped."""
+        self.job_store.add_many(
+            [self._job_spec(ctx.job) for ctx in contexts],
+            [{"id": ctx.variant_group.group_id, "index": ctx.result["variant_index"]}
+             if ctx.variant_group is not None else None for ctx in contexts])
+        queued = 0
+        try:
+            queued = self.pipeline.submit_many(contexts, partial=partial)
         finally:
-            def cleanup_and_notify():
-                try:
-                    requests.post(job.callback_url, json=result, timeout=12)
-                except:
-                    pass
-                for path in [temp_file, job_folder]:
-                    if path.exists():
-                        try:
-                            if path.is_dir():
-                                shutil.rmtree(path, ignore_errors=True)
-                            else:
-                                path.unlink(missing_ok=True)
-                        except:
-                            pass
+            for ctx in contexts[queued:]:
+                self._forget(ctx.job.job_id)
+        return queued
 
-            Thread(target=cleanup_and_notify, daemon=True).start()
+    def _restore(self, ctx: JobContext, checkpoint: Optional[str], state: Optional[dict]) -> Optional[str]:
+        """Rebuilds `ctx` from a checkpoint; returns the stage to resume with, or None to start over."""
+        if checkpoint not in self.RESUME_STAGE or not state or not state.get("plan"):
+            return None
+        ctx.relocate(Path(state["job_folder"]))
+        ctx.workspace_tier = state["workspace_tier"]
+        ctx.apk_sha256 = state["apk_sha256"]
+        ctx.apk_size = state["apk_size"]
+        ctx.plan = DecodePlan(state["plan"]["mode"], frozenset(state["plan"]["steps"]))
+        ctx.edits = state["edits"]
+        stage = self.RESUME_STAGE[checkpoint]
+        binary = ctx.plan.mode == DecodePlan.BINARY
+        needs = {
+            "decode": ctx.temp_file,
+            "build": ctx.rebuilt_apk if binary else ctx.src_dir,
+            "sign": ctx.rebuilt_apk,
+            "upload": ctx.final_apk_path,
+        }[stage]
+        if not needs.exists() and not (stage == "sign" and self._aligned_by_earlier_try(ctx)):
+            return None
+        ctx.result.update(state["result"])
+        return stage
+
+    def _rejoin_variant_groups(self, rows: List[dict]) -> Dict[str, VariantGroup]:
+        """Rebuilds the variant groups of interrupted jobs; a group with no variant left to run is discarded."""
+        members: Dict[str, int] = {}
+        for row in rows:
+            member = row["variant_group"]
+            if member is not None:
+                resumable = row["attempts"] <= self.max_resume_attempts
+                members[member["id"]] = members.get(member["id"], 0) + (1 if resumable else 0)
+        groups = {}
+        for group_id, count in members.items():
+            folder = self.jobs_dir / group_id
+            if count == 0:
+                self.janitor.discard(group_id, [folder])
+                continue
+            # the source is fetched again on first use; a private decode cache reloads from the folder
+            self.janitor.track(group_id)
+            groups[group_id] = VariantGroup(group_id, folder, count, self.decode_cache)
+        return groups
+
+    def resume_interrupted(self) -> int:
+        """
+        Re-queues jobs a previous process accepted but did not finish, from their last
+        checkpoint when its workspace is still there. Jobs interrupted more than
+        HARDENING_RESUME_MAX_ATTEMPTS times are failed with a callback instead.
+        """
+        contexts = []
+        rows = self.job_store.interrupted()
+        groups = self._rejoin_variant_groups(rows)
+        for row in rows:
+            job = Job(**row["spec"])
+            ctx = self._new_context(job)
+            if row["attempts"] > self.max_resume_attempts:
+                ctx.result["error"] = f"Job was interrupted {row['attempts']} times by restarts"
+                try:
+                    self.callback_outbox.enqueue(job.job_id, job.callback_url, ctx.result)
+                    self._forget(job.job_id)
+                except Exception as e:
+                    print(f"[JOB {job.job_id}] Could not queue callback: {e}")
+                continue
+            stage = self._restore(ctx, row["checkpoint"], row["state"])
+            if stage is None:
+                if row["state"]:
+                    self.janitor.discard(job.job_id, [Path(row["state"]["job_folder"])])
+                ctx = self._new_context(job)
+            member = row["variant_group"]
+            if member is not None:
+                ctx.variant_group = groups[member["id"]]
+                ctx.result["variant_group"] = member["id"]
+                ctx.result["variant_index"] = member["index"]
+            if stage is not None:
+                self.janitor.track(job.job_id)
+                self.workspaces.adopt(job.job_id, ctx.apk_size, ctx.workspace_tier)
+                ctx.signing_prep = self.prep_executor.submit(self._prepare_signing, job)
+                ctx.resume_from = stage
+            ctx.result["resumed_from"] = row["checkpoint"] or "accepted"
+            ctx.result["timings"]["resume_attempt"] = row["attempts"]
+            contexts.append(ctx)
+            print(f"[JOB {job.job_id}] Resuming after restart from {row['checkpoint'] or 'the start'}"
+                  f" → {stage or 'download'}")
+        if contexts:
+            self.pipeline.submit_many(contexts, bounded=False)  # already accepted: never dropped
+        return len(contexts)
+
+    def _decode_cache_for(self, ctx: JobContext) -> Optional[DecodeCache]:
+        return ctx.variant_group.decode_cache if ctx.variant_group is not None else self.decode_cache
+
+    @staticmethod
+    def _stage_failed(ctx: JobContext, error: Exception):
+        ctx.result["error"] = str(error)
+
+    def _stage_workers(self, stage: str) -> int:
+        default = self.STAGE_WORKERS[stage] or self.max_workers
+        return int(os.getenv(f"HARDENING_STAGE_{stage.upper()}_WORKERS", str(default)))
 
-        print(
-            f"[TIMER] TOTAL JOB TIME: {result.get('total_job_time', 0):.3f}s")
-        return result
+    def harden_and_notify(self, job: Job):
+        """Runs the whole pipeline for one job on the calling thread."""
+        ctx = self._new_context(job)
+        self.pipeline.run_inline(ctx)
+        return ctx.result
 
     def start_background_hardening(self, job: Job) -> str:
-        self.executor.submit(self.harden_and_notify, job)
+        if not self._submit([self._new_context(job)]):
+            raise RuntimeError("Queue is full")
         return job.job_id
 
+    def start_batch_hardening(self, jobs: List[Job]) -> int:
+        """Queues `jobs` in order in one go; returns how many fit before the pending limit."""
+        return self._submit([self._new_context(job) for job in jobs])
+
+    def start_variant_hardening(self, jobs: List[Job]) -> str:
+        """
+        Submits variants of one source APK as a group: one download and one decode, then
+        each variant's edits/build/sign run as its own job with its own callback.
+        """
+        group_id = str(uuid.uuid4())
+        self.janitor.track(group_id)
+        group = VariantGroup(group_id, self.jobs_dir / group_id, len(jobs), self.decode_cache)
+        contexts = []
+        for index, job in enumerate(jobs):
+            ctx = self._new_context(job)
+            ctx.variant_group = group
+            ctx.result["variant_group"] = group_id
+            ctx.result["variant_index"] = index
+            contexts.append(ctx)
+        if not self._submit(contexts, partial=False):
+            self.janitor.discard(group_id, [group.folder])
+            raise RuntimeError("Queue is full")
+        print(f"[Variants] Group {group_id}: {len(jobs)} variants of {jobs[0].apk_url}")
+        return group_id
+
+    def queue_status(self, job_id: str) -> dict:
+        return self.pipeline.queue_status(job_id)
+
+    def job_status(self, job_id: str) -> Optional[dict]:
+        """Registry record for `job_id` plus its live queue position while it waits."""
+        record = self.registry.get(job_id)
+        if record is not None and record["state"] == QUEUED:
+            record.update(self.queue_status(job_id))
+        return record
+
     def shutdown(self):
-        self.executor.shutdown(wait=True)
+        self.pipeline.shutdown(wait=True)
+        self.prep_executor.shutdown(wait=True)
+        self.registry.close()
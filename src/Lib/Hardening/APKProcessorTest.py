@@ -3,13 +3,11 @@ import uuid
 import shutil
 import random
 import string
-import requests
 import subprocess
 import base64
 import time
 import yaml
 from concurrent.futures import ThreadPoolExecutor
-from threading import Thread
 from pathlib import Path
 import xml.etree.ElementTree as ET
 from typing import Optional, Tuple
@@ -17,51 +15,51 @@ from ftplib import FTP
 
 from src.Lib.Hardening.Job import Job
 from src.Lib.Hardening.APKTool import APKTool
+from src.Lib.Hardening.ApkZip import ApkZipError, zipalign_with_fallback
+from src.Lib.Hardening.ApkSigner import ApkSigner, ApkSignerError
+from src.Lib.Hardening.KeystorePool import KeystorePool
+from src.Lib.Hardening.Downloader import Downloader
+from src.Lib.Hardening.WorkspaceJanitor import WorkspaceJanitor
+from src.Lib.Hardening.SmaliRewriter import SmaliRewriter
+from src.Lib.Hardening.StagePipeline import StagePipeline
+from src.Lib.Callback.CallbackOutbox import CallbackOutbox
 
 
 class APKProcessorTest:
 
-    def __init__(self, jobs_dir: str, download_dir: str, apktool: APKTool, base_url: str, max_workers: int = 7):
+    def __init__(self, jobs_dir: str, download_dir: str, apktool: APKTool, base_url: str, max_workers: int = 7,
+                 apk_signer: Optional[ApkSigner] = None, keystore_pool: Optional[KeystorePool] = None,
+                 downloader: Optional[Downloader] = None, callback_outbox: Optional[CallbackOutbox] = None,
+                 janitor: Optional[WorkspaceJanitor] = None, smali_rewriter: Optional[SmaliRewriter] = None,
+                 job_core: Optional[StagePipeline] = None):
         self.jobs_dir = Path(jobs_dir)
         self.download_dir = Path(download_dir)
         self.apktool = apktool
+        self.apk_signer = apk_signer
+        self.downloader = downloader or Downloader()
         self.base_url = base_url.rstrip("/")
         self.max_workers = max_workers
 
         self.jobs_dir.mkdir(parents=True, exist_ok=True)
         self.download_dir.mkdir(parents=True, exist_ok=True)
-
-        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="APKHardener")
+        self.keystore_pool = keystore_pool or KeystorePool(str(self.jobs_dir / "keystores"))
+        self.callback_outbox = callback_outbox or CallbackOutbox(str(self.jobs_dir / "callbacks.db"))
+        self.janitor = janitor or WorkspaceJanitor([str(self.jobs_dir)])
+        self.smali_rewriter = smali_rewriter or SmaliRewriter()
+        # With a job core (the production pipeline) test jobs share its admission and only
+        # run on spare capacity; standalone they get a private pool.
+        self.job_core = job_core
+        self.executor = None if job_core else ThreadPoolExecutor(max_workers=self.max_workers,
+                                                                thread_name_prefix="APKHardener")
 
     def _keystore_for_package(self, job: Job) -> Path:
-        keystore_dir = self.jobs_dir / "keystores"
-        keystore_dir.mkdir(parents=True, exist_ok=True)
-        keystore_path = keystore_dir / f"{job.id}.keystore"
-        if not keystore_path.exists():
-            cmd = [
-                "keytool", "-genkeypair", "-v",
-                "-keystore", str(keystore_path),
-                "-storepass", "android",
-                "-keypass", "android",
-                "-alias", "androiddebugkey",
-                "-keyalg", "RSA",
-                "-keysize", "2048",
-                "-validity", "10000",
-                "-dname", "CN=Hardening,O=APK,L=Local,C=US"
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            if result.returncode != 0:
-                raise Exception(f"Keystore generation failed: {result.stderr}")
-        return keystore_path
+        return self.keystore_pool.get(job.id)
 
     def _generate_random_package(self) -> str:
         return f"com.{''.join(random.choices(string.ascii_lowercase, k=3))}.{''.join(random.choices(string.ascii_lowercase + string.digits, k=10))}"
 
-    def _download_apk(self, url: str, save_path: Path):
-        cmd = ["curl", "-L", "--fail", "--connect-timeout", "30", "--silent", url, "-o", str(save_path)]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise Exception(f"Download failed: {result.stderr}")
+    def _download_apk(self, url: str, save_path: Path) -> dict:
+        return self.downloader.download(url, save_path)
 
     def _rename_package(self, src_dir: Path, old_package: str, new_package: str):
         old_path = old_package.replace('.', '/')
@@ -76,18 +74,13 @@ class APKProcessorTest:
                 new_dir.parent.mkdir(parents=True, exist_ok=True)
                 shutil.move(str(old_dir), str(new_dir))
 
-        # Step 2: only rewrite files that actually contain references
-        pattern_old = f"L{old_path}/"
-        pattern_new = f"L{new_path}/"
-
-        for smali_file in src_dir.rglob("*.smali"):
-            try:
-                content = smali_file.read_text(encoding="utf-8", errors="ignore")
-                if pattern_old in content:
-                    content = content.replace(pattern_old, pattern_new)
-                    smali_file.write_text(content, encoding="utf-8")
-            except Exception:
-                continue
+        # Step 2: only rewrite files that actually contain references (process pool, chunked by directory)
+        stats = self.smali_rewriter.rewrite(src_dir, f"L{old_path}/", f"L{new_path}/")
+        print(f"[rename_package] Rewrote {stats['rewritten']}/{stats['scanned']} smali files "
+              f"in {stats['units']} units, {stats['seconds']:.2f}s")
+        for error in stats["errors"]:
+            print(f"[rename_package] {error}")
+        return stats
 
     def _get_launcher_components(self, root):
         ns = {'android': 'http://schemas.android.com/apk/res/android'}
@@ -668,14 +661,16 @@ class APKProcessorTest:
         dummy_png = base64.b64decode(dummy_base64)
         (folder / image_name).write_bytes(dummy_png)
 
-    def _zipalign_apk(self, unsigned_apk: Path, aligned_apk: Path):
-        zipalign_path = os.getenv("APK_Z", "zipalign")
-        result = subprocess.run([zipalign_path, "-f", "4", str(unsigned_apk), str(aligned_apk)],
-                                capture_output=True, text=True)
-        if result.returncode != 0 or not aligned_apk.exists():
-            raise Exception(f"zipalign failed: {result.stderr}")
+    def _zipalign_apk(self, unsigned_apk: Path, aligned_apk: Path) -> bool:
+        return zipalign_with_fallback(unsigned_apk, aligned_apk, consume_input=True)
 
     def _sign_apk(self, aligned_apk: Path, signed_apk: Path, keystore: Path):
+        if self.apk_signer is not None and self.apk_signer.available:
+            try:
+                self.apk_signer.sign(aligned_apk, signed_apk, keystore)
+                return
+            except (ApkSignerError, ApkZipError) as e:
+                print(f"[ApkSigner] {e} — falling back to apksigner")
         base_cmd = ["java", "-jar", os.getenv("APK_S", "apksigner")] if os.getenv('SERVER_TYPE') == "LOCAL" else [os.getenv("APK_S", "apksigner")]
         cmd = base_cmd + [
             "sign", "--ks", str(keystore),
@@ -726,10 +721,11 @@ class APKProcessorTest:
             "new_version_name": None,
         }
 
+        self.janitor.track(job.job_id)
         try:
             self._download_apk(job.apk_url, temp_file)
 
-            decompile_log = self.apktool.decompile(str(temp_file), str(src_dir))
+            decompile_log = self.apktool.decompile(str(temp_file), str(src_dir), job_id=job.job_id)
             if "ERROR" in decompile_log or "Exception" in decompile_log:
                 raise Exception(decompile_log)
 
@@ -784,7 +780,7 @@ class APKProcessorTest:
 
             icon_url = self._extract_and_copy_icon(job, src_dir)
 
-            recompile_log = self.apktool.recompile(str(src_dir), str(rebuilt_apk))
+            recompile_log = self.apktool.recompile(str(src_dir), str(rebuilt_apk), job_id=job.job_id)
             if not rebuilt_apk.exists():
                 raise Exception(recompile_log or "Recompile failed")
 
@@ -832,26 +828,28 @@ class APKProcessorTest:
             result["error"] = str(e)
 
         finally:
-            def cleanup_and_notify():
-                try:
-                    requests.post(job.callback_url, json=result, timeout=12)
-                except:
-                    pass
-                for path in [temp_file, job_folder]:
-                    if path.exists():
-                        try:
-                            if path.is_dir():
-                                shutil.rmtree(path, ignore_errors=True)
-                            else:
-                                path.unlink(missing_ok=True)
-                        except:
-                            pass
-
-            Thread(target=cleanup_and_notify, daemon=True).start()
+            try:
+                self.callback_outbox.enqueue(job.job_id, job.callback_url, result)
+            except Exception as e:
+                print(f"[JOB {job.job_id}] Could not queue callback: {e}")
+            self.janitor.discard(job.job_id, [temp_file, job_folder, self.apktool.tmp_dir_for(job.job_id)])
+        return result
 
     def start_background_hardening(self, job: Job) -> str:
-        self.executor.submit(self.harden_and_notify, job)
+        if self.job_core is not None:
+            self.job_core.submit_task(job, lambda: self.harden_and_notify(job))
+        else:
+            self.executor.submit(self.harden_and_notify, job)
         return job.job_id
 
+    def queue_status(self, job_id: str) -> dict:
+        if self.job_core is not None:
+            return self.job_core.queue_status(job_id)
+        # the private pool is a plain FIFO; no per-job position is tracked
+        return {"queue_position": None, "estimated_wait_sec": None}
+
     def shutdown(self):
-        self.executor.shutdown(wait=True)
\ No newline at end of file
+        # the job core is owned (and shut down) by the production processor
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        self.smali_rewriter.shutdown()
\ No newline at end of file
@@ -3,24 +3,48 @@ import sys
 import os
 import time
 from pathlib import Path
+from typing import Optional
 import shutil
+from src.Lib.Hardening.APKToolDaemon import APKToolDaemon
+from src.Lib.Hardening.ApkZip import ApkZipError, zipalign
 
 class APKTool:
-    def __init__(self, jar_path: str, zipalign_path: str = None):
+    def __init__(self, jar_path: str, zipalign_path: str = None, daemon_workers: int = 0,
+                 daemon_max_jobs: int = 50, daemon_max_rss_mb: int = 2048, daemon_idle_wait: float = 1.0):
         self.jar_path = os.path.abspath(jar_path) if sys.platform.startswith("win") else jar_path
         if not os.path.isfile(self.jar_path):
             raise FileNotFoundError(f"apktool.jar not found at: {self.jar_path}")
         print(f"[APKTool] Initialized with jar: {self.jar_path}")
 
-        # Full path to zipalign binary (optional)
+        # Full path to zipalign binary (optional, only used for archives ApkZip cannot read)
         self.zipalign_path = zipalign_path or "zipalign"
-        if not shutil.which(self.zipalign_path):
-            print(f"[APKTool WARNING] zipalign not found in PATH: {self.zipalign_path}")
+
+        # Warm apktool JVMs; decompile/recompile fall back to `java -jar` when unavailable
+        self.daemon = APKToolDaemon(
+            self.jar_path,
+            workers=daemon_workers,
+            max_jobs=daemon_max_jobs,
+            max_rss_mb=daemon_max_rss_mb,
+            env_factory=self._get_env,
+            idle_wait=daemon_idle_wait,
+        ) if daemon_workers > 0 else None
+
+    @staticmethod
+    def tmp_root() -> Optional[str]:
+        """Parent of the per-job TMPDIRs (SERVER mode only)."""
+        if os.environ.get("SERVER_TYPE", "").upper() == "SERVER":
+            return os.getenv("APKTOOL_TMP_ROOT", "/home/pco/apk_tmp")
+        return None
+
+    def tmp_dir_for(self, job_id: str) -> Optional[Path]:
+        """TMPDIR of a job's cold `java -jar` runs; warm workers use apktool_worker_<n>, cleared by the daemon."""
+        root = self.tmp_root()
+        return Path(root) / job_id if root else None
 
     def _get_env(self, job_id: str = "default_job") -> dict:
         env = os.environ.copy()
-        if os.environ.get("SERVER_TYPE", "").upper() == "SERVER":
-            tmp_path = f"/home/pco/apk_tmp/{job_id}"
+        if self.tmp_root():
+            tmp_path = str(self.tmp_dir_for(job_id))
             os.makedirs(tmp_path, exist_ok=True)
             env["TMPDIR"] = tmp_path
             env["TMP"] = tmp_path
@@ -68,25 +92,68 @@ class APKTool:
             print(msg)
             return msg
 
-    def decompile(self, apk_path: str, output_dir: str, job_id: str = "default_job", timeout_sec: int = 1800) -> str:
+    def _run_apktool(self, args: list, operation_name: str, job_id: str, timeout_sec: int,
+                     timings: Optional[dict] = None) -> str:
+        if self.daemon is not None:
+            start_time = time.time()
+            warm = self.daemon.run(args, timeout_sec)
+            if warm is not None:
+                code, output, startup_saved = warm
+                duration = time.time() - start_time
+                if timings is not None:
+                    key = f"{operation_name.lower()}_jvm_startup_saved"
+                    timings[key] = timings.get(key, 0.0) + startup_saved
+                cmd_short = " ".join(["apktool"] + args[:5]) + (" ..." if len(args) > 5 else "")
+                if code != 0:
+                    msg = (
+                        f"[APKTool {operation_name} ERROR] code={code} | time={duration:.2f}s | warm JVM\n"
+                        f"Command: {cmd_short}\nOutput:\n{output.strip()}"
+                    )
+                    print(msg)
+                    return msg
+                success_msg = (
+                    f"[APKTool {operation_name} SUCCESS] time={duration:.2f}s | warm JVM "
+                    f"(startup saved ~{startup_saved:.2f}s) | Command: {cmd_short}"
+                )
+                print(success_msg)
+                return f"{success_msg}\n\n{output.strip()}"
+        cmd = ["java", "-jar", self.jar_path] + args
+        return self._run_with_timing(cmd, operation_name, job_id, timeout_sec)
+
+    def decompile(self, apk_path: str, output_dir: str, job_id: str = "default_job", timeout_sec: int = 1800,
+                  timings: Optional[dict] = None, extra_flags: Optional[list] = None) -> str:
         apk_path = str(Path(apk_path).resolve())
         output_dir = str(Path(output_dir).resolve())
         os.makedirs(output_dir, exist_ok=True)
-        cmd = ["java", "-jar", self.jar_path, "d", apk_path, "-o", output_dir, "--force"]
-        return self._run_with_timing(cmd, "DECOMPILE", job_id, timeout_sec)
+        args = ["d", apk_path, "-o", output_dir, "--force"] + (extra_flags or [])
+        return self._run_apktool(args, "DECOMPILE", job_id, timeout_sec, timings)
 
-    def recompile(self, source_dir: str, output_apk: str, job_id: str = "default_job", timeout_sec: int = 1800) -> str:
+    def recompile(self, source_dir: str, output_apk: str, job_id: str = "default_job", timeout_sec: int = 1800,
+                  timings: Optional[dict] = None) -> str:
         source_dir = str(Path(source_dir).resolve())
         output_apk = str(Path(output_apk).resolve())
         os.makedirs(os.path.dirname(output_apk), exist_ok=True)
-        cmd = ["java", "-jar", self.jar_path, "b", source_dir, "-o", output_apk, "--force"]
-        return self._run_with_timing(cmd, "RECOMPILE", job_id, timeout_sec)
+        args = ["b", source_dir, "-o", output_apk, "--force"]
+        return self._run_apktool(args, "RECOMPILE", job_id, timeout_sec, timings)
+
+    def shutdown(self):
+        if self.daemon is not None:
+            self.daemon.shutdown()
 
     def zipalign_apk(self, input_apk: str, output_apk: str, job_id: str = "default_job") -> str:
         input_apk = str(Path(input_apk).resolve())
         output_apk = str(Path(output_apk).resolve())
         os.makedirs(os.path.dirname(output_apk), exist_ok=True)
 
+        start_time = time.time()
+        try:
+            realigned = zipalign(Path(input_apk), Path(output_apk))
+            duration = time.time() - start_time
+            return (f"[APKTool ZIPALIGN SUCCESS] time={duration:.2f}s | "
+                    f"{'aligned' if realigned else 'already aligned'}: {input_apk}")
+        except ApkZipError as e:
+            print(f"[APKTool ZIPALIGN] {e} — using the zipalign binary")
+
         if not shutil.which(self.zipalign_path):
             return f"[ZIPALIGN ERROR] zipalign not found: {self.zipalign_path}"
 
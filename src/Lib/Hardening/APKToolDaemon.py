@@ -0,0 +1,260 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from src.Lib.Hardening.WorkspaceJanitor import TRASH_DIR
+
+
+WORKER_SOURCE = Path(__file__).with_name("ApktoolWorker.java")
+DONE_MARKER = "@@APKTOOL_WORKER_DONE"
+
+
+class _ApktoolWorker:
+    """One warm JVM running ApktoolWorker.java; serves a single command at a time."""
+
+    def __init__(self, index: int, cmd: List[str], env: dict, ready_timeout: int):
+        self.index = index
+        self.env = env
+        self.jobs_served = 0
+        self.lines: "queue.Queue[Optional[str]]" = queue.Queue()
+
+        start = time.perf_counter()
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+            env=env,
+        )
+        threading.Thread(target=self._pump, daemon=True, name=f"ApktoolWorker-{index}").start()
+
+        code, output = self._read_response(ready_timeout)
+        if code != "READY":
+            self.kill()
+            raise RuntimeError(f"apktool worker failed to start: {output.strip()[-500:]}")
+        self.startup_time = time.perf_counter() - start
+
+    def _pump(self):
+        for line in self.proc.stdout:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    def _read_response(self, timeout_sec: int) -> Tuple[Optional[str], str]:
+        deadline = time.monotonic() + timeout_sec
+        output = []
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"apktool worker {self.index} timed out after {timeout_sec}s")
+            try:
+                line = self.lines.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if line is None:
+                return None, "".join(output)
+            if line.startswith(DONE_MARKER):
+                return line[len(DONE_MARKER):].strip(), "".join(output)
+            output.append(line)
+
+    def run(self, args: List[str], timeout_sec: int) -> Tuple[int, str]:
+        self.jobs_served += 1
+        self.proc.stdin.write("\t".join(args) + "\n")
+        self.proc.stdin.flush()
+        code, output = self._read_response(timeout_sec)
+        if code is None:
+            # apktool called System.exit() without the exit trap: the JVM is gone
+            return 1, output
+        return int(code), output
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def rss_mb(self) -> float:
+        try:
+            with open(f"/proc/{self.proc.pid}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
+
+    def stop(self):
+        if self.alive():
+            try:
+                self.proc.stdin.write("QUIT\n")
+                self.proc.stdin.flush()
+                self.proc.wait(timeout=10)
+            except Exception:
+                self.kill()
+
+    def kill(self):
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=10)
+        except Exception:
+            pass
+
+
+class APKToolDaemon:
+    """
+    Pool of long-lived apktool JVMs so decode/build commands skip JVM startup,
+    class loading and JIT warm-up. Workers are recycled after `max_jobs` commands
+    or once their RSS grows past `max_rss_mb`. A command waits at most `idle_wait`
+    seconds for a free worker before running cold, so the pool never caps how many
+    decodes/builds run at once. A worker keeps one TMPDIR for its whole life (the JVM
+    reads java.io.tmpdir once), so whatever apktool left there is moved to the
+    janitor's trash after every command and before every (re)spawn.
+    """
+
+    def __init__(
+        self,
+        jar_path: str,
+        workers: int = 2,
+        max_jobs: int = 50,
+        max_rss_mb: int = 2048,
+        env_factory: Optional[Callable[[str], dict]] = None,
+        ready_timeout: int = 120,
+        idle_wait: float = 1.0,
+    ):
+        self.jar_path = jar_path
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.env_factory = env_factory or (lambda name: os.environ.copy())
+        self.ready_timeout = ready_timeout
+        self.idle_wait = max(0.0, idle_wait)
+
+        self.enabled = workers > 0 and WORKER_SOURCE.is_file()
+        self.idle: "queue.Queue[_ApktoolWorker]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.cold_start_time = 0.0
+        self.security_manager = True
+        self.stats = {"commands": 0, "recycled": 0, "spawn_failures": 0, "cold_fallbacks": 0}
+
+        if self.enabled:
+            threading.Thread(target=self._prewarm, daemon=True, name="APKToolDaemon-prewarm").start()
+
+    def _prewarm(self):
+        for index in range(self.workers):
+            worker = self._spawn(index)
+            if worker is None:
+                return
+            self.idle.put(worker)
+
+    def _command(self) -> List[str]:
+        cmd = ["java"]
+        if self.security_manager:
+            cmd.append("-Djava.security.manager=allow")
+        return cmd + ["-cp", self.jar_path, str(WORKER_SOURCE)]
+
+    @staticmethod
+    def _clear_tmp(env: dict):
+        tmp = env.get("TMPDIR")
+        if not tmp:
+            return
+        tmp_dir = Path(tmp)
+        trash = tmp_dir.parent / TRASH_DIR
+        try:
+            entries = list(os.scandir(tmp_dir))
+            if entries:
+                trash.mkdir(exist_ok=True)
+            for entry in entries:
+                os.rename(entry.path, trash / f"{uuid.uuid4().hex}-{entry.name}")
+        except OSError as e:
+            print(f"[APKToolDaemon] Could not clear {tmp_dir}: {e}")
+
+    def _spawn(self, index: int) -> Optional[_ApktoolWorker]:
+        env = self.env_factory(f"apktool_worker_{index}")
+        self._clear_tmp(env)
+        for _ in range(2):
+            try:
+                worker = _ApktoolWorker(index, self._command(), env, self.ready_timeout)
+            except Exception as e:
+                with self.lock:
+                    self.stats["spawn_failures"] += 1
+                print(f"[APKToolDaemon] Worker {index} start failed: {e}")
+                if self.security_manager:
+                    # JDK 24+ refuses to start with -Djava.security.manager=allow
+                    self.security_manager = False
+                    continue
+                self.enabled = False
+                return None
+            with self.lock:
+                if self.cold_start_time:
+                    self.cold_start_time = 0.7 * self.cold_start_time + 0.3 * worker.startup_time
+                else:
+                    self.cold_start_time = worker.startup_time
+            print(f"[APKToolDaemon] Worker {index} ready in {worker.startup_time:.2f}s")
+            return worker
+        return None
+
+    def _recycle(self, worker: _ApktoolWorker) -> Optional[_ApktoolWorker]:
+        with self.lock:
+            self.stats["recycled"] += 1
+        worker.stop()
+        return self._spawn(worker.index)
+
+    def run(self, args: List[str], timeout_sec: int = 1800) -> Optional[Tuple[int, str, float]]:
+        """
+        Runs one apktool command on a warm worker.
+        Returns (exit_code, output, startup_saved_sec), or None when the caller
+        should fall back to a cold `java -jar` run.
+        """
+        if not self.enabled or any("\t" in a or "\n" in a for a in args):
+            return None
+        start = time.monotonic()
+        try:
+            worker = self.idle.get(timeout=min(self.idle_wait, timeout_sec))
+        except queue.Empty:
+            with self.lock:
+                self.stats["cold_fallbacks"] += 1
+            return None
+        waited = time.monotonic() - start
+        if not self.enabled:
+            self.idle.put(worker)
+            return None
+        timeout_sec = max(1, int(timeout_sec - waited))
+
+        # the wait for a free worker eats into what the warm JVM saves
+        startup_saved = max(0.0, self.cold_start_time - waited)
+        try:
+            if not worker.alive():
+                worker = self._spawn(worker.index)
+                startup_saved = 0.0
+                if worker is None:
+                    return None
+            with self.lock:
+                self.stats["commands"] += 1
+            code, output = worker.run(args, timeout_sec)
+        except TimeoutError as e:
+            worker.kill()
+            worker = self._spawn(worker.index)
+            return 1, str(e), startup_saved
+        except OSError:
+            return None
+        finally:
+            if worker is not None:
+                self._clear_tmp(worker.env)
+                if not worker.alive() or worker.jobs_served >= self.max_jobs or worker.rss_mb() >= self.max_rss_mb:
+                    worker = self._recycle(worker)
+                if worker is not None:
+                    self.idle.put(worker)
+        return code, output, startup_saved
+
+    def shutdown(self):
+        self.enabled = False
+        while True:
+            try:
+                self.idle.get_nowait().stop()
+            except queue.Empty:
+                break
@@ -0,0 +1,402 @@
+import base64
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from src.Lib.Hardening.ApkZip import ApkZip, STORED, DEFLATED, is_signature_file
+from src.Lib.Hardening.BinaryManifest import BinaryManifest, BinaryManifestError
+
+CHUNK_SIZE = 1024 * 1024
+APK_SIG_BLOCK_MAGIC = b"APK Sig Block 42"
+APK_SIGNATURE_SCHEME_V2_BLOCK_ID = 0x7109871A
+APK_SIGNATURE_SCHEME_V3_BLOCK_ID = 0xF05368C0
+VERITY_PADDING_BLOCK_ID = 0x42726577
+STRIPPING_PROTECTION_ATTR_ID = 0xBEEFF00D
+SIGNING_BLOCK_ALIGNMENT = 4096
+
+RSA_PKCS1_V1_5_WITH_SHA256 = 0x0103
+V3_MIN_SDK = 28
+V3_MAX_SDK = 0x7FFFFFFF
+
+MIN_SDK_WITHOUT_V1 = 24  # apksigner only adds a JAR signature below Android 7.0
+MIN_SDK_SHA256_V1 = 18
+
+CREATED_BY = "1.0 (Android)"
+V1_CERT_NAME = "CERT"
+
+OID_SIGNED_DATA = "1.2.840.113549.1.7.2"
+OID_DATA = "1.2.840.113549.1.7.1"
+OID_RSA = "1.2.840.113549.1.1.1"
+OID_SHA1 = "1.3.14.3.2.26"
+OID_SHA256 = "2.16.840.1.101.3.4.2.1"
+
+
+class ApkSignerError(Exception):
+    pass
+
+
+class SigningKey:
+    """Private key and certificate loaded from a keystore, kept for reuse across jobs."""
+
+    __slots__ = ("private_key", "certificate", "certificate_der", "public_key_der", "issuer_der", "serial")
+
+    def __init__(self, private_key, certificate):
+        from cryptography.hazmat.primitives import serialization
+
+        self.private_key = private_key
+        self.certificate = certificate
+        self.certificate_der = certificate.public_bytes(serialization.Encoding.DER)
+        self.public_key_der = certificate.public_key().public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+        self.issuer_der = certificate.issuer.public_bytes()
+        self.serial = certificate.serial_number
+
+    def sign(self, data: bytes, sha1: bool = False) -> bytes:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        return self.private_key.sign(data, padding.PKCS1v15(), hashes.SHA1() if sha1 else hashes.SHA256())
+
+
+# --- DER helpers (just enough for a PKCS#7 SignedData) -----------------------
+
+def _der(tag: int, content: bytes) -> bytes:
+    length = len(content)
+    if length < 0x80:
+        return bytes([tag, length]) + content
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes([tag, 0x80 | len(encoded)]) + encoded + content
+
+
+def _der_int(value: int) -> bytes:
+    return _der(0x02, value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True))
+
+
+def _der_oid(oid: str) -> bytes:
+    parts = [int(p) for p in oid.split(".")]
+    body = bytearray([parts[0] * 40 + parts[1]])
+    for part in parts[2:]:
+        encoded = [part & 0x7F]
+        part >>= 7
+        while part:
+            encoded.append(0x80 | (part & 0x7F))
+            part >>= 7
+        body += bytes(reversed(encoded))
+    return _der(0x06, bytes(body))
+
+
+def _der_seq(*items: bytes) -> bytes:
+    return _der(0x30, b"".join(items))
+
+
+def _algorithm(oid: str) -> bytes:
+    return _der_seq(_der_oid(oid), b"\x05\x00")
+
+
+# --- APK signing block helpers -----------------------------------------------
+
+def _lp(data: bytes) -> bytes:
+    """uint32 length-prefixed value."""
+    return struct.pack("<I", len(data)) + data
+
+
+def _lp_seq(items) -> bytes:
+    return _lp(b"".join(_lp(item) for item in items))
+
+
+class ApkSigner:
+    """
+    In-process apksigner: JAR (v1) signature when the APK's minSdkVersion still needs
+    one, then APK Signature Scheme v2 + v3 blocks inserted in front of the central
+    directory. The 1 MiB chunk digests are hashed in parallel over an mmap of the APK
+    and key material is cached per keystore. Needs the optional `cryptography` package;
+    `available` is False without it and callers keep using apksigner.
+    """
+
+    def __init__(self, digest_workers: Optional[int] = None, max_keys: int = 256):
+        try:
+            import cryptography  # noqa: F401
+            self.available = True
+        except ImportError:
+            print("[ApkSigner] cryptography not installed — signing with apksigner")
+            self.available = False
+        self.digest_workers = digest_workers or min(8, os.cpu_count() or 1)
+        self._executor = ThreadPoolExecutor(max_workers=self.digest_workers,
+                                            thread_name_prefix="apk-digest")
+        self.max_keys = max_keys
+        self._keys: "OrderedDict[Tuple[str, int], SigningKey]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- keys ---------------------------------------------------------------
+
+    def load_key(self, keystore: Path, password: str = "android") -> SigningKey:
+        """Loads a PKCS#12 keystore (keytool's default format) once per path and mtime."""
+        from cryptography.hazmat.primitives.serialization import pkcs12
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        keystore = Path(keystore)
+        cache_key = (str(keystore.resolve()), keystore.stat().st_mtime_ns)
+        with self._lock:
+            key = self._keys.get(cache_key)
+            if key is not None:
+                self._keys.move_to_end(cache_key)
+                return key
+
+        try:
+            private_key, certificate, _ = pkcs12.load_key_and_certificates(
+                keystore.read_bytes(), password.encode("utf-8"))
+        except ValueError as e:
+            raise ApkSignerError(f"Cannot read keystore {keystore.name}: {e}")
+        if private_key is None or certificate is None:
+            raise ApkSignerError(f"Keystore {keystore.name} has no private key entry")
+        if not isinstance(private_key, rsa.RSAPrivateKey) or private_key.key_size > 3072:
+            raise ApkSignerError("Only RSA keys up to 3072 bits are supported")
+        key = SigningKey(private_key, certificate)
+
+        with self._lock:
+            self._keys[cache_key] = key
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+        return key
+
+    # --- signing ------------------------------------------------------------
+
+    def sign(self, input_apk: Path, output_apk: Path, keystore: Path, password: str = "android") -> dict:
+        """Signs `input_apk` into `output_apk`. Returns a few timings for the job result."""
+        if not self.available:
+            raise ApkSignerError("cryptography is not installed")
+        timings = {}
+        key = self.load_key(keystore, password)
+
+        start = time.perf_counter()
+        with ApkZip(input_apk) as apk:
+            min_sdk = self._min_sdk(apk)
+            if min_sdk < MIN_SDK_WITHOUT_V1:
+                add = self._v1_signature(apk, key, sha1=min_sdk < MIN_SDK_SHA256_V1)
+                apk.rewrite(output_apk, add=add, remove=is_signature_file, align=True)
+            elif any(is_signature_file(name) for name in apk.names()) or self._has_signing_block(apk):
+                apk.rewrite(output_apk, remove=is_signature_file, align=True)
+            else:
+                shutil.copyfile(input_apk, output_apk)
+        timings["sign_v1"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self._insert_signing_block(Path(output_apk), key)
+        timings["sign_v2_v3"] = time.perf_counter() - start
+        return timings
+
+    @staticmethod
+    def _min_sdk(apk: ApkZip) -> int:
+        try:
+            manifest = BinaryManifest(apk.read("AndroidManifest.xml"))
+        except (KeyError, BinaryManifestError):
+            return 1
+        uses_sdk = manifest.root.find("uses-sdk")
+        value = manifest.get_attr(uses_sdk, "minSdkVersion") if uses_sdk is not None else None
+        if isinstance(value, str) and value.isdigit():
+            value = int(value)
+        # codenames and resource references: assume the oldest platform
+        return value if isinstance(value, int) else 1
+
+    @staticmethod
+    def _has_signing_block(apk: ApkZip) -> bool:
+        if apk.cd_offset < 24:
+            return False
+        apk.file.seek(apk.cd_offset - 16)
+        return apk.file.read(16) == APK_SIG_BLOCK_MAGIC
+
+    # --- v1 (JAR) -----------------------------------------------------------
+
+    @staticmethod
+    def _manifest_attr(name: str, value: str) -> bytes:
+        """One manifest attribute, wrapped at 72 bytes per line as the JAR spec requires."""
+        line = f"{name}: {value}".encode("utf-8")
+        parts = [line[:72]]
+        for pos in range(72, len(line), 71):
+            parts.append(b" " + line[pos:pos + 71])
+        return b"\r\n".join(parts) + b"\r\n"
+
+    def _entry_digest(self, apk: ApkZip, name: str, sha1: bool) -> str:
+        data = apk.read(name)
+        digest = hashlib.sha1(data) if sha1 else hashlib.sha256(data)
+        return base64.b64encode(digest.digest()).decode("ascii")
+
+    def _v1_signature(self, apk: ApkZip, key: SigningKey, sha1: bool) -> dict:
+        digest_name = "SHA1" if sha1 else "SHA-256"
+        hash_new = hashlib.sha1 if sha1 else hashlib.sha256
+        names = sorted(n for n in apk.names() if not n.endswith("/") and not is_signature_file(n))
+        for name in names:
+            if apk.by_name[name].method not in (STORED, DEFLATED):
+                raise ApkSignerError(f"Unsupported compression method for {name}")
+
+        manifest = bytearray(self._manifest_attr("Manifest-Version", "1.0")
+                             + self._manifest_attr("Created-By", CREATED_BY) + b"\r\n")
+        sections = []
+        for name in names:
+            section = (self._manifest_attr("Name", name)
+                       + self._manifest_attr(f"{digest_name}-Digest", self._entry_digest(apk, name, sha1))
+                       + b"\r\n")
+            manifest += section
+            sections.append((name, section))
+
+        signature_file = bytearray(
+            self._manifest_attr("Signature-Version", "1.0")
+            + self._manifest_attr("Created-By", CREATED_BY)
+            + self._manifest_attr(f"{digest_name}-Digest-Manifest",
+                                  base64.b64encode(hash_new(manifest).digest()).decode("ascii"))
+            + self._manifest_attr("X-Android-APK-Signed", "2, 3")
+            + b"\r\n")
+        for name, section in sections:
+            signature_file += (self._manifest_attr("Name", name)
+                               + self._manifest_attr(f"{digest_name}-Digest",
+                                                     base64.b64encode(hash_new(section).digest()).decode("ascii"))
+                               + b"\r\n")
+
+        return {
+            "META-INF/MANIFEST.MF": bytes(manifest),
+            f"META-INF/{V1_CERT_NAME}.SF": bytes(signature_file),
+            f"META-INF/{V1_CERT_NAME}.RSA": self._pkcs7(key, bytes(signature_file), sha1),
+        }
+
+    @staticmethod
+    def _pkcs7(key: SigningKey, signed: bytes, sha1: bool) -> bytes:
+        """Detached PKCS#7 SignedData without signed attributes, as apksigner writes it."""
+        digest_algorithm = _algorithm(OID_SHA1 if sha1 else OID_SHA256)
+        signer_info = _der_seq(
+            _der_int(1),
+            _der_seq(key.issuer_der, _der_int(key.serial)),
+            digest_algorithm,
+            _algorithm(OID_RSA),
+            _der(0x04, key.sign(signed, sha1=sha1)),
+        )
+        signed_data = _der_seq(
+            _der_int(1),
+            _der(0x31, digest_algorithm),
+            _der_seq(_der_oid(OID_DATA)),
+            _der(0xA0, key.certificate_der),
+            _der(0x31, signer_info),
+        )
+        return _der_seq(_der_oid(OID_SIGNED_DATA), _der(0xA0, signed_data))
+
+    # --- v2 / v3 ------------------------------------------------------------
+
+    @staticmethod
+    def _chunk_digest(section, start: int, end: int) -> bytes:
+        digest = hashlib.sha256(b"\xa5" + struct.pack("<I", end - start))
+        digest.update(section[start:end])  # hashlib drops the GIL for large buffers
+        return digest.digest()
+
+    def content_digest(self, sections: List) -> bytes:
+        jobs = []
+        for section in sections:
+            for start in range(0, len(section), CHUNK_SIZE):
+                jobs.append((section, start, min(start + CHUNK_SIZE, len(section))))
+        if len(jobs) > 1:
+            digests = list(self._executor.map(lambda job: self._chunk_digest(*job), jobs))
+        else:
+            digests = [self._chunk_digest(*job) for job in jobs]
+        return hashlib.sha256(b"\x5a" + struct.pack("<I", len(digests)) + b"".join(digests)).digest()
+
+    def _signer(self, key: SigningKey, digest: bytes, v3: bool) -> bytes:
+        digests = _lp_seq([struct.pack("<I", RSA_PKCS1_V1_5_WITH_SHA256) + _lp(digest)])
+        certificates = _lp_seq([key.certificate_der])
+        if v3:
+            signed_data = (digests + certificates + struct.pack("<II", V3_MIN_SDK, V3_MAX_SDK)
+                           + _lp_seq([]))
+        else:
+            # tells v3-aware verifiers that the v3 block must not have been stripped
+            attributes = _lp_seq([struct.pack("<II", STRIPPING_PROTECTION_ATTR_ID, 3)])
+            signed_data = digests + certificates + attributes
+        signatures = _lp_seq([struct.pack("<I", RSA_PKCS1_V1_5_WITH_SHA256) + _lp(key.sign(signed_data))])
+        signer = _lp(signed_data)
+        if v3:
+            signer += struct.pack("<II", V3_MIN_SDK, V3_MAX_SDK)
+        return signer + signatures + _lp(key.public_key_der)
+
+    def _signing_block(self, key: SigningKey, digest: bytes) -> bytes:
+        pairs = b""
+        for block_id, v3 in ((APK_SIGNATURE_SCHEME_V2_BLOCK_ID, False), (APK_SIGNATURE_SCHEME_V3_BLOCK_ID, True)):
+            value = _lp_seq([self._signer(key, digest, v3)])
+            pairs += struct.pack("<QI", len(value) + 4, block_id) + value
+        total = 8 + len(pairs) + 8 + 16
+        if total % SIGNING_BLOCK_ALIGNMENT:
+            padding = SIGNING_BLOCK_ALIGNMENT - total % SIGNING_BLOCK_ALIGNMENT
+            if padding < 12:
+                padding += SIGNING_BLOCK_ALIGNMENT
+            pairs += struct.pack("<QI", padding - 8, VERITY_PADDING_BLOCK_ID) + b"\x00" * (padding - 12)
+        size = len(pairs) + 8 + 16
+        return struct.pack("<Q", size) + pairs + struct.pack("<Q", size) + APK_SIG_BLOCK_MAGIC
+
+    def _insert_signing_block(self, apk_path: Path, key: SigningKey):
+        with ApkZip(apk_path) as apk:
+            cd_offset, eocd_offset = apk.cd_offset, apk.eocd_offset
+        with open(apk_path, "r+b") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    digest = self.content_digest([view[:cd_offset], view[cd_offset:eocd_offset], view[eocd_offset:]])
+                    central_directory = bytes(view[cd_offset:eocd_offset])
+                    eocd = bytearray(view[eocd_offset:])
+                finally:
+                    view.release()
+            block = self._signing_block(key, digest)
+            struct.pack_into("<I", eocd, 16, cd_offset + len(block))
+            f.seek(cd_offset)
+            f.write(block)
+            f.write(central_directory)
+            f.write(eocd)
+            f.truncate()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _apksigner(input_apk: str, output_apk: str, keystore: str):
+    import subprocess
+
+    base_cmd = ["java", "-jar", os.getenv("APK_S", "apksigner")] if os.getenv(
+        'SERVER_TYPE') == "LOCAL" else [os.getenv("APK_S", "apksigner")]
+    cmd = base_cmd + [
+        "sign", "--ks", keystore, "--ks-key-alias", "androiddebugkey",
+        "--ks-pass", "pass:android", "--key-pass", "pass:android",
+        "--out", output_apk, input_apk,
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Signing failed: {result.stderr}")
+
+
+if __name__ == "__main__":
+    # Benchmark: python -m src.Lib.Hardening.ApkSigner <aligned.apk> <keystore> [runs]
+    if len(sys.argv) < 3:
+        print("usage: python -m src.Lib.Hardening.ApkSigner <aligned.apk> <keystore> [runs]")
+        sys.exit(1)
+    apk_in, keystore_in = sys.argv[1], sys.argv[2]
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    signer = ApkSigner()
+    for label, sign in (
+        ("native", lambda out: signer.sign(Path(apk_in), Path(out), Path(keystore_in))),
+        ("apksigner", lambda out: _apksigner(apk_in, out, keystore_in)),
+    ):
+        out_path = f"{apk_in}.{label}.apk"
+        samples = []
+        try:
+            for _ in range(runs):
+                start = time.perf_counter()
+                sign(out_path)
+                samples.append(time.perf_counter() - start)
+        except Exception as e:
+            print(f"[{label}] failed: {e}")
+            continue
+        samples.sort()
+        print(f"[{label}] runs={runs} best={samples[0]:.3f}s median={samples[len(samples) // 2]:.3f}s -> {out_path}")
+    signer.shutdown()
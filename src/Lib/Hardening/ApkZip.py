@@ -0,0 +1,321 @@
+import os
+import shutil
+import struct
+import subprocess
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+LOCAL_HEADER_SIG = 0x04034B50
+CENTRAL_HEADER_SIG = 0x02014B50
+EOCD_SIG = 0x06054B50
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+EOCD = struct.Struct("<IHHHHIIH")
+
+STORED = 0
+DEFLATED = 8
+DATA_DESCRIPTOR_FLAG = 0x08
+
+# extensions aapt leaves uncompressed; new entries with these are stored as-is
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".arsc", ".so", ".ogg", ".mp3", ".mp4")
+COPY_CHUNK = 1024 * 1024
+
+# zipalign: stored entries start on a 4-byte boundary, stored native libraries on a page
+ALIGNMENT = 4
+SO_ALIGNMENT = 4096
+# extra field apksigner uses for alignment padding (id, size, u16 alignment, zero padding)
+ALIGNMENT_EXTRA_ID = 0xD935
+
+
+class ApkZipError(Exception):
+    pass
+
+
+class ZipEntry:
+    __slots__ = ("name", "raw_name", "version_made", "version_needed", "flags", "method", "mod_time",
+                 "mod_date", "crc", "compressed_size", "size", "extra", "comment", "internal_attr",
+                 "external_attr", "header_offset", "data")
+
+    def __init__(self, name: str, raw_name: bytes):
+        self.name = name
+        self.raw_name = raw_name
+        self.data: Optional[bytes] = None  # compressed payload for replaced/added entries
+
+
+class ApkZip:
+    """
+    Minimal ZIP reader/rewriter for APKs that copies untouched entries' compressed
+    payloads byte-for-byte, so editing a few entries never recompresses the rest.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.file = open(self.path, "rb")
+        self.entries: List[ZipEntry] = []
+        self._parse_central_directory()
+        self.by_name: Dict[str, ZipEntry] = {e.name: e for e in self.entries}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def _parse_central_directory(self):
+        file_size = os.fstat(self.file.fileno()).st_size
+        tail_size = min(file_size, 0xFFFF + EOCD.size)
+        self.file.seek(file_size - tail_size)
+        tail = self.file.read(tail_size)
+        eocd_pos = tail.rfind(struct.pack("<I", EOCD_SIG))
+        if eocd_pos < 0:
+            raise ApkZipError(f"No end of central directory in {self.path.name}")
+        (_, disk, cd_disk, _, total_entries, cd_size, cd_offset,
+         comment_len) = EOCD.unpack_from(tail, eocd_pos)
+        if disk != 0 or cd_disk != 0 or total_entries == 0xFFFF or cd_offset == 0xFFFFFFFF:
+            raise ApkZipError("Multi-disk and ZIP64 archives are not supported")
+
+        self.eocd_offset = file_size - tail_size + eocd_pos
+        self.cd_offset = cd_offset
+        self.cd_size = cd_size
+        self.comment = tail[eocd_pos + EOCD.size:eocd_pos + EOCD.size + comment_len]
+
+        self.file.seek(cd_offset)
+        cd = self.file.read(cd_size)
+        pos = 0
+        for _ in range(total_entries):
+            fields = CENTRAL_HEADER.unpack_from(cd, pos)
+            if fields[0] != CENTRAL_HEADER_SIG:
+                raise ApkZipError(f"Corrupt central directory at entry {len(self.entries)}")
+            name_len, extra_len, comment_len = fields[10], fields[11], fields[12]
+            pos += CENTRAL_HEADER.size
+            raw_name = cd[pos:pos + name_len]
+            flags = fields[3]
+            entry = ZipEntry(raw_name.decode("utf-8" if flags & 0x800 else "cp437"), raw_name)
+            entry.version_made, entry.version_needed, entry.flags, entry.method = fields[1:5]
+            entry.mod_time, entry.mod_date, entry.crc = fields[5:8]
+            entry.compressed_size, entry.size = fields[8], fields[9]
+            entry.internal_attr, entry.external_attr, entry.header_offset = fields[14], fields[15], fields[16]
+            entry.extra = cd[pos + name_len:pos + name_len + extra_len]
+            entry.comment = cd[pos + name_len + extra_len:pos + name_len + extra_len + comment_len]
+            pos += name_len + extra_len + comment_len
+            self.entries.append(entry)
+
+    # --- reading ----------------------------------------------------------
+
+    def names(self) -> List[str]:
+        return [e.name for e in self.entries]
+
+    def local_header(self, entry: ZipEntry):
+        """Returns (local_extra, data_offset) for an entry of the source archive."""
+        self.file.seek(entry.header_offset)
+        fields = LOCAL_HEADER.unpack(self.file.read(LOCAL_HEADER.size))
+        if fields[0] != LOCAL_HEADER_SIG:
+            raise ApkZipError(f"Corrupt local header for {entry.name}")
+        name_len, extra_len = fields[9], fields[10]
+        self.file.seek(entry.header_offset + LOCAL_HEADER.size + name_len)
+        extra = self.file.read(extra_len)
+        return extra, entry.header_offset + LOCAL_HEADER.size + name_len + extra_len
+
+    def read(self, name: str) -> bytes:
+        entry = self.by_name.get(name)
+        if entry is None:
+            raise KeyError(name)
+        _, data_offset = self.local_header(entry)
+        self.file.seek(data_offset)
+        payload = self.file.read(entry.compressed_size)
+        if entry.method == STORED:
+            return payload
+        if entry.method == DEFLATED:
+            return zlib.decompress(payload, -15)
+        raise ApkZipError(f"Unsupported compression method {entry.method} for {name}")
+
+    def is_aligned(self) -> bool:
+        for entry in self.entries:
+            boundary = alignment_for(entry.name, entry.method)
+            if boundary and self.local_header(entry)[1] % boundary:
+                return False
+        return True
+
+    # --- writing ----------------------------------------------------------
+
+    @staticmethod
+    def _compress(data: bytes, method: int) -> bytes:
+        if method == STORED:
+            return data
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+
+    @staticmethod
+    def _dos_time(timestamp: float):
+        t = time.localtime(timestamp)
+        mod_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+        mod_date = ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+        return mod_time, mod_date
+
+    def _with_data(self, entry: ZipEntry, data: bytes, method: int) -> ZipEntry:
+        entry.method = method
+        entry.data = self._compress(data, method)
+        entry.crc = zlib.crc32(data) & 0xFFFFFFFF
+        entry.size = len(data)
+        entry.compressed_size = len(entry.data)
+        entry.flags &= ~DATA_DESCRIPTOR_FLAG
+        return entry
+
+    def _new_entry(self, name: str, data: bytes) -> ZipEntry:
+        raw_name = name.encode("utf-8")
+        entry = ZipEntry(name, raw_name)
+        entry.version_made, entry.version_needed = 20, 20
+        entry.flags = 0x800 if raw_name != name.encode("ascii", errors="ignore") else 0
+        entry.mod_time, entry.mod_date = self._dos_time(time.time())
+        entry.extra, entry.comment = b"", b""
+        entry.internal_attr, entry.external_attr = 0, 0
+        entry.header_offset = 0
+        method = STORED if name.lower().endswith(STORED_EXTENSIONS) else DEFLATED
+        return self._with_data(entry, data, method)
+
+    @staticmethod
+    def _aligned_extra(extra: bytes, header_end: int, boundary: int) -> bytes:
+        """Local extra field with old padding dropped and an alignment record sized so
+        the entry data starts on `boundary`."""
+        kept = bytearray()
+        pos = 0
+        while pos + 4 <= len(extra):
+            header_id, size = struct.unpack_from("<HH", extra, pos)
+            if pos + 4 + size > len(extra):
+                break
+            if header_id not in (0, ALIGNMENT_EXTRA_ID):
+                kept += extra[pos:pos + 4 + size]
+            pos += 4 + size
+        padding = -(header_end + len(kept) + 6) % boundary
+        return bytes(kept) + struct.pack("<HHH", ALIGNMENT_EXTRA_ID, 2 + padding, boundary) + b"\x00" * padding
+
+    def rewrite(self, output: Path, replace: Optional[Dict[str, bytes]] = None,
+                add: Optional[Dict[str, bytes]] = None,
+                remove: Optional[Callable[[str], bool]] = None, align: bool = False) -> int:
+        """
+        Writes a copy of the archive to `output`, replacing or adding entries and dropping
+        those `remove(name)` selects. Replaced entries keep their compression method.
+        With `align` the output is zipaligned on the way. Returns the number of entries written.
+        """
+        replace = replace or {}
+        add = dict(add or {})
+        planned = []
+        for entry in self.entries:
+            if remove is not None and remove(entry.name):
+                continue
+            if entry.name in replace:
+                copy = ZipEntry(entry.name, entry.raw_name)
+                for slot in ZipEntry.__slots__[2:]:
+                    setattr(copy, slot, getattr(entry, slot))
+                planned.append((entry, self._with_data(copy, replace[entry.name], entry.method)))
+            else:
+                planned.append((entry, None))
+            add.pop(entry.name, None)
+        for name, data in add.items():
+            planned.append((None, self._new_entry(name, data)))
+
+        written = []
+        with open(output, "wb") as out:
+            for source, new in planned:
+                entry = new or source
+                if new is None:
+                    local_extra, data_offset = self.local_header(source)
+                else:
+                    local_extra, data_offset = (self.local_header(source)[0] if source else b""), None
+                offset = out.tell()
+                boundary = alignment_for(entry.name, entry.method) if align else 0
+                if boundary:
+                    local_extra = self._aligned_extra(
+                        local_extra, offset + LOCAL_HEADER.size + len(entry.raw_name), boundary)
+                out.write(LOCAL_HEADER.pack(
+                    LOCAL_HEADER_SIG, entry.version_needed, entry.flags & ~DATA_DESCRIPTOR_FLAG,
+                    entry.method, entry.mod_time, entry.mod_date, entry.crc,
+                    entry.compressed_size, entry.size, len(entry.raw_name), len(local_extra)))
+                out.write(entry.raw_name)
+                out.write(local_extra)
+                if new is None:
+                    self._copy_payload(out, data_offset, entry.compressed_size)
+                else:
+                    out.write(entry.data)
+                written.append((entry, offset))
+
+            cd_offset = out.tell()
+            for entry, offset in written:
+                out.write(CENTRAL_HEADER.pack(
+                    CENTRAL_HEADER_SIG, entry.version_made, entry.version_needed,
+                    entry.flags & ~DATA_DESCRIPTOR_FLAG, entry.method, entry.mod_time, entry.mod_date,
+                    entry.crc, entry.compressed_size, entry.size, len(entry.raw_name), len(entry.extra),
+                    len(entry.comment), 0, entry.internal_attr, entry.external_attr, offset))
+                out.write(entry.raw_name)
+                out.write(entry.extra)
+                out.write(entry.comment)
+            cd_size = out.tell() - cd_offset
+            out.write(EOCD.pack(EOCD_SIG, 0, 0, len(written), len(written), cd_size, cd_offset,
+                                len(self.comment)))
+            out.write(self.comment)
+        return len(written)
+
+    def _copy_payload(self, out, data_offset: int, size: int):
+        self.file.seek(data_offset)
+        remaining = size
+        while remaining > 0:
+            chunk = self.file.read(min(COPY_CHUNK, remaining))
+            if not chunk:
+                raise ApkZipError("Unexpected end of archive while copying entry data")
+            out.write(chunk)
+            remaining -= len(chunk)
+
+
+def alignment_for(name: str, method: int) -> int:
+    """Boundary a zipaligned entry's data must start on, 0 for compressed entries."""
+    if method != STORED:
+        return 0
+    return SO_ALIGNMENT if name.endswith(".so") else ALIGNMENT
+
+
+def zipalign(input_apk: Path, output_apk: Path, consume_input: bool = False) -> bool:
+    """
+    In-process zipalign: pads stored entries through the local extra field and copies
+    every payload as-is. An input that is already aligned is moved (`consume_input`)
+    or copied into place instead. Returns True when the archive had to be rewritten.
+    """
+    with ApkZip(input_apk) as apk:
+        if not apk.is_aligned():
+            apk.rewrite(output_apk, align=True)
+            return True
+    if consume_input:
+        os.replace(input_apk, output_apk)
+    else:
+        shutil.copyfile(input_apk, output_apk)
+    return False
+
+
+def zipalign_with_fallback(input_apk: Path, output_apk: Path, consume_input: bool = False) -> bool:
+    """
+    zipalign() in-process; the external zipalign binary (APK_Z) is only used for archives
+    ApkZip cannot read. Returns True when the archive had to be rewritten.
+    """
+    try:
+        return zipalign(input_apk, output_apk, consume_input=consume_input)
+    except ApkZipError as e:
+        print(f"[Zipalign] {e} — using the zipalign binary")
+    zipalign_path = os.getenv("APK_Z", "zipalign")
+    result = subprocess.run([zipalign_path, "-f", "4", str(input_apk), str(output_apk)],
+                            capture_output=True, text=True)
+    if result.returncode != 0 or not output_apk.exists():
+        raise Exception(f"zipalign failed: {result.stderr}")
+    return True
+
+
+def is_signature_file(name: str) -> bool:
+    """JAR (v1) signature entries that must not survive a re-sign."""
+    upper = name.upper()
+    if not upper.startswith("META-INF/") or upper.count("/") != 1:
+        return False
+    return upper == "META-INF/MANIFEST.MF" or upper.endswith((".SF", ".RSA", ".DSA", ".EC"))
@@ -0,0 +1,97 @@
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+
+/**
+ * Long-lived apktool worker driven by APKToolDaemon.py.
+ *
+ * Protocol (stdin/stdout, UTF-8, one command per line):
+ *   request  : apktool arguments separated by TAB, e.g. "d\tin.apk\t-o\tout\t--force"
+ *   response : captured apktool output followed by "@@APKTOOL_WORKER_DONE <exit_code>"
+ *   "QUIT" ends the worker. "@@APKTOOL_WORKER_DONE READY" is printed once the
+ *   apktool classes are loaded.
+ */
+public class ApktoolWorker {
+    private static final String DONE = "@@APKTOOL_WORKER_DONE";
+
+    private static final class ExitTrap extends SecurityException {
+        final int status;
+
+        ExitTrap(int status) {
+            super("System.exit(" + status + ")");
+            this.status = status;
+        }
+    }
+
+    @SuppressWarnings("removal")
+    private static void installExitTrap() {
+        // apktool calls System.exit() on most failures; without a SecurityManager
+        // (JDK 24+) the exit ends this worker and the Python pool respawns it.
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkExit(int status) {
+                    throw new ExitTrap(status);
+                }
+
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkPermission(Permission perm, Object context) {
+                }
+            });
+        } catch (Throwable ignored) {
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+
+        Class.forName("brut.apktool.Main");
+        installExitTrap();
+        out.println(DONE + " READY");
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            if (line.isEmpty()) {
+                continue;
+            }
+            if (line.equals("QUIT")) {
+                break;
+            }
+
+            ByteArrayOutputStream buffer = new ByteArrayOutputStream();
+            PrintStream capture = new PrintStream(buffer, true, "UTF-8");
+            PrintStream originalOut = System.out;
+            PrintStream originalErr = System.err;
+            System.setOut(capture);
+            System.setErr(capture);
+
+            int code = 0;
+            try {
+                brut.apktool.Main.main(line.split("\t"));
+            } catch (ExitTrap e) {
+                code = e.status;
+            } catch (Throwable t) {
+                t.printStackTrace(capture);
+                code = 1;
+            } finally {
+                System.setOut(originalOut);
+                System.setErr(originalErr);
+                capture.flush();
+            }
+
+            out.write(buffer.toByteArray());
+            out.println();
+            out.println(DONE + " " + code);
+        }
+    }
+}
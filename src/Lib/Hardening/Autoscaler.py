@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class ConcurrencyLimit:
+    """
+    Resizable counting limit shared by everything that runs hardening jobs. Blocking
+    callers use acquire()/release(); the stage pipeline uses try_acquire() and registers
+    a listener so it can admit queued jobs whenever a slot frees up or the limit grows.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self.cond = threading.Condition()
+        self.listeners: List[Callable[[], None]] = []
+
+    def try_acquire(self) -> bool:
+        with self.cond:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit:
+                self.cond.wait()
+            self.active += 1
+
+    def release(self, wake_listeners: bool = True):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+        if wake_listeners:
+            self._notify_listeners()
+
+    def resize(self, limit: int):
+        with self.cond:
+            grew = limit > self.limit
+            self.limit = max(1, limit)
+            self.cond.notify_all()
+        if grew:
+            self._notify_listeners()
+
+    def _notify_listeners(self):
+        for listener in list(self.listeners):
+            listener()
+
+
+def _read_meminfo() -> Dict[str, int]:
+    values = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            name, rest = line.split(":", 1)
+            values[name] = int(rest.split()[0]) * 1024
+    return values
+
+
+def _child_java_rss(root_pid: int) -> Tuple[int, int]:
+    """(count, total RSS bytes) of java processes descending from `root_pid`."""
+    parents, names = {}, {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        comm_end = stat.rfind(")")
+        names[int(entry)] = stat[stat.find("(") + 1:comm_end]
+        parents[int(entry)] = int(stat[comm_end + 2:].split()[1])
+
+    def descends(pid: int) -> bool:
+        seen = 0
+        while pid > 1 and seen < 64:
+            pid = parents.get(pid, 0)
+            if pid == root_pid:
+                return True
+            seen += 1
+        return False
+
+    count = total = 0
+    page = os.sysconf("SC_PAGE_SIZE")
+    for pid, name in names.items():
+        if name != "java" or not descends(pid):
+            continue
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page
+            count += 1
+        except (OSError, ValueError, IndexError):
+            continue
+    return count, total
+
+
+class Autoscaler:
+    """
+    Periodically samples host load (loadavg per CPU), MemAvailable and the RSS of our
+    java children, and moves a ConcurrencyLimit between `min_jobs` and `max_jobs`: one
+    step down when the host is overloaded or memory is short, one step up when there is
+    queued work, CPU headroom and room for another job's JVM. Changes are rate-limited by
+    `cooldown` and the recent decisions are kept for /metrics.
+    """
+
+    def __init__(self, limit: ConcurrencyLimit, min_jobs: int = 1, max_jobs: int = 10, interval: float = 5.0,
+                 cooldown: float = 30.0, high_load: float = 1.5, low_load: float = 0.7,
+                 min_free_mb: int = 1024, job_rss_mb: int = 1024,
+                 backlog: Optional[Callable[[], int]] = None):
+        self.limit = limit
+        self.min_jobs = max(1, min_jobs)
+        self.max_jobs = max(self.min_jobs, max_jobs)
+        self.interval = interval
+        self.cooldown = cooldown
+        self.high_load = high_load
+        self.low_load = low_load
+        self.min_free = min_free_mb * 1024 * 1024
+        self.job_rss = job_rss_mb * 1024 * 1024  # estimate until a JVM has been observed
+        self.backlog = backlog or (lambda: 0)
+        self.cpus = os.cpu_count() or 1
+
+        self.lock = threading.Lock()
+        self.last_sample: dict = {}
+        self.last_change = 0.0
+        self.decisions = deque(maxlen=50)
+
+        self.limit.resize(min(max(self.limit.limit, self.min_jobs), self.max_jobs))
+        self.stopped = threading.Event()
+        threading.Thread(target=self._loop, name="autoscaler", daemon=True).start()
+
+    def sample(self) -> dict:
+        load1 = os.getloadavg()[0]
+        meminfo = _read_meminfo()
+        java_count, java_rss = _child_java_rss(os.getpid())
+        if java_count:
+            # running average of one job's JVM footprint
+            self.job_rss = int(0.7 * self.job_rss + 0.3 * (java_rss / java_count))
+        return {
+            "load_per_cpu": round(load1 / self.cpus, 2),
+            "mem_available_mb": meminfo.get("MemAvailable", meminfo.get("MemFree", 0)) // 1048576,
+            "java_processes": java_count,
+            "java_rss_mb": java_rss // 1048576,
+            "job_rss_estimate_mb": self.job_rss // 1048576,
+            "active_jobs": self.limit.active,
+            "backlog": self.backlog(),
+        }
+
+    def has_memory_headroom(self) -> bool:
+        """True when another job's JVM still fits above `min_free`; gates the test lane."""
+        meminfo = _read_meminfo()
+        free = meminfo.get("MemAvailable", meminfo.get("MemFree", 0))
+        return free - self.job_rss > self.min_free
+
+    def decide(self, sample: dict) -> Tuple[int, str]:
+        current = self.limit.limit
+        free = sample["mem_available_mb"] * 1048576
+        if free < self.min_free and current > self.min_jobs:
+            return current - 1, f"MemAvailable {sample['mem_available_mb']}MB below {self.min_free // 1048576}MB"
+        if sample["load_per_cpu"] > self.high_load and current > self.min_jobs:
+            return current - 1, f"load/cpu {sample['load_per_cpu']} above {self.high_load}"
+        if (current < self.max_jobs and sample["backlog"] > 0 and sample["active_jobs"] >= current
+                and sample["load_per_cpu"] < self.low_load and free - self.job_rss > self.min_free):
+            return current + 1, (f"backlog {sample['backlog']}, load/cpu {sample['load_per_cpu']}, "
+                                 f"room for another {sample['job_rss_estimate_mb']}MB job")
+        return current, ""
+
+    def _loop(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                sample = self.sample()
+                target, reason = self.decide(sample)
+                with self.lock:
+                    self.last_sample = sample
+                    now = time.monotonic()
+                    if target == self.limit.limit or now - self.last_change < self.cooldown:
+                        continue
+                    self.last_change = now
+                    self.decisions.append({"at": time.time(), "from": self.limit.limit, "to": target,
+                                           "reason": reason})
+                print(f"[Autoscaler] Concurrency {self.limit.limit} → {target}: {reason}")
+                self.limit.resize(target)
+            except Exception as e:
+                print(f"[Autoscaler] Sample failed: {e}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "concurrency": self.limit.limit,
+                "active_jobs": self.limit.active,
+                "min_jobs": self.min_jobs,
+                "max_jobs": self.max_jobs,
+                "last_sample": dict(self.last_sample),
+                "decisions": list(self.decisions),
+            }
+
+    def shutdown(self):
+        self.stopped.set()
@@ -0,0 +1,321 @@
+import struct
+from typing import Dict, List, Optional
+
+from src.Lib.Hardening.ResStringPool import MALFORMED_CHUNK_ERRORS, ResStringPool, RES_STRING_POOL_TYPE
+
+RES_XML_TYPE = 0x0003
+RES_XML_START_NAMESPACE_TYPE = 0x0100
+RES_XML_END_NAMESPACE_TYPE = 0x0101
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_END_ELEMENT_TYPE = 0x0103
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+
+TYPE_REFERENCE = 0x01
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_BOOLEAN = 0x12
+
+NO_INDEX = 0xFFFFFFFF
+ANDROID_NS = "http://schemas.android.com/apk/res/android"
+
+# android:* attribute resource ids; compiled (and obfuscated) manifests are matched by id first
+ANDROID_ATTR_IDS = {
+    "label": 0x01010001,
+    "name": 0x01010003,
+    "debuggable": 0x0101000F,
+    "value": 0x01010024,
+    "targetActivity": 0x01010202,
+    "versionCode": 0x0101021B,
+    "versionName": 0x0101021C,
+    "minSdkVersion": 0x0101020C,
+    "manageSpaceActivity": 0x01010004,
+    "backupAgent": 0x0101027F,
+    "allowBackup": 0x01010280,
+    "fullBackupContent": 0x010104EB,
+    "networkSecurityConfig": 0x01010527,
+}
+
+# attributes holding class names that are resolved against the manifest package
+CLASS_NAME_ATTRS = {
+    "application": ("name", "backupAgent", "manageSpaceActivity"),
+    "activity": ("name",),
+    "activity-alias": ("name", "targetActivity"),
+    "service": ("name",),
+    "receiver": ("name",),
+    "provider": ("name",),
+    "instrumentation": ("name",),
+}
+
+
+class BinaryManifestError(Exception):
+    pass
+
+
+class XmlAttribute:
+    __slots__ = ("ns", "name", "raw", "data_type", "data")
+
+    def __init__(self, ns: int, name: int, raw: int, data_type: int, data: int):
+        self.ns = ns
+        self.name = name
+        self.raw = raw
+        self.data_type = data_type
+        self.data = data
+
+
+class XmlElement:
+    def __init__(self, tag: str, ns: int, name: int, line: int, comment: int,
+                 attributes: List[XmlAttribute], id_index: int, class_index: int, style_index: int):
+        self.tag = tag
+        self.ns = ns
+        self.name = name
+        self.line = line
+        self.comment = comment
+        self.attributes = attributes
+        self.id_index = id_index
+        self.class_index = class_index
+        self.style_index = style_index
+        self.parent: Optional["XmlElement"] = None
+        self.children: List["XmlElement"] = []
+        self.removed = False
+
+    def iter(self, tag: Optional[str] = None):
+        if tag is None or self.tag == tag:
+            yield self
+        for child in self.children:
+            if not child.removed:
+                yield from child.iter(tag)
+
+    def findall(self, tag: str) -> List["XmlElement"]:
+        return [c for c in self.children if c.tag == tag and not c.removed]
+
+    def find(self, tag: str) -> Optional["XmlElement"]:
+        found = self.findall(tag)
+        return found[0] if found else None
+
+
+class BinaryManifest:
+    """
+    Reader/writer for a compiled (binary AXML) AndroidManifest.xml, enough to apply
+    the hardening edits without an apktool round-trip: attribute get/set/remove,
+    element removal and the package rename.
+    """
+
+    def __init__(self, data: bytes):
+        try:
+            self._parse(data)
+        except MALFORMED_CHUNK_ERRORS as e:
+            raise BinaryManifestError(f"Malformed binary manifest: {e!r}") from e
+
+    def _parse(self, data: bytes):
+        chunk_type, header_size, file_size = struct.unpack_from("<HHI", data, 0)
+        if chunk_type != RES_XML_TYPE:
+            raise BinaryManifestError("Not a binary XML document")
+        self.header = data[:header_size]
+
+        self.pool: Optional[ResStringPool] = None
+        self.resource_ids: List[int] = []
+        self.events = []  # (chunk_type, payload) in document order
+        self.root: Optional[XmlElement] = None
+
+        stack: List[XmlElement] = []
+        pos = header_size
+        end = min(file_size, len(data))
+        while pos + 8 <= end:
+            c_type, c_header, c_size = struct.unpack_from("<HHI", data, pos)
+            if c_size < 8:
+                raise BinaryManifestError(f"Corrupt chunk at {pos}")
+            if pos + c_size > len(data):
+                raise BinaryManifestError(f"Truncated chunk at {pos}")
+            if c_type == RES_STRING_POOL_TYPE:
+                self.pool = ResStringPool(data, pos)
+            elif c_type == RES_XML_RESOURCE_MAP_TYPE:
+                count = (c_size - c_header) // 4
+                self.resource_ids = list(struct.unpack_from(f"<{count}I", data, pos + c_header))
+            elif c_type == RES_XML_START_ELEMENT_TYPE:
+                element = self._parse_element(data, pos, c_header)
+                if stack:
+                    element.parent = stack[-1]
+                    stack[-1].children.append(element)
+                elif self.root is None:
+                    self.root = element
+                stack.append(element)
+                self.events.append((c_type, element))
+            elif c_type == RES_XML_END_ELEMENT_TYPE:
+                if stack:
+                    stack.pop()
+                self.events.append((c_type, data[pos:pos + c_size]))
+            else:
+                self.events.append((c_type, data[pos:pos + c_size]))
+            pos += c_size
+
+        if self.pool is None or self.root is None:
+            raise BinaryManifestError("Binary manifest has no string pool or root element")
+
+    def _parse_element(self, data: bytes, pos: int, header_size: int) -> XmlElement:
+        line, comment = struct.unpack_from("<II", data, pos + 8)
+        ext = pos + header_size
+        ns, name, attr_start, attr_size, attr_count, id_index, class_index, style_index = struct.unpack_from(
+            "<IIHHHHHH", data, ext)
+        attributes = []
+        for i in range(attr_count):
+            a_ns, a_name, a_raw, _, _, a_type, a_data = struct.unpack_from(
+                "<IIIHBBI", data, ext + attr_start + i * attr_size)
+            attributes.append(XmlAttribute(a_ns, a_name, a_raw, a_type, a_data))
+        tag = self.pool.get(name) if self.pool else None
+        return XmlElement(tag or "", ns, name, line, comment, attributes, id_index, class_index, style_index)
+
+    # --- attribute access ------------------------------------------------
+
+    def _matches(self, attr: XmlAttribute, name: str, android: bool) -> bool:
+        if android:
+            resource_id = ANDROID_ATTR_IDS.get(name)
+            if resource_id is not None and attr.name < len(self.resource_ids):
+                return self.resource_ids[attr.name] == resource_id
+            if attr.ns == NO_INDEX or self.pool.get(attr.ns) != ANDROID_NS:
+                return False
+        elif attr.ns != NO_INDEX:
+            return False
+        return self.pool.get(attr.name) == name
+
+    def _find_attr(self, element: XmlElement, name: str, android: bool = True) -> Optional[XmlAttribute]:
+        for attr in element.attributes:
+            if self._matches(attr, name, android):
+                return attr
+        return None
+
+    def get_attr(self, element: XmlElement, name: str, android: bool = True):
+        """Returns a str for string values, an int for integer/boolean values, or
+        '@0x7f......' for resource references."""
+        attr = self._find_attr(element, name, android)
+        if attr is None:
+            return None
+        if attr.data_type == TYPE_STRING:
+            return self.pool.get(attr.data)
+        if attr.data_type == TYPE_REFERENCE:
+            return f"@0x{attr.data:08x}"
+        if attr.raw != NO_INDEX:
+            return self.pool.get(attr.raw)
+        return attr.data
+
+    def get_reference(self, element: XmlElement, name: str, android: bool = True) -> Optional[int]:
+        attr = self._find_attr(element, name, android)
+        if attr is not None and attr.data_type == TYPE_REFERENCE:
+            return attr.data
+        return None
+
+    def set_string_attr(self, element: XmlElement, name: str, value: str, android: bool = True) -> bool:
+        attr = self._find_attr(element, name, android)
+        if attr is None:
+            return False
+        index = self.pool.add(value, start=len(self.resource_ids))
+        attr.raw = index
+        attr.data_type = TYPE_STRING
+        attr.data = index
+        return True
+
+    def set_int_attr(self, element: XmlElement, name: str, value: int, android: bool = True) -> bool:
+        attr = self._find_attr(element, name, android)
+        if attr is None:
+            return False
+        attr.raw = NO_INDEX
+        attr.data_type = TYPE_INT_DEC
+        attr.data = value & 0xFFFFFFFF
+        return True
+
+    def remove_attr(self, element: XmlElement, name: str, android: bool = True) -> bool:
+        attr = self._find_attr(element, name, android)
+        if attr is None:
+            return False
+        position = element.attributes.index(attr) + 1
+
+        def shift(index: int) -> int:
+            if index == position:
+                return 0
+            return index - 1 if index > position else index
+
+        element.attributes.remove(attr)
+        element.id_index = shift(element.id_index)
+        element.class_index = shift(element.class_index)
+        element.style_index = shift(element.style_index)
+        return True
+
+    def remove_element(self, element: XmlElement):
+        element.removed = True
+
+    # --- manifest helpers -------------------------------------------------
+
+    @property
+    def package(self) -> Optional[str]:
+        return self.get_attr(self.root, "package", android=False)
+
+    def launcher_components(self) -> List[XmlElement]:
+        launchers = []
+        for elem in list(self.root.iter("activity")) + list(self.root.iter("activity-alias")):
+            for intent in elem.iter("intent-filter"):
+                actions = [self.get_attr(a, "name") for a in intent.findall("action")]
+                categories = [self.get_attr(c, "name") for c in intent.findall("category")]
+                if "android.intent.action.MAIN" in actions and "android.intent.category.LAUNCHER" in categories:
+                    launchers.append(elem)
+        return launchers
+
+    def rename_package(self, new_package: str):
+        """Sets the manifest package, first expanding relative class names against the old one."""
+        old_package = self.package
+        if not old_package or old_package == new_package:
+            return
+        for tag, attr_names in CLASS_NAME_ATTRS.items():
+            for element in self.root.iter(tag):
+                for attr_name in attr_names:
+                    value = self.get_attr(element, attr_name)
+                    if not isinstance(value, str) or value.startswith("@"):
+                        continue
+                    if value.startswith("."):
+                        self.set_string_attr(element, attr_name, old_package + value)
+                    elif "." not in value:
+                        self.set_string_attr(element, attr_name, f"{old_package}.{value}")
+        if not self.set_string_attr(self.root, "package", new_package, android=False):
+            raise BinaryManifestError("Manifest has no package attribute")
+
+    # --- serialization ----------------------------------------------------
+
+    def _element_bytes(self, element: XmlElement) -> bytes:
+        attr_bytes = b"".join(
+            struct.pack("<IIIHBBI", a.ns, a.name, a.raw, 8, 0, a.data_type, a.data)
+            for a in element.attributes)
+        ext = struct.pack("<IIHHHHHH", element.ns, element.name, 20, 20, len(element.attributes),
+                          element.id_index, element.class_index, element.style_index)
+        size = 16 + len(ext) + len(attr_bytes)
+        return struct.pack("<HHIII", RES_XML_START_ELEMENT_TYPE, 16, size, element.line, element.comment) + ext + attr_bytes
+
+    def to_bytes(self) -> bytes:
+        body = [self.pool.to_bytes()]
+        if self.resource_ids:
+            body.append(struct.pack("<HHI", RES_XML_RESOURCE_MAP_TYPE, 8, 8 + 4 * len(self.resource_ids))
+                        + struct.pack(f"<{len(self.resource_ids)}I", *self.resource_ids))
+
+        skip_depth = 0
+        for chunk_type, payload in self.events:
+            if chunk_type == RES_XML_START_ELEMENT_TYPE:
+                if skip_depth or payload.removed:
+                    skip_depth += 1
+                    continue
+                body.append(self._element_bytes(payload))
+            elif chunk_type == RES_XML_END_ELEMENT_TYPE:
+                if skip_depth:
+                    skip_depth -= 1
+                    continue
+                body.append(payload)
+            elif not skip_depth:
+                body.append(payload)
+
+        content = b"".join(body)
+        header = bytearray(self.header)
+        struct.pack_into("<HHI", header, 0, RES_XML_TYPE, len(header), len(header) + len(content))
+        return bytes(header) + content
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            "package": self.package,
+            "versionCode": self.get_attr(self.root, "versionCode"),
+            "versionName": self.get_attr(self.root, "versionName"),
+        }
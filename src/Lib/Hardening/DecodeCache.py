@@ -0,0 +1,247 @@
+import errno
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+FICLONE = 0x40049409
+SIZE_MARKER = ".cache_size"
+
+
+class DecodeCache:
+    """
+    Content-addressed cache of pristine `apktool d` trees keyed by the source APK SHA-256.
+    Jobs get a copy-on-write clone (reflink, else hardlinks) instead of a fresh decompile;
+    anything written in place inside a clone must go through `detach()` first. A
+    workspace on another filesystem (tmpfs) can decode in place on a miss and the cache
+    is filled from it, so the tree never crosses filesystems twice.
+    Entries are evicted least-recently-used once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.key_locks: Dict[str, threading.Lock] = {}
+        self.in_use: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.reflink = fcntl is not None
+
+        self._load()
+
+    def _load(self):
+        found = []
+        for entry in self.cache_dir.iterdir():
+            if entry.name.startswith("."):
+                shutil.rmtree(entry, ignore_errors=True)
+                continue
+            marker = entry / SIZE_MARKER
+            if not marker.exists():
+                shutil.rmtree(entry, ignore_errors=True)
+                continue
+            try:
+                found.append((marker.stat().st_mtime, entry.name, int(marker.read_text())))
+            except (OSError, ValueError):
+                shutil.rmtree(entry, ignore_errors=True)
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+        print(f"[DecodeCache] Loaded {len(self.entries)} entries ({self.total_bytes() / 1048576:.1f} MB)")
+
+    @staticmethod
+    def sha256_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def detach(path: Path) -> Path:
+        """Breaks a hardlink shared with the cache so `path` can be rewritten in place."""
+        try:
+            if os.stat(path).st_nlink > 1:
+                private = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+                shutil.copy2(path, private)
+                os.replace(private, path)
+        except FileNotFoundError:
+            pass
+        return path
+
+    def contains(self, key: str) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def total_bytes(self) -> int:
+        return sum(self.entries.values())
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes(),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def checkout(self, key: str, dest_dir: Path, populate: Callable[[Path], None], in_place: bool = False) -> bool:
+        """
+        Fills `dest_dir` with the cached tree for `key`, calling `populate(staging_dir)`
+        on a miss to produce it — or `populate(dest_dir)` with `in_place`, copying the
+        result into the cache. Returns True on a cache hit.
+        """
+        entry_dir = self.cache_dir / key
+        with self._key_lock(key):
+            with self.lock:
+                hit = key in self.entries
+                if hit:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                self.in_use[key] = self.in_use.get(key, 0) + 1
+
+            try:
+                if not hit and in_place:
+                    if dest_dir.exists():
+                        shutil.rmtree(dest_dir)
+                    populate(dest_dir)
+                    self._store(key, dest_dir)
+                elif not hit:
+                    staging = self.cache_dir / f".staging-{uuid.uuid4().hex}"
+                    try:
+                        populate(staging)
+                        size = self._tree_size(staging)
+                        (staging / SIZE_MARKER).write_text(str(size))
+                        os.replace(staging, entry_dir)
+                    except Exception:
+                        shutil.rmtree(staging, ignore_errors=True)
+                        raise
+                    with self.lock:
+                        self.entries[key] = size
+                else:
+                    os.utime(entry_dir / SIZE_MARKER)
+            except Exception:
+                self._release(key)
+                raise
+
+        try:
+            if not hit and in_place:
+                return hit
+            if dest_dir.exists():
+                shutil.rmtree(dest_dir)
+            self._clone_tree(entry_dir, dest_dir)
+        finally:
+            self._release(key)
+            self._evict()
+        return hit
+
+    def _store(self, key: str, tree: Path):
+        """Copies a freshly decoded `tree` into the cache; a failure only costs the cache entry."""
+        start = time.perf_counter()
+        staging = self.cache_dir / f".staging-{uuid.uuid4().hex}"
+        try:
+            shutil.copytree(tree, staging, symlinks=True)
+            size = self._tree_size(staging)
+            (staging / SIZE_MARKER).write_text(str(size))
+            os.replace(staging, self.cache_dir / key)
+        except OSError as e:
+            shutil.rmtree(staging, ignore_errors=True)
+            print(f"[DecodeCache] Could not cache {key[:12]}: {e}")
+            return
+        with self.lock:
+            self.entries[key] = size
+        print(f"[DecodeCache] Stored {key[:12]} in {time.perf_counter() - start:.2f}s")
+
+    def _release(self, key: str):
+        with self.lock:
+            self.in_use[key] -= 1
+            if self.in_use[key] <= 0:
+                del self.in_use[key]
+
+    def _evict(self):
+        victims = []
+        with self.lock:
+            total = self.total_bytes()
+            for key in list(self.entries):
+                if total <= self.max_bytes:
+                    break
+                if key in self.in_use:
+                    continue
+                total -= self.entries.pop(key)
+                self.key_locks.pop(key, None)
+                victims.append(key)
+        for key in victims:
+            # rename first so a concurrent checkout never sees a half-deleted tree
+            doomed = self.cache_dir / f".evicted-{key}-{uuid.uuid4().hex}"
+            try:
+                os.replace(self.cache_dir / key, doomed)
+            except OSError:
+                continue
+            shutil.rmtree(doomed, ignore_errors=True)
+            print(f"[DecodeCache] Evicted {key[:12]}")
+
+    @staticmethod
+    def _tree_size(root: Path) -> int:
+        total = 0
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def _clone_file(self, src: str, dst: str, same_device: bool):
+        if not same_device:
+            shutil.copy2(src, dst)  # neither a reflink nor a hardlink can cross filesystems
+            return
+        if self.reflink:
+            try:
+                with open(src, "rb") as s, open(dst, "wb") as d:
+                    fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+                shutil.copystat(src, dst)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EBADF):
+                    raise
+                os.unlink(dst)
+                if e.errno != errno.EXDEV:
+                    self.reflink = False  # the cache's filesystem has no reflinks
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    def _clone_tree(self, src_root: Path, dest_root: Path):
+        start = time.perf_counter()
+        src_root_str = str(src_root)
+        os.makedirs(dest_root, exist_ok=True)
+        same_device = os.stat(src_root).st_dev == os.stat(dest_root).st_dev
+        for dirpath, dirnames, filenames in os.walk(src_root_str):
+            rel = os.path.relpath(dirpath, src_root_str)
+            target_dir = os.path.join(str(dest_root), rel) if rel != "." else str(dest_root)
+            os.makedirs(target_dir, exist_ok=True)
+            for name in filenames:
+                if rel == "." and name == SIZE_MARKER:
+                    continue
+                self._clone_file(os.path.join(dirpath, name), os.path.join(target_dir, name), same_device)
+        print(f"[DecodeCache] {'Cloned' if same_device else 'Copied'} {src_root.name[:12]} "
+              f"in {time.perf_counter() - start:.2f}s")
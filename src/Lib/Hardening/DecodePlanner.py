@@ -0,0 +1,97 @@
+import os
+from typing import FrozenSet, Optional
+
+from src.Lib.Hardening.Job import Job
+
+
+class DecodePlan:
+    """The apktool decode mode chosen for a job and the edit steps that will run against it."""
+
+    BINARY = "binary"
+    NO_SRC = "no_src"
+    MAIN_CLASSES = "main_classes"
+    FULL = "full"
+
+    FLAGS = {
+        BINARY: [],
+        NO_SRC: ["-s"],
+        MAIN_CLASSES: ["--only-main-classes"],
+        FULL: [],
+    }
+
+    def __init__(self, mode: str, steps: FrozenSet[str]):
+        self.mode = mode
+        self.steps = steps
+
+    @property
+    def flags(self) -> list:
+        return list(self.FLAGS[self.mode])
+
+    @property
+    def decodes_sources(self) -> bool:
+        return self.mode not in (self.BINARY, self.NO_SRC)
+
+    def fallback(self) -> "DecodePlan":
+        """Plan to use when the binary patch cannot handle this APK."""
+        return DecodePlan(self.NO_SRC, self.steps)
+
+    def enabled(self, step: str) -> bool:
+        return step in self.steps
+
+    def __repr__(self):
+        return f"DecodePlan(mode={self.mode}, steps={sorted(self.steps)})"
+
+
+class DecodePlanner:
+    """
+    Picks the cheapest apktool decode mode that still covers every edit step a job needs.
+    With no smali edits the dex files are copied raw (`-s`), which skips baksmali on
+    decode and smali on build; jobs that only touch the manifest skip apktool entirely
+    and are patched in the compiled manifest (`binary`).
+    """
+
+    # Mode each step needs; steps not listed only touch resources / the manifest.
+    STEP_MODES = {
+        "launcher_hooks": DecodePlan.MAIN_CLASSES,
+    }
+    # Steps that only run when the sources were decoded anyway (never required).
+    OPTIONAL_SMALI_STEPS = {"protection_stub"}
+    RANK = [DecodePlan.BINARY, DecodePlan.NO_SRC, DecodePlan.MAIN_CLASSES, DecodePlan.FULL]
+
+    def __init__(self, forced_mode: Optional[str] = None, binary_patch: Optional[bool] = None):
+        forced_mode = forced_mode or os.getenv("HARDENING_DECODE_MODE") or None
+        if forced_mode and forced_mode not in DecodePlan.FLAGS:
+            print(f"[DecodePlanner] Unknown HARDENING_DECODE_MODE '{forced_mode}' — planning per job")
+            forced_mode = None
+        self.forced_mode = forced_mode
+        if binary_patch is None:
+            binary_patch = os.getenv("HARDENING_BINARY_PATCH", "1") != "0"
+        self.binary_patch = binary_patch
+
+    def binary_supported(self, job: Job) -> bool:
+        return self.binary_patch
+
+    @staticmethod
+    def job_steps(job: Job) -> set:
+        steps = {
+            "cleanup_permissions", "rename_package", "update_display_name",
+            "harden_manifest", "dummy_files", "extract_icon",
+        }
+        if job.app_key and str(job.app_key).strip():
+            steps.add("inject_app_key")
+        if job.op_call_back and job.op_call_back.strip() and job.apk_key and job.apk_key.strip():
+            steps.add("launcher_hooks")
+        return steps
+
+    def plan(self, job: Job) -> DecodePlan:
+        steps = self.job_steps(job)
+        mode = DecodePlan.BINARY if self.binary_supported(job) else DecodePlan.NO_SRC
+        for step in steps:
+            required = self.STEP_MODES.get(step, DecodePlan.BINARY)
+            if self.RANK.index(required) > self.RANK.index(mode):
+                mode = required
+        if self.forced_mode and self.RANK.index(self.forced_mode) > self.RANK.index(mode):
+            mode = self.forced_mode
+        if mode not in (DecodePlan.BINARY, DecodePlan.NO_SRC):
+            steps |= self.OPTIONAL_SMALI_STEPS
+        return DecodePlan(mode, frozenset(steps))
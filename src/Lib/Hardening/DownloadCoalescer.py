@@ -0,0 +1,106 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Tuple
+
+from src.Lib.Hardening.Downloader import Downloader
+
+
+class DownloadCoalescer:
+    """
+    Single-flight layer in front of a Downloader (or SourceCache): concurrent jobs for the same apk_url
+    share one download, and a finished download stays in `shared_dir` for `ttl` seconds
+    so jobs arriving shortly after skip the network. Every job gets its own hardlink to
+    the shared file (a copy across filesystems), so cleanup of one job never affects another.
+    Drop-in for Downloader: same `download()` signature and result, plus `coalesced`/`cache_hit`.
+    """
+
+    def __init__(self, downloader: Downloader, shared_dir: str, ttl: float = 300):
+        self.downloader = downloader
+        self.shared_dir = Path(shared_dir)
+        self.ttl = ttl
+        self.shared_dir.mkdir(parents=True, exist_ok=True)
+        for leftover in self.shared_dir.iterdir():
+            leftover.unlink(missing_ok=True)
+
+        self.lock = threading.Lock()
+        self.inflight: Dict[str, Future] = {}
+        self.completed: Dict[str, Tuple[Path, dict, float]] = {}  # url -> (path, info, expires_at)
+        self.leaders = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def _expire(self, now: float):
+        for url, (path, _, expires_at) in list(self.completed.items()):
+            if expires_at <= now or not path.exists():
+                del self.completed[url]
+                path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _link(shared: Path, save_path: Path):
+        save_path.unlink(missing_ok=True)
+        try:
+            os.link(shared, save_path)
+        except OSError:
+            shutil.copyfile(shared, save_path)
+
+    def download(self, url: str, save_path: Path) -> dict:
+        save_path = Path(save_path)
+        start = time.perf_counter()
+        with self.lock:
+            now = time.monotonic()
+            self._expire(now)
+            cached = self.completed.get(url)
+            if cached is not None:
+                self.cache_hits += 1
+                self._link(cached[0], save_path)
+                return dict(cached[1], seconds=time.perf_counter() - start, coalesced=False, cache_hit=True)
+            future = self.inflight.get(url)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.inflight[url] = future
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            shared, info = future.result()
+            try:
+                self._link(shared, save_path)
+            except FileNotFoundError:
+                return self.download(url, save_path)  # expired before we linked; fetch again
+            return dict(info, seconds=time.perf_counter() - start, coalesced=True, cache_hit=False)
+
+        shared = self.shared_dir / f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}-{uuid.uuid4().hex[:8]}.apk"
+        try:
+            info = self.downloader.download(url, shared)
+            self._link(shared, save_path)
+        except BaseException as e:
+            with self.lock:
+                self.inflight.pop(url, None)
+            shared.unlink(missing_ok=True)
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self.inflight.pop(url, None)
+            previous = self.completed.get(url)
+            if previous is not None:
+                previous[0].unlink(missing_ok=True)
+            self.completed[url] = (shared, info, time.monotonic() + self.ttl)
+        future.set_result((shared, info))
+        return dict(info, coalesced=False, cache_hit=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "downloads": self.leaders,
+                "coalesced": self.coalesced,
+                "ttl_hits": self.cache_hits,
+                "cached_urls": len(self.completed),
+            }
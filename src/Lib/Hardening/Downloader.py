@@ -0,0 +1,345 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CHUNK_SIZE = 1024 * 1024
+CHECKPOINT_BYTES = 8 * 1024 * 1024
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    """A failure worth retrying (dropped connection, short read, 5xx)."""
+
+
+class HostStats:
+    __slots__ = ("downloads", "requests", "bytes", "errors", "seconds", "ttfb_total", "last_mbps")
+
+    def __init__(self):
+        self.downloads = 0
+        self.requests = 0
+        self.bytes = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.ttfb_total = 0.0
+        self.last_mbps = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "downloads": self.downloads,
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "errors": self.errors,
+            "avg_mbps": round(self.bytes / 1048576 / self.seconds, 2) if self.seconds else 0.0,
+            "last_mbps": round(self.last_mbps, 2),
+            "avg_ttfb_ms": round(self.ttfb_total / self.requests * 1000, 1) if self.requests else 0.0,
+        }
+
+
+class Downloader:
+    """
+    HTTP downloader for source APKs: one pooled keep-alive session per host, parallel
+    Range segments for large files, resume of `.part` files after a dropped connection
+    (progress is checkpointed next to the part file), and a SHA-256 of the content
+    computed while the bytes arrive — for segmented downloads, by reading each finished
+    segment back (normally from the page cache) while later ones still download.
+    Per-host throughput/latency is kept for /metrics.
+    """
+
+    def __init__(self, segments: int = 4, segment_threshold: int = 32 * 1024 * 1024, retries: int = 3,
+                 connect_timeout: int = 30, read_timeout: int = 120, pool_size: int = 8):
+        self.segments = max(1, segments)
+        self.segment_threshold = segment_threshold
+        self.retries = max(1, retries)
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, requests.Session] = {}
+        self.hosts: Dict[str, HostStats] = {}
+        self.segment_executor = ThreadPoolExecutor(
+            max_workers=self.segments * pool_size, thread_name_prefix="Download-seg")
+
+    # --- sessions / metrics -------------------------------------------------
+
+    @staticmethod
+    def _host(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def _session(self, url: str) -> requests.Session:
+        host = self._host(url)
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.segments * self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+            return session
+
+    def _record(self, url: str, ttfb: Optional[float] = None, error: bool = False):
+        with self.lock:
+            stats = self.hosts.setdefault(self._host(url), HostStats())
+            if ttfb is not None:
+                stats.requests += 1
+                stats.ttfb_total += ttfb
+            if error:
+                stats.errors += 1
+
+    def _record_download(self, url: str, nbytes: int, seconds: float):
+        with self.lock:
+            stats = self.hosts.setdefault(self._host(url), HostStats())
+            stats.downloads += 1
+            stats.bytes += nbytes
+            stats.seconds += seconds
+            stats.last_mbps = nbytes / 1048576 / max(seconds, 1e-6)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {host: stats.to_dict() for host, stats in self.hosts.items()}
+
+    def _get(self, url: str, headers: Optional[dict] = None):
+        start = time.perf_counter()
+        try:
+            resp = self._session(url).get(url, headers=headers or {}, stream=True,
+                                          timeout=self.timeout, allow_redirects=True)
+        except requests.RequestException:
+            self._record(url, error=True)
+            raise
+        self._record(resp.url, ttfb=time.perf_counter() - start)
+        if resp.status_code >= 400:
+            resp.close()
+            self._record(resp.url, error=True)
+            message = f"HTTP {resp.status_code} for {url}"
+            if resp.status_code in RETRYABLE_STATUS:
+                raise DownloadError(message)
+            raise Exception(f"Download failed: {message}")
+        return resp
+
+    # --- download -----------------------------------------------------------
+
+    def download(self, url: str, save_path: Path, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None) -> dict:
+        """
+        Downloads `url` to `save_path`. Returns sha256, size, seconds, segments, resumed bytes and validators.
+        With `etag`/`last_modified` of a copy the caller already has, the request is conditional: if the
+        origin confirms that copy, nothing is written and the result only has `url`, `not_modified` and `seconds`.
+        """
+        save_path = Path(save_path)
+        part = save_path.with_name(save_path.name + ".part")
+        meta_path = save_path.with_name(save_path.name + ".part.json")
+        conditional = self._conditional(etag, last_modified)
+        start = time.perf_counter()
+        last_error = None
+        for attempt in range(1, self.retries + 1):
+            try:
+                info = self._fetch(url, part, meta_path, conditional)
+                if info.get("not_modified"):
+                    info["seconds"] = time.perf_counter() - start
+                    return info
+                os.replace(part, save_path)
+                meta_path.unlink(missing_ok=True)
+                info["seconds"] = time.perf_counter() - start
+                self._record_download(info["url"], info["size"] - info["resumed_bytes"], info["seconds"])
+                return info
+            except (DownloadError, requests.RequestException, OSError) as e:
+                last_error = e
+                print(f"[Downloader] Attempt {attempt}/{self.retries} for {url} failed: {e}")
+                if attempt < self.retries:
+                    time.sleep(min(2 ** attempt, 10))
+        raise DownloadError(f"Download failed: {last_error}") from last_error
+
+    @staticmethod
+    def _conditional(etag: Optional[str], last_modified: Optional[str]) -> dict:
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def _probe(self, url: str, conditional: dict) -> Optional[dict]:
+        try:
+            resp = self._session(url).head(url, headers=conditional, timeout=self.timeout, allow_redirects=True)
+        except requests.RequestException:
+            return None
+        if resp.status_code == 304 or (conditional.get("If-None-Match")
+                                       and resp.headers.get("ETag") == conditional["If-None-Match"]):
+            return {"url": resp.url, "not_modified": True}  # some origins ignore conditionals on HEAD
+        if resp.status_code >= 400:
+            return None
+        size = resp.headers.get("Content-Length")
+        return {
+            "url": resp.url,
+            "size": int(size) if size and size.isdigit() else None,
+            "ranges": resp.headers.get("Accept-Ranges", "").lower() == "bytes",
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+        }
+
+    @staticmethod
+    def _load_meta(meta_path: Path, url: str, probe: Optional[dict]) -> Optional[dict]:
+        try:
+            meta = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None
+        if probe is None or meta.get("url") != url:
+            return None
+        for field in ("size", "etag", "last_modified"):
+            if meta.get(field) != probe.get(field):
+                return None  # the file changed on the origin; start over
+        return meta
+
+    @staticmethod
+    def _save_meta(meta_path: Path, meta: dict):
+        staging = meta_path.with_name(meta_path.name + ".tmp")
+        staging.write_text(json.dumps(meta))
+        os.replace(staging, meta_path)
+
+    def _fetch(self, url: str, part: Path, meta_path: Path, conditional: dict) -> dict:
+        probe = self._probe(url, conditional)
+        if probe is not None and probe.get("not_modified"):
+            return probe
+        meta = self._load_meta(meta_path, url, probe) if part.exists() else None
+        if (probe and probe["ranges"] and probe["size"] and self.segments > 1
+                and probe["size"] >= self.segment_threshold):
+            return self._fetch_segmented(url, probe, part, meta_path, meta)
+        return self._fetch_stream(url, probe, part, meta_path, meta, conditional)
+
+    @staticmethod
+    def _validator(probe: Optional[dict]) -> dict:
+        if probe and (probe["etag"] or probe["last_modified"]):
+            return {"If-Range": probe["etag"] or probe["last_modified"]}
+        return {}
+
+    def _fetch_stream(self, url: str, probe: Optional[dict], part: Path, meta_path: Path,
+                      meta: Optional[dict], conditional: dict) -> dict:
+        hasher = hashlib.sha256()
+        offset = 0
+        if meta is not None and meta.get("mode") == "stream" and probe and probe["ranges"]:
+            offset = part.stat().st_size
+            with open(part, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+        if probe:
+            self._save_meta(meta_path, {"url": url, "mode": "stream", "size": probe["size"],
+                                        "etag": probe["etag"], "last_modified": probe["last_modified"]})
+
+        headers = dict(self._validator(probe), Range=f"bytes={offset}-") if offset else conditional
+        received = 0
+        resp = self._get(url, headers)
+        if resp.status_code == 304:
+            resp.close()
+            return {"url": resp.url, "not_modified": True}
+        try:
+            if offset and resp.status_code != 206:
+                offset = 0
+                hasher = hashlib.sha256()
+            with open(part, "ab" if offset else "wb") as f:
+                for chunk in resp.iter_content(CHUNK_SIZE):
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    received += len(chunk)
+        finally:
+            resp.close()
+
+        size = offset + received
+        expected = probe["size"] if probe else None
+        if expected is not None and size != expected:
+            raise DownloadError(f"Short read: {size} of {expected} bytes")
+        return {"url": resp.url, "sha256": hasher.hexdigest(), "size": size, "segments": 1, "resumed_bytes": offset,
+                "etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+
+    def _fetch_segmented(self, url: str, probe: dict, part: Path, meta_path: Path,
+                         meta: Optional[dict]) -> dict:
+        size = probe["size"]
+        source = probe["url"]
+        if meta is not None and meta.get("mode") == "segments":
+            bounds = [tuple(b) for b in meta["bounds"]]
+            done = list(meta["done"])
+        else:
+            step = -(-size // self.segments)
+            bounds = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+            done = [0] * len(bounds)
+            with open(part, "wb") as f:
+                f.truncate(size)
+        resumed = sum(done)
+        meta = {"url": url, "mode": "segments", "size": size, "etag": probe["etag"],
+                "last_modified": probe["last_modified"], "bounds": bounds, "done": done}
+        progress_lock = threading.Lock()
+        self._save_meta(meta_path, meta)
+
+        fd = os.open(part, os.O_RDWR)
+        try:
+            def fetch(index: int):
+                first, last = bounds[index]
+                pos = first + done[index]
+                if pos > last:
+                    return
+                headers = dict(self._validator(probe), Range=f"bytes={pos}-{last}")
+                since_checkpoint = 0
+                resp = self._get(source, headers)
+                try:
+                    if resp.status_code != 206:
+                        raise DownloadError("Origin ignored the Range request")
+                    for chunk in resp.iter_content(CHUNK_SIZE):
+                        chunk = chunk[:last + 1 - pos]
+                        os.pwrite(fd, chunk, pos)
+                        pos += len(chunk)
+                        since_checkpoint += len(chunk)
+                        with progress_lock:
+                            done[index] = pos - first
+                            if since_checkpoint >= CHECKPOINT_BYTES:
+                                since_checkpoint = 0
+                                self._save_meta(meta_path, meta)
+                        if pos > last:
+                            break
+                finally:
+                    resp.close()
+                    with progress_lock:
+                        self._save_meta(meta_path, meta)
+                if pos <= last:
+                    raise DownloadError(f"Segment {index} ended at {pos} of {last + 1}")
+
+            futures = [self.segment_executor.submit(fetch, i) for i in range(len(bounds))]
+            # SHA-256 has to see the bytes in file order and per-segment states can't be merged,
+            # so each segment is read back from the part file once it lands (page-cache hits
+            # unless memory is tight), overlapping with the segments still downloading
+            hasher = hashlib.sha256()
+            error = None
+            for (first, last), future in zip(bounds, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if error is None:
+                    pos = first
+                    while pos <= last:
+                        chunk = os.pread(fd, min(CHUNK_SIZE, last + 1 - pos), pos)
+                        if not chunk:
+                            raise DownloadError("Part file is shorter than expected")
+                        hasher.update(chunk)
+                        pos += len(chunk)
+            if error is not None:
+                raise error
+        finally:
+            os.close(fd)
+        return {"url": source, "sha256": hasher.hexdigest(), "size": size, "segments": len(bounds),
+                "resumed_bytes": resumed, "etag": probe["etag"], "last_modified": probe["last_modified"]}
+
+    def shutdown(self):
+        self.segment_executor.shutdown(wait=False)
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
@@ -0,0 +1,156 @@
+from collections import deque
+from typing import Dict, Optional
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+TEST = "test"  # /test-harden traffic: only runs on capacity production is not using
+PRIORITY_CLASSES = (INTERACTIVE, BULK, TEST)
+
+
+def parse_tenant_map(spec: str, cast=float) -> dict:
+    """`"a.com=3,b.com=1"` -> {"a.com": 3.0, "b.com": 1.0}"""
+    values = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            values[name.strip()] = cast(value.strip())
+    return values
+
+
+class _Tenant:
+    __slots__ = ("name", "queues", "weight", "passes", "running")
+
+    def __init__(self, name: str, weight: float):
+        self.name = name
+        self.queues = {klass: deque() for klass in PRIORITY_CLASSES}
+        self.weight = weight
+        self.passes = {klass: 0.0 for klass in PRIORITY_CLASSES}
+        self.running = 0
+
+
+class FairScheduler:
+    """
+    Admission queue with one FIFO per tenant (domain) and priority class. Interactive
+    work always goes before bulk, and bulk before test; within a class tenants are served
+    by stride scheduling, so a tenant with weight 2 gets twice the admissions of a weight-1
+    tenant and a 200-job burst from one domain cannot starve the others. Tenants at their
+    concurrency cap, and classes at their `class_caps` limit, are skipped until one of
+    their jobs finishes. Not thread-safe on its own: callers hold a lock.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, caps: Optional[Dict[str, int]] = None,
+                 default_cap: int = 0, class_caps: Optional[Dict[str, int]] = None):
+        self.weights = weights or {}
+        self.caps = caps or {}
+        self.default_cap = default_cap
+        self.class_caps = class_caps or {}
+        self.class_running = {klass: 0 for klass in PRIORITY_CLASSES}
+        self.tenants: Dict[str, _Tenant] = {}
+        self.queued: Dict[str, tuple] = {}  # key -> (tenant, class)
+
+    def _tenant(self, name: str) -> _Tenant:
+        tenant = self.tenants.get(name)
+        if tenant is None:
+            tenant = _Tenant(name, max(self.weights.get(name, 1.0), 0.01))
+            self.tenants[name] = tenant
+        return tenant
+
+    def _cap(self, tenant: _Tenant) -> int:
+        return self.caps.get(tenant.name, self.default_cap)
+
+    def _eligible(self, tenant: _Tenant) -> bool:
+        cap = self._cap(tenant)
+        return cap <= 0 or tenant.running < cap
+
+    def push(self, key: str, tenant_name: str, klass: str, item):
+        klass = klass if klass in PRIORITY_CLASSES else INTERACTIVE
+        tenant = self._tenant(tenant_name)
+        if not tenant.queues[klass]:
+            # a tenant that was idle starts at the current virtual time, not with banked credit
+            busy = [t.passes[klass] for t in self.tenants.values() if t.queues[klass] and t is not tenant]
+            tenant.passes[klass] = max(tenant.passes[klass], min(busy)) if busy else tenant.passes[klass]
+        tenant.queues[klass].append((key, item))
+        self.queued[key] = (tenant_name, klass)
+
+    def pop(self, skip_classes=()):
+        """Next (key, tenant, class, item) to admit, or None when nothing is eligible."""
+        for klass in PRIORITY_CLASSES:
+            if klass in skip_classes:
+                continue
+            cap = self.class_caps.get(klass, 0)
+            if 0 < cap <= self.class_running[klass]:
+                continue
+            candidates = [t for t in self.tenants.values() if t.queues[klass] and self._eligible(t)]
+            if not candidates:
+                continue
+            tenant = min(candidates, key=lambda t: (t.passes[klass], t.name))
+            key, item = tenant.queues[klass].popleft()
+            tenant.passes[klass] += 1.0 / tenant.weight
+            tenant.running += 1
+            self.class_running[klass] += 1
+            self.queued.pop(key, None)
+            return key, tenant.name, klass, item
+        return None
+
+    def done(self, tenant_name: str, klass: str):
+        self.class_running[klass] = max(0, self.class_running[klass] - 1)
+        tenant = self.tenants.get(tenant_name)
+        if tenant is None:
+            return
+        tenant.running = max(0, tenant.running - 1)
+        if tenant.running == 0 and not any(tenant.queues.values()):
+            del self.tenants[tenant_name]
+
+    def class_queued(self, klass: str) -> int:
+        return sum(len(t.queues[klass]) for t in self.tenants.values())
+
+    def __len__(self) -> int:
+        return len(self.queued)
+
+    def position(self, key: str) -> Optional[int]:
+        """How many queued jobs are expected to be admitted before `key` (ignoring caps)."""
+        where = self.queued.get(key)
+        if where is None:
+            return None
+        tenant_name, klass = where
+        ahead = 0
+        for higher in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(klass)]:
+            ahead += sum(len(t.queues[higher]) for t in self.tenants.values())
+        # replay the stride schedule for this class until `key` comes up
+        passes = {t.name: t.passes[klass] for t in self.tenants.values() if t.queues[klass]}
+        remaining = {t.name: len(t.queues[klass]) for t in self.tenants.values() if t.queues[klass]}
+        index = next(i for i, (k, _) in enumerate(self.tenants[tenant_name].queues[klass]) if k == key)
+        served = 0
+        while True:
+            name = min((n for n in passes if remaining[n]), key=lambda n: (passes[n], n))
+            if name == tenant_name:
+                if served == index:
+                    return ahead
+                served += 1
+            ahead += 1
+            remaining[name] -= 1
+            passes[name] += 1.0 / self.tenants[name].weight
+
+    def stats(self) -> dict:
+        return {
+            "classes": {
+                klass: {
+                    "running": self.class_running[klass],
+                    "cap": self.class_caps.get(klass, 0),
+                    "queued": self.class_queued(klass),
+                }
+                for klass in PRIORITY_CLASSES
+            },
+            "tenants": self.tenant_stats(),
+        }
+
+    def tenant_stats(self) -> dict:
+        return {
+            name: {
+                "weight": tenant.weight,
+                "cap": self._cap(tenant),
+                "running": tenant.running,
+                **{f"queued_{klass}": len(tenant.queues[klass]) for klass in PRIORITY_CLASSES},
+            }
+            for name, tenant in self.tenants.items()
+        }
@@ -9,6 +9,9 @@ class Job:
     Follows single responsibility: holds job configuration data.
     """
 
+    __slots__ = ("job_id", "apk_url", "callback_url", "id", "domain", "file_name", "package_name_method",
+                 "package_name", "current_version", "app_name", "app_key", "apk_key", "op_call_back", "priority")
+
     def __init__(
         self,
         apk_url: str,
@@ -22,9 +25,11 @@ class Job:
         app_name: Optional[str] = None,
         app_key: Optional[str] = None,
         apk_key: Optional[str] = None,
-        op_call_back: Optional[str] = None
+        op_call_back: Optional[str] = None,
+        priority: str = "interactive",
+        job_id: Optional[str] = None
     ):
-        self.job_id = str(uuid.uuid4())
+        self.job_id = job_id or str(uuid.uuid4())
         self.apk_url = apk_url
         self.callback_url = callback_url
         self.id = id
@@ -37,3 +42,4 @@ class Job:
         self.app_key = app_key
         self.apk_key = apk_key
         self.op_call_back = op_call_back
+        self.priority = priority
@@ -0,0 +1,64 @@
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.Lib.Hardening.Job import Job
+
+
+class JobContext:
+    """
+    Per-job state carried between pipeline stages: the job, its working paths, the
+    decode plan and edit results produced so far, and the result sent to the callback.
+    """
+
+    def __init__(self, job: Job, jobs_dir: Path, final_apk_path: Path):
+        self.job = job
+        self.temp_file = jobs_dir / f"temp_{job.job_id}.apk"
+        self.relocate(jobs_dir / job.job_id)
+        self.workspace_tier = "disk"
+        self.final_apk_path = final_apk_path
+
+        self.apk_sha256: Optional[str] = None  # computed by the downloader while streaming
+        self.apk_size = 0
+        self.plan = None
+        self.edits: Optional[dict] = None
+        self.signing_prep: Optional[Future] = None
+        self.variant_group = None  # VariantGroup when submitted through /harden/variants
+        self.job_start = time.perf_counter()
+
+        # set by StagePipeline
+        self.stage: Optional[str] = None
+        self.enqueued_at = 0.0
+        self.admitted_at = 0.0
+        self.admission_class: Optional[str] = None
+        self.resume_from: Optional[str] = None  # first stage to run when resuming a checkpoint
+        self.stage_seconds: Dict[str, float] = {}
+        self.retries: Dict[str, int] = {}
+
+        self.result = {
+            "job_id": job.job_id,
+            "original_url": job.apk_url,
+            "status": "failed",
+            "error": "Unknown error",
+            "id": job.id,
+            "icon_url": None,
+            "old_display_name": "Unknown",
+            "new_display_name": "Unknown",
+            "old_version_code": None,
+            "new_version_code": None,
+            "old_version_name": None,
+            "new_version_name": None,
+            "timings": {}
+        }
+
+    def relocate(self, job_folder: Path):
+        """Points the working paths at `job_folder` (before anything is written there)."""
+        self.job_folder = job_folder
+        self.src_dir = job_folder / "src"
+        self.rebuilt_apk = job_folder / "rebuilt.apk"
+        self.aligned_apk = job_folder / "aligned.apk"
+
+    @property
+    def timings(self) -> dict:
+        return self.result["timings"]
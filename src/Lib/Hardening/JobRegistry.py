@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCESS = "success"
+FAILED = "failed"
+FINISHED = (SUCCESS, FAILED)
+
+
+class JobRecord:
+    __slots__ = ("job_id", "id", "domain", "priority", "state", "stage", "submitted_at", "started_at",
+                 "finished_at", "stages", "error")
+
+    def __init__(self, job_id: str, id, domain: str, priority: str, submitted_at: float):
+        self.job_id = job_id
+        self.id = id
+        self.domain = domain
+        self.priority = priority
+        self.state = QUEUED
+        self.stage: Optional[str] = None
+        self.submitted_at = submitted_at
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.stages: Dict[str, float] = {}  # stage -> seconds spent running it
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "JobRecord":
+        record = cls(data["job_id"], data.get("id"), data.get("domain", ""), data.get("priority", ""),
+                     data.get("submitted_at", 0.0))
+        for name in cls.__slots__[4:]:
+            if name in data:
+                setattr(record, name, data[name])
+        return record
+
+
+class JobRegistry:
+    """
+    What every accepted job is doing: state, current stage and seconds per stage. Active
+    jobs are always kept; finished ones are kept up to `history` (oldest dropped first)
+    and appended to a JSONL tail so they survive a restart. The tail is rewritten from
+    memory once it holds twice `history` lines.
+    """
+
+    def __init__(self, path: str, history: int = 100000):
+        self.path = Path(path)
+        self.history = history
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.records: "OrderedDict[str, JobRecord]" = OrderedDict()
+        self.by_domain: Dict[str, "OrderedDict[str, None]"] = {}
+        self.finished: "deque[str]" = deque()
+        self.tail_lines = 0
+
+        self._load()
+        self.tail = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not self.path.exists():
+            return
+        lines = deque(maxlen=self.history)
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                lines.append(line)
+                self.tail_lines += 1
+        for line in lines:
+            try:
+                record = JobRecord.from_dict(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                continue  # torn last line after a crash
+            self._index(record)
+            self.finished.append(record.job_id)
+        print(f"[JobRegistry] Loaded {len(self.records)} finished jobs from {self.path.name}")
+
+    def _index(self, record: JobRecord):
+        self.records[record.job_id] = record
+        self.by_domain.setdefault(record.domain, OrderedDict())[record.job_id] = None
+
+    def _drop(self, job_id: str):
+        record = self.records.pop(job_id, None)
+        if record is None:
+            return
+        domain_jobs = self.by_domain.get(record.domain)
+        if domain_jobs is not None:
+            domain_jobs.pop(job_id, None)
+            if not domain_jobs:
+                del self.by_domain[record.domain]
+
+    # --- lifecycle (called by the pipeline) -------------------------------------
+
+    def submitted(self, job):
+        with self.lock:
+            self._index(JobRecord(job.job_id, job.id, job.domain, job.priority, time.time()))
+
+    def started(self, job_id: str):
+        with self.lock:
+            record = self.records.get(job_id)
+            if record is not None:
+                record.state = RUNNING
+                record.started_at = time.time()
+
+    def stage(self, job_id: str, stage: str):
+        with self.lock:
+            record = self.records.get(job_id)
+            if record is not None:
+                record.stage = stage
+
+    def stage_done(self, job_id: str, stage: str, seconds: float):
+        with self.lock:
+            record = self.records.get(job_id)
+            if record is not None:
+                record.stages[stage] = round(record.stages.get(stage, 0.0) + seconds, 3)
+
+    def finished_job(self, job_id: str, result: Optional[dict]):
+        with self.lock:
+            record = self.records.get(job_id)
+            if record is None:
+                return
+            record.state = SUCCESS if result and result.get("status") == "success" else FAILED
+            record.error = None if record.state == SUCCESS else (result or {}).get("error")
+            record.stage = None
+            record.finished_at = time.time()
+            self.finished.append(job_id)
+            while len(self.finished) > self.history:
+                self._drop(self.finished.popleft())
+            try:
+                self.tail.write(json.dumps(record.to_dict()) + "\n")
+                self.tail.flush()
+                self.tail_lines += 1
+                if self.tail_lines >= 2 * self.history:
+                    self._compact()
+            except (OSError, ValueError) as e:
+                print(f"[JobRegistry] Could not append to {self.path.name}: {e}")
+
+    def _compact(self):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for job_id in self.finished:
+                f.write(json.dumps(self.records[job_id].to_dict()) + "\n")
+        os.replace(tmp, self.path)
+        self.tail.close()
+        self.tail = open(self.path, "a", encoding="utf-8")
+        self.tail_lines = len(self.finished)
+
+    # --- queries --------------------------------------------------------------------
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            record = self.records.get(job_id)
+            return record.to_dict() if record is not None else None
+
+    def by(self, domain: Optional[str] = None, state: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """Newest first."""
+        with self.lock:
+            job_ids = self.by_domain.get(domain, {}) if domain is not None else self.records
+            found = []
+            for job_id in reversed(job_ids):
+                record = self.records[job_id]
+                if state is None or record.state == state:
+                    found.append(record.to_dict())
+                    if len(found) >= limit:
+                        break
+            return found
+
+    def stats(self) -> dict:
+        with self.lock:
+            states = {}
+            for record in self.records.values():
+                states[record.state] = states.get(record.state, 0) + 1
+            return {"records": len(self.records), "history": self.history, "tail_lines": self.tail_lines,
+                    "states": states}
+
+    def close(self):
+        with self.lock:
+            self.tail.close()
@@ -0,0 +1,127 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DOWNLOADED = "downloaded"
+DECODED = "decoded"
+EDITED = "edited"
+BUILT = "built"
+SIGNED = "signed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    spec TEXT NOT NULL,
+    checkpoint TEXT,
+    state TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    variant_group TEXT
+);
+"""
+
+
+class JobStore:
+    """
+    Durable record of every accepted job that has not finished yet: the job spec and the
+    last completed checkpoint (downloaded/decoded/edited/built/signed) with the state
+    needed to carry on from it. Rows are removed once the job's callback is queued, so
+    whatever is left on startup was interrupted by a restart and can be resumed — by
+    the one process holding the exclusive lock on `<db>.lock`, so a second process on
+    the same store (a reloader parent, a stray worker) never resumes them again.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.local = threading.local()
+        self.lock_file = None
+        db = self._db()
+        db.executescript(SCHEMA)
+        columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+        if "variant_group" not in columns:
+            db.execute("ALTER TABLE jobs ADD COLUMN variant_group TEXT")
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self.local.db = db
+        return db
+
+    def add_many(self, specs: List[dict], variant_groups: Optional[List[Optional[dict]]] = None):
+        """Stores the specs of newly accepted jobs (and their variant group, if any) in one transaction."""
+        now = time.time()
+        groups = variant_groups or [None] * len(specs)
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT OR REPLACE INTO jobs (job_id, spec, created_at, updated_at, variant_group) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(spec["job_id"], json.dumps(spec), now, now, json.dumps(group) if group else None)
+                 for spec, group in zip(specs, groups)])
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+
+    def checkpoint(self, job_id: str, checkpoint: str, state: dict):
+        self._db().execute(
+            "UPDATE jobs SET checkpoint = ?, state = ?, updated_at = ? WHERE job_id = ?",
+            (checkpoint, json.dumps(state), time.time(), job_id))
+
+    def remove(self, job_id: str):
+        self._db().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def _own(self) -> bool:
+        """Takes the store's owner lock (held until the process exits); False if another process has it."""
+        if self.lock_file is not None or fcntl is None:
+            return True
+        lock_file = open(self.db_path.with_name(self.db_path.name + ".lock"), "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self.lock_file = lock_file
+        return True
+
+    def interrupted(self) -> List[dict]:
+        """Unfinished jobs in acceptance order; bumps their attempt count. Empty unless this process owns the store."""
+        if not self._own():
+            print(f"[JobStore] {self.db_path} is owned by another process — not resuming its jobs")
+            return []
+        db = self._db()
+        db.execute("UPDATE jobs SET attempts = attempts + 1")
+        rows = db.execute(
+            "SELECT job_id, spec, checkpoint, state, attempts, variant_group FROM jobs "
+            "ORDER BY created_at").fetchall()
+        return [
+            {
+                "job_id": job_id,
+                "spec": json.loads(spec),
+                "checkpoint": checkpoint,
+                "state": json.loads(state) if state else None,
+                "attempts": attempts,
+                "variant_group": json.loads(variant_group) if variant_group else None,
+            }
+            for job_id, spec, checkpoint, state, attempts, variant_group in rows
+        ]
+
+    def stats(self) -> dict:
+        rows = self._db().execute(
+            "SELECT COALESCE(checkpoint, 'accepted'), COUNT(*) FROM jobs GROUP BY 1").fetchall()
+        return {"unfinished": sum(count for _, count in rows), "by_checkpoint": dict(rows),
+                "owner": self.lock_file is not None}
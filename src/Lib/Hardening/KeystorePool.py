@@ -0,0 +1,181 @@
+import datetime
+import os
+import subprocess
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict
+
+KEY_ALIAS = "androiddebugkey"
+KEY_PASSWORD = "android"
+KEY_DNAME = "CN=Hardening,O=APK,L=Local,C=US"
+KEY_VALIDITY_DAYS = 10000
+SPARE_PREFIX = "spare-"
+
+
+class KeystorePool:
+    """
+    Hands out per-id signing keystores from a pool of spares generated in the background,
+    so a first-seen id never waits for key generation. A spare is claimed with an atomic
+    rename and bound to the id with a hardlink, which keeps this safe across threads and
+    processes; generation for one id is single-flight. Keys are generated in-process as
+    PKCS#12 when `cryptography` is available, otherwise with keytool.
+    """
+
+    def __init__(self, keystore_dir: str, spares: int = 8):
+        self.keystore_dir = Path(keystore_dir)
+        self.spare_dir = self.keystore_dir / ".spares"
+        self.spare_dir.mkdir(parents=True, exist_ok=True)
+        self.spares = spares
+
+        self.lock = threading.Lock()
+        self.id_locks: Dict[str, threading.Lock] = {}
+        self.refill_wanted = threading.Event()
+        self.handed_out = 0
+        self.generated_inline = 0
+
+        try:
+            import cryptography  # noqa: F401
+            self.in_process = True
+        except ImportError:
+            self.in_process = False
+
+        for leftover in self.spare_dir.glob(".*"):
+            leftover.unlink(missing_ok=True)
+        if self.spares > 0:
+            self.refill_wanted.set()
+            threading.Thread(target=self._refill_loop, name="keystore-pool", daemon=True).start()
+
+    def path_for(self, key_id) -> Path:
+        return self.keystore_dir / f"{key_id}.keystore"
+
+    def get(self, key_id) -> Path:
+        """Keystore bound to `key_id`, binding a spare (or a fresh key) on first use."""
+        target = self.path_for(key_id)
+        if target.exists():
+            return target
+        with self.lock:
+            id_lock = self.id_locks.setdefault(str(key_id), threading.Lock())
+        with id_lock:
+            if not target.exists():
+                self._bind(target)
+        with self.lock:
+            self.id_locks.pop(str(key_id), None)
+        return target
+
+    def _bind(self, target: Path):
+        claimed = self._claim_spare()
+        if claimed is None:
+            claimed = self.spare_dir / f".new-{uuid.uuid4().hex}.keystore"
+            self._generate(claimed)
+            with self.lock:
+                self.generated_inline += 1
+            print(f"[KeystorePool] No spare keystore left — generated {target.name} inline")
+        try:
+            os.link(claimed, target)
+        except FileExistsError:
+            # another process bound this id first; keep the key for the next id
+            os.replace(claimed, self.spare_dir / f"{SPARE_PREFIX}{uuid.uuid4().hex}.keystore")
+            return
+        claimed.unlink(missing_ok=True)
+        with self.lock:
+            self.handed_out += 1
+        self.refill_wanted.set()
+
+    def _claim_spare(self):
+        for spare in sorted(self.spare_dir.glob(f"{SPARE_PREFIX}*.keystore")):
+            claimed = self.spare_dir / f".claimed-{uuid.uuid4().hex}.keystore"
+            try:
+                os.rename(spare, claimed)
+                return claimed
+            except FileNotFoundError:
+                continue  # taken by someone else
+        return None
+
+    def spare_count(self) -> int:
+        return sum(1 for _ in self.spare_dir.glob(f"{SPARE_PREFIX}*.keystore"))
+
+    def _refill_loop(self):
+        while True:
+            self.refill_wanted.wait()
+            self.refill_wanted.clear()
+            try:
+                while self.spare_count() < self.spares:
+                    staging = self.spare_dir / f".gen-{uuid.uuid4().hex}.keystore"
+                    self._generate(staging)
+                    os.replace(staging, self.spare_dir / f"{SPARE_PREFIX}{uuid.uuid4().hex}.keystore")
+            except Exception as e:
+                print(f"[KeystorePool] Refill failed: {e}")
+
+    # --- generation ---------------------------------------------------------
+
+    def _generate(self, path: Path):
+        if self.in_process:
+            path.write_bytes(self._pkcs12())
+        else:
+            self._keytool(path)
+
+    @staticmethod
+    def _pkcs12() -> bytes:
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.hazmat.primitives.serialization import PrivateFormat, pkcs12
+        from cryptography.x509.oid import NameOID
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([
+            x509.NameAttribute(NameOID.COUNTRY_NAME, "US"),
+            x509.NameAttribute(NameOID.LOCALITY_NAME, "Local"),
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, "APK"),
+            x509.NameAttribute(NameOID.COMMON_NAME, "Hardening"),
+        ])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        certificate = (
+            x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now)
+            .not_valid_after(now + datetime.timedelta(days=KEY_VALIDITY_DAYS))
+            .sign(key, hashes.SHA256())
+        )
+        # 3DES/SHA-1 PBE is the variant every keytool/apksigner version can read
+        encryption = (
+            PrivateFormat.PKCS12.encryption_builder()
+            .kdf_rounds(10000)
+            .key_cert_algorithm(pkcs12.PBES.PBESv1SHA1And3KeyTripleDESCBC)
+            .hmac_hash(hashes.SHA1())
+            .build(KEY_PASSWORD.encode("utf-8"))
+        )
+        return pkcs12.serialize_key_and_certificates(
+            KEY_ALIAS.encode("utf-8"), key, certificate, None, encryption)
+
+    @staticmethod
+    def _keytool(path: Path):
+        cmd = [
+            "keytool", "-genkeypair", "-v",
+            "-keystore", str(path),
+            "-storetype", "PKCS12",
+            "-storepass", KEY_PASSWORD,
+            "-keypass", KEY_PASSWORD,
+            "-alias", KEY_ALIAS,
+            "-keyalg", "RSA",
+            "-keysize", "2048",
+            "-validity", str(KEY_VALIDITY_DAYS),
+            "-dname", KEY_DNAME,
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception(f"Keystore generation failed: {result.stderr}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "spares": self.spare_count(),
+                "target_spares": self.spares,
+                "handed_out": self.handed_out,
+                "generated_inline": self.generated_inline,
+                "in_process": self.in_process,
+            }
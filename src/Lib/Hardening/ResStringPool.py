@@ -0,0 +1,168 @@
+import struct
+from typing import List, Optional
+
+RES_STRING_POOL_TYPE = 0x0001
+
+SORTED_FLAG = 1 << 0
+UTF8_FLAG = 1 << 8
+
+# What a truncated or corrupt chunk raises from struct/slicing/decoding; the chunk readers
+# turn these into their own error types so callers only have to catch one.
+MALFORMED_CHUNK_ERRORS = (struct.error, ValueError, IndexError, UnicodeDecodeError)
+
+
+class ResStringPool:
+    """
+    Reader/writer for an Android ResStringPool chunk (binary XML and resources.arsc).
+    Untouched strings are written back with their original bytes; new strings are
+    appended at the end so existing indices never move.
+    """
+
+    def __init__(self, data: bytes, offset: int = 0):
+        chunk_type, header_size, chunk_size = struct.unpack_from("<HHI", data, offset)
+        if chunk_type != RES_STRING_POOL_TYPE:
+            raise ValueError(f"Not a string pool chunk: 0x{chunk_type:04x}")
+        string_count, style_count, flags, strings_start, styles_start = struct.unpack_from(
+            "<IIIII", data, offset + 8)
+
+        self.header = data[offset:offset + header_size]
+        self.chunk_size = chunk_size
+        self.flags = flags
+        self.utf8 = bool(flags & UTF8_FLAG)
+        self.modified = False
+
+        offsets = struct.unpack_from(f"<{string_count}I", data, offset + header_size)
+        style_offsets = struct.unpack_from(
+            f"<{style_count}I", data, offset + header_size + 4 * string_count)
+
+        self.strings: List[str] = []
+        self.raw: List[Optional[bytes]] = []
+        base = offset + strings_start
+        for string_offset in offsets:
+            value, raw = self._decode(data, base + string_offset)
+            self.strings.append(value)
+            self.raw.append(raw)
+
+        self.style_offsets = list(style_offsets)
+        if style_count:
+            self.style_data = data[offset + styles_start:offset + chunk_size]
+        else:
+            self.style_data = b""
+
+    # --- decoding -------------------------------------------------------
+
+    @staticmethod
+    def _utf8_length(data: bytes, pos: int):
+        length = data[pos]
+        if length & 0x80:
+            return ((length & 0x7F) << 8) | data[pos + 1], pos + 2
+        return length, pos + 1
+
+    @staticmethod
+    def _utf16_length(data: bytes, pos: int):
+        length = struct.unpack_from("<H", data, pos)[0]
+        if length & 0x8000:
+            low = struct.unpack_from("<H", data, pos + 2)[0]
+            return ((length & 0x7FFF) << 16) | low, pos + 4
+        return length, pos + 2
+
+    def _decode(self, data: bytes, pos: int):
+        start = pos
+        if self.utf8:
+            _, pos = self._utf8_length(data, pos)
+            byte_len, pos = self._utf8_length(data, pos)
+            value = data[pos:pos + byte_len].decode("utf-8", errors="replace")
+            end = pos + byte_len + 1
+        else:
+            char_len, pos = self._utf16_length(data, pos)
+            value = data[pos:pos + char_len * 2].decode("utf-16-le", errors="replace")
+            end = pos + char_len * 2 + 2
+        return value, data[start:end]
+
+    # --- encoding -------------------------------------------------------
+
+    @staticmethod
+    def _encode_utf8_length(length: int) -> bytes:
+        if length > 0x7F:
+            return bytes([((length >> 8) & 0x7F) | 0x80, length & 0xFF])
+        return bytes([length])
+
+    def _encode(self, value: str) -> bytes:
+        if self.utf8:
+            encoded = value.encode("utf-8")
+            char_len = len(value.encode("utf-16-le")) // 2
+            return (self._encode_utf8_length(char_len) + self._encode_utf8_length(len(encoded))
+                    + encoded + b"\x00")
+        encoded = value.encode("utf-16-le")
+        char_len = len(encoded) // 2
+        if char_len > 0x7FFF:
+            prefix = struct.pack("<HH", ((char_len >> 16) & 0x7FFF) | 0x8000, char_len & 0xFFFF)
+        else:
+            prefix = struct.pack("<H", char_len)
+        return prefix + encoded + b"\x00\x00"
+
+    # --- editing --------------------------------------------------------
+
+    def __len__(self):
+        return len(self.strings)
+
+    def get(self, index: int) -> Optional[str]:
+        if 0 <= index < len(self.strings):
+            return self.strings[index]
+        return None
+
+    def find(self, value: str, start: int = 0) -> int:
+        for index in range(start, len(self.strings)):
+            if self.strings[index] == value:
+                return index
+        return -1
+
+    def add(self, value: str, start: int = 0) -> int:
+        """Returns the index of `value`, appending it when it is not in the pool yet."""
+        index = self.find(value, start)
+        if index >= 0:
+            return index
+        self.strings.append(value)
+        self.raw.append(None)
+        self.modified = True
+        return len(self.strings) - 1
+
+    def set(self, index: int, value: str):
+        if self.strings[index] != value:
+            self.strings[index] = value
+            self.raw[index] = None
+            self.modified = True
+
+    def to_bytes(self) -> bytes:
+        header_size = len(self.header)
+        offsets = []
+        blobs = []
+        seen = {}
+        cursor = 0
+        for value, raw in zip(self.strings, self.raw):
+            encoded = raw if raw is not None else self._encode(value)
+            if encoded in seen:
+                offsets.append(seen[encoded])
+                continue
+            seen[encoded] = cursor
+            offsets.append(cursor)
+            blobs.append(encoded)
+            cursor += len(encoded)
+        string_data = b"".join(blobs)
+        string_data += b"\x00" * (-len(string_data) % 4)
+
+        string_count = len(self.strings)
+        style_count = len(self.style_offsets)
+        strings_start = header_size + 4 * (string_count + style_count)
+        styles_start = strings_start + len(string_data) if style_count else 0
+        chunk_size = strings_start + len(string_data) + len(self.style_data)
+
+        flags = self.flags & ~SORTED_FLAG if self.modified else self.flags
+        header = bytearray(self.header)
+        struct.pack_into("<HHI", header, 0, RES_STRING_POOL_TYPE, header_size, chunk_size)
+        struct.pack_into("<IIIII", header, 8, string_count, style_count, flags, strings_start, styles_start)
+        return (bytes(header)
+                + struct.pack(f"<{string_count}I", *offsets)
+                + struct.pack(f"<{style_count}I", *self.style_offsets)
+                + string_data
+                + self.style_data)
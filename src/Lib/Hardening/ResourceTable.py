@@ -0,0 +1,195 @@
+import struct
+from typing import Iterator, List, Optional
+
+from src.Lib.Hardening.ResStringPool import MALFORMED_CHUNK_ERRORS, ResStringPool, RES_STRING_POOL_TYPE
+
+RES_TABLE_TYPE = 0x0002
+RES_TABLE_PACKAGE_TYPE = 0x0200
+RES_TABLE_TYPE_TYPE = 0x0201
+
+TYPE_STRING = 0x03
+NO_ENTRY = 0xFFFFFFFF
+
+FLAG_SPARSE = 0x01
+FLAG_OFFSET16 = 0x02
+ENTRY_FLAG_COMPLEX = 0x0001
+ENTRY_FLAG_COMPACT = 0x0008
+
+
+class ResourceTableError(Exception):
+    pass
+
+
+class StringEntry:
+    """A string value of one resource in one configuration."""
+
+    __slots__ = ("resource_id", "type_name", "key", "locale", "default_config", "data_offset")
+
+    def __init__(self, resource_id: int, type_name: str, key: str, locale: str,
+                 default_config: bool, data_offset: int):
+        self.resource_id = resource_id
+        self.type_name = type_name
+        self.key = key
+        self.locale = locale
+        self.default_config = default_config
+        self.data_offset = data_offset
+
+
+class ResourceTable:
+    """
+    Reader/writer for resources.arsc limited to plain string values: find them by name
+    or id across every configuration and repoint them at new strings appended to the
+    global string pool. Package and type chunks are written back untouched apart from
+    the patched value words.
+    """
+
+    def __init__(self, data: bytes):
+        try:
+            self._parse(data)
+        except MALFORMED_CHUNK_ERRORS as e:
+            raise ResourceTableError(f"Malformed resources.arsc: {e!r}") from e
+
+    def _parse(self, data: bytes):
+        chunk_type, header_size, size, _ = struct.unpack_from("<HHII", data, 0)
+        if chunk_type != RES_TABLE_TYPE:
+            raise ResourceTableError("Not a resources.arsc table")
+        self.data = bytearray(data)
+        self.header_size = header_size
+        self.pool: Optional[ResStringPool] = None
+        self.pool_range = (0, 0)
+        self.entries: List[StringEntry] = []
+
+        pos = header_size
+        end = min(size, len(data))
+        while pos + 8 <= end:
+            c_type, _, c_size = struct.unpack_from("<HHI", data, pos)
+            if c_size < 8:
+                raise ResourceTableError(f"Corrupt chunk at {pos}")
+            if pos + c_size > len(data):
+                raise ResourceTableError(f"Truncated chunk at {pos}")
+            if c_type == RES_STRING_POOL_TYPE and self.pool is None:
+                self.pool = ResStringPool(data, pos)
+                self.pool_range = (pos, pos + c_size)
+            elif c_type == RES_TABLE_PACKAGE_TYPE:
+                self._parse_package(data, pos, c_size)
+            pos += c_size
+
+        if self.pool is None:
+            raise ResourceTableError("resources.arsc has no global string pool")
+
+    def _parse_package(self, data: bytes, start: int, size: int):
+        _, header_size = struct.unpack_from("<HH", data, start)
+        package_id = struct.unpack_from("<I", data, start + 8)[0]
+        type_strings_offset, _, key_strings_offset = struct.unpack_from("<III", data, start + 268)
+        type_strings = ResStringPool(data, start + type_strings_offset)
+        key_strings = ResStringPool(data, start + key_strings_offset)
+
+        pos = start + header_size
+        end = start + size
+        while pos + 8 <= end:
+            c_type, c_header, c_size = struct.unpack_from("<HHI", data, pos)
+            if c_size < 8:
+                raise ResourceTableError(f"Corrupt package chunk at {pos}")
+            if c_type == RES_TABLE_TYPE_TYPE:
+                self._parse_type(data, pos, c_header, package_id, type_strings, key_strings)
+            pos += c_size
+
+    def _parse_type(self, data: bytes, start: int, header_size: int, package_id: int,
+                    type_strings: ResStringPool, key_strings: ResStringPool):
+        type_id, flags, _, entry_count, entries_start = struct.unpack_from("<BBHII", data, start + 8)
+        type_name = type_strings.get(type_id - 1) or ""
+        config = data[start + 20:start + header_size]
+        default_config = not any(config[4:])
+        language = config[8:10] if len(config) >= 12 else b"\x00\x00"
+        country = config[10:12] if len(config) >= 12 else b"\x00\x00"
+        locale = self._locale(language, country)
+
+        offsets_pos = start + header_size
+        slots = []
+        if flags & FLAG_SPARSE:
+            for i in range(entry_count):
+                index, offset = struct.unpack_from("<HH", data, offsets_pos + 4 * i)
+                slots.append((index, offset * 4))
+        elif flags & FLAG_OFFSET16:
+            for i in range(entry_count):
+                offset = struct.unpack_from("<H", data, offsets_pos + 2 * i)[0]
+                if offset != 0xFFFF:
+                    slots.append((i, offset * 4))
+        else:
+            for i in range(entry_count):
+                offset = struct.unpack_from("<I", data, offsets_pos + 4 * i)[0]
+                if offset != NO_ENTRY:
+                    slots.append((i, offset))
+
+        for index, offset in slots:
+            entry_pos = start + entries_start + offset
+            entry_size, entry_flags, key = struct.unpack_from("<HHI", data, entry_pos)
+            if entry_flags & ENTRY_FLAG_COMPACT:
+                # compact entry: u16 key, u16 flags (dataType in the high byte), u32 data
+                key = entry_size
+                data_type = entry_flags >> 8
+                data_offset = entry_pos + 4
+            elif entry_flags & ENTRY_FLAG_COMPLEX:
+                continue
+            else:
+                value_pos = entry_pos + entry_size
+                data_type = data[value_pos + 3]
+                data_offset = value_pos + 4
+            if data_type != TYPE_STRING:
+                continue
+            resource_id = (package_id << 24) | (type_id << 16) | index
+            self.entries.append(StringEntry(
+                resource_id, type_name, key_strings.get(key) or "", locale, default_config, data_offset))
+
+    @staticmethod
+    def _locale(language: bytes, country: bytes) -> str:
+        def decode(code: bytes) -> str:
+            if not any(code):
+                return ""
+            if code[0] & 0x80:
+                # packed 3-letter code
+                first = code[1] & 0x1F
+                second = ((code[1] >> 5) | (code[0] << 3)) & 0x1F
+                third = (code[0] >> 2) & 0x1F
+                return "".join(chr(0x61 + c) for c in (first, second, third))
+            return code.decode("ascii", errors="replace")
+
+        lang, region = decode(language), decode(country)
+        return f"{lang}-r{region}" if lang and region else lang
+
+    # --- queries / edits --------------------------------------------------
+
+    def value(self, entry: StringEntry) -> Optional[str]:
+        index = struct.unpack_from("<I", self.data, entry.data_offset)[0]
+        return self.pool.get(index)
+
+    def string_entries(self, type_name: Optional[str] = "string") -> Iterator[StringEntry]:
+        for entry in self.entries:
+            if type_name is None or entry.type_name == type_name:
+                yield entry
+
+    def entries_for(self, resource_id: int) -> List[StringEntry]:
+        return [e for e in self.entries if e.resource_id == resource_id]
+
+    def resolve(self, resource_id: int) -> Optional[str]:
+        """Value of a string resource in the default configuration (values/)."""
+        candidates = self.entries_for(resource_id)
+        for entry in candidates:
+            if entry.default_config:
+                return self.value(entry)
+        return self.value(candidates[0]) if candidates else None
+
+    def key_for(self, resource_id: int) -> Optional[str]:
+        candidates = self.entries_for(resource_id)
+        return candidates[0].key if candidates else None
+
+    def set_value(self, entry: StringEntry, value: str):
+        index = self.pool.add(value)
+        struct.pack_into("<I", self.data, entry.data_offset, index)
+
+    def to_bytes(self) -> bytes:
+        pool_start, pool_end = self.pool_range
+        pool_bytes = self.pool.to_bytes()
+        out = bytearray(self.data[:pool_start]) + pool_bytes + self.data[pool_end:]
+        struct.pack_into("<I", out, 4, len(out))
+        return bytes(out)
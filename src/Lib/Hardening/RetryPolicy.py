@@ -0,0 +1,58 @@
+import os
+import random
+import time
+from typing import Callable, Optional, Tuple, Type
+
+
+class RetryPolicy:
+    """
+    How often one pipeline stage may be tried (`attempts` counts the first try) and how
+    long to wait in between: exponential backoff from `base_delay`, capped at `max_delay`,
+    with jitter. Only errors of the `retry_on` types are retried. Configured per stage as
+    HARDENING_RETRY_<STAGE>="attempts:base:max".
+    """
+
+    def __init__(self, attempts: int = 1, base_delay: float = 1.0, max_delay: float = 60.0,
+                 retry_on: Tuple[Type[BaseException], ...] = (Exception,)):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    @classmethod
+    def parse(cls, spec: str) -> "RetryPolicy":
+        """`"3:2:30"` -> 3 attempts, 2s base delay, 30s cap (trailing parts optional)."""
+        values = [float(part) for part in spec.split(":")]
+        return cls(int(values[0]), *values[1:3])
+
+    @classmethod
+    def from_env(cls, stage: str, default: str) -> "RetryPolicy":
+        spec = os.getenv(f"HARDENING_RETRY_{stage.upper()}", default)
+        try:
+            return cls.parse(spec)
+        except (ValueError, IndexError):
+            print(f"[RetryPolicy] Bad HARDENING_RETRY_{stage.upper()} '{spec}' — using '{default}'")
+            return cls.parse(default)
+
+    def retryable(self, error: BaseException) -> bool:
+        return isinstance(error, self.retry_on)
+
+    def delay(self, failures: int) -> float:
+        """Wait before the next try after `failures` failed tries."""
+        delay = min(self.max_delay, self.base_delay * (2 ** (failures - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def run(self, fn: Callable, on_retry: Optional[Callable[[int, Exception], None]] = None):
+        """Calls `fn()` until it succeeds or the attempts run out, sleeping between tries."""
+        for attempt in range(1, self.attempts + 1):
+            try:
+                return fn()
+            except Exception as e:
+                if attempt >= self.attempts or not self.retryable(e):
+                    raise
+                if on_retry is not None:
+                    on_retry(attempt, e)
+                time.sleep(self.delay(attempt))
+
+    def __repr__(self):
+        return f"RetryPolicy(attempts={self.attempts}, base_delay={self.base_delay}, max_delay={self.max_delay})"
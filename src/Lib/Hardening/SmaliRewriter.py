@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+MAX_REPORTED_ERRORS = 20
+
+
+def _rewrite_file(path: str, old: bytes, new: bytes) -> bool:
+    with open(path, "rb") as f:
+        data = f.read()
+    if old not in data:
+        return False
+    with open(path, "wb") as f:
+        f.write(data.replace(old, new))
+    return True
+
+
+def rewrite_chunk(units: List[Tuple[str, bool]], old: bytes, new: bytes) -> dict:
+    """
+    Worker entry point: rewrites `old` -> `new` in the .smali files of each (directory,
+    recursive) unit. Runs in a pool process, so it must stay importable at module level.
+    """
+    scanned = rewritten = 0
+    errors = []
+    for directory, recursive in units:
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = list(os.scandir(current))
+            except OSError as e:
+                errors.append(f"{current}: {e}")
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        stack.append(entry.path)
+                    continue
+                if not entry.name.endswith(".smali"):
+                    continue
+                scanned += 1
+                try:
+                    if _rewrite_file(entry.path, old, new):
+                        rewritten += 1
+                except OSError as e:
+                    errors.append(f"{entry.path}: {e}")
+    return {"scanned": scanned, "rewritten": rewritten, "errors": errors}
+
+
+class SmaliRewriter:
+    """
+    Rewrites class references across a decoded tree in a process pool, so the byte
+    scanning runs on all cores instead of holding the server's GIL. The tree is split
+    into (directory, recursive) units — every smali* root expanded a few levels until
+    there is enough work to spread — and the units are dealt round-robin to the workers.
+    Pool processes see the same workspace paths as the caller.
+    """
+
+    def __init__(self, workers: Optional[int] = None, units_per_worker: int = 4, max_depth: int = 4):
+        self.workers = workers or os.cpu_count() or 2
+        self.units_per_worker = units_per_worker
+        self.max_depth = max_depth
+        self.executor = self._new_pool()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # spawn: forking a process that runs eventlet and worker threads is not safe
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _plan_units(self, roots: List[Path]) -> List[Tuple[str, bool]]:
+        target = self.workers * self.units_per_worker
+        units = [(str(root), True) for root in roots]
+        for _ in range(self.max_depth):
+            if sum(1 for _, recursive in units if recursive) >= target:
+                break
+            expanded = []
+            for directory, recursive in units:
+                if not recursive:
+                    expanded.append((directory, False))
+                    continue
+                expanded.append((directory, False))  # the directory's own files
+                try:
+                    expanded.extend((entry.path, True) for entry in os.scandir(directory)
+                                    if entry.is_dir(follow_symlinks=False))
+                except OSError:
+                    pass
+            if len(expanded) == len(units):
+                break
+            units = expanded
+        return units
+
+    def rewrite(self, src_dir: Path, old: str, new: str) -> dict:
+        """Replaces `old` with `new` in every .smali file under the smali* dirs of `src_dir`."""
+        start = time.perf_counter()
+        roots = [d for d in src_dir.iterdir() if d.is_dir() and d.name.startswith("smali")]
+        units = self._plan_units(roots)
+        chunks = [units[i::self.workers] for i in range(min(self.workers, len(units)))]
+        old_bytes, new_bytes = old.encode("utf-8"), new.encode("utf-8")
+
+        try:
+            futures = [self.executor.submit(rewrite_chunk, chunk, old_bytes, new_bytes) for chunk in chunks]
+            results = [future.result() for future in futures]
+        except BrokenProcessPool as e:
+            # some chunks may already be rewritten, and rewriting twice is not safe when `new`
+            # contains `old` — fail the job instead of retrying here
+            self.executor = self._new_pool()
+            raise Exception(f"Smali rewrite worker died: {e}")
+
+        errors = [error for result in results for error in result["errors"]]
+        return {
+            "scanned": sum(result["scanned"] for result in results),
+            "rewritten": sum(result["rewritten"] for result in results),
+            "units": len(units),
+            "error_count": len(errors),
+            "errors": errors[:MAX_REPORTED_ERRORS],
+            "seconds": time.perf_counter() - start,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
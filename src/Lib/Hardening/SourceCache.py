@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+from src.Lib.Hardening.Downloader import Downloader
+
+
+class SourceCache:
+    """
+    Persistent cache of downloaded source APKs keyed by URL. The download is made conditional
+    on the cached copy's ETag/Last-Modified; the copy is only reused when the origin confirms
+    it, otherwise the same request already carries the new APK, so a re-published APK is
+    always refetched. Responses without ETag/Last-Modified are
+    not cached. Entries are evicted least-recently-used once past `max_bytes`.
+    """
+
+    def __init__(self, downloader: Downloader, cache_dir: str, max_bytes: int):
+        self.downloader = downloader
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.bytes_saved = 0
+
+        self._load()
+
+    def _load(self):
+        found = []
+        for entry in self.cache_dir.iterdir():
+            if entry.name.startswith("."):
+                entry.unlink(missing_ok=True)
+                continue
+            if entry.suffix != ".json":
+                if not entry.with_suffix(".json").exists():
+                    entry.unlink(missing_ok=True)
+                continue
+            try:
+                meta = json.loads(entry.read_text())
+            except (OSError, ValueError):
+                entry.unlink(missing_ok=True)
+                continue
+            if not entry.with_suffix(".apk").exists():
+                entry.unlink(missing_ok=True)
+                continue
+            found.append((meta.get("last_used", 0), entry.stem, meta))
+        for _, key, meta in sorted(found, key=lambda item: item[0]):
+            self.entries[key] = meta
+        print(f"[SourceCache] Loaded {len(self.entries)} entries ({self.total_bytes() / 1048576:.1f} MB)")
+
+    @staticmethod
+    def key_for(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def total_bytes(self) -> int:
+        return sum(meta["size"] for meta in self.entries.values())
+
+    def _write_meta(self, key: str, meta: dict):
+        staging = self.cache_dir / f".{key}-{uuid.uuid4().hex}.json"
+        staging.write_text(json.dumps(meta))
+        os.replace(staging, self.cache_dir / f"{key}.json")
+
+    @staticmethod
+    def _link(src: Path, dst: Path):
+        dst.unlink(missing_ok=True)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+
+    def download(self, url: str, save_path: Path) -> dict:
+        """Same contract as Downloader.download; `source_cache_hit` tells whether the origin sent a body."""
+        save_path = Path(save_path)
+        key = self.key_for(url)
+        cached_apk = self.cache_dir / f"{key}.apk"
+        start = time.perf_counter()
+
+        with self.lock:
+            meta = self.entries.get(key)
+        if meta is not None and meta["url"] == url and cached_apk.exists():
+            info = self.downloader.download(url, save_path, meta.get("etag"), meta.get("last_modified"))
+            if info.get("not_modified"):
+                try:
+                    self._link(cached_apk, save_path)
+                except FileNotFoundError:
+                    info = self.downloader.download(url, save_path)  # evicted under us
+                else:
+                    meta = dict(meta, last_used=time.time())
+                    self._write_meta(key, meta)
+                    with self.lock:
+                        if key in self.entries:
+                            self.entries[key] = meta
+                            self.entries.move_to_end(key)
+                        self.hits += 1
+                        self.bytes_saved += meta["size"]
+                    print(f"[SourceCache] Not modified: {url} — reusing cached copy")
+                    return {"url": meta["url"], "sha256": meta["sha256"], "size": meta["size"], "segments": 0,
+                            "resumed_bytes": 0, "etag": meta.get("etag"), "last_modified": meta.get("last_modified"),
+                            "seconds": time.perf_counter() - start, "source_cache_hit": True}
+            else:
+                with self.lock:
+                    self.stale += 1
+        else:
+            info = self.downloader.download(url, save_path)
+        with self.lock:
+            self.misses += 1
+        if info.get("etag") or info.get("last_modified"):
+            self._store(key, url, save_path, info)
+        return dict(info, source_cache_hit=False)
+
+    def _store(self, key: str, url: str, path: Path, info: dict):
+        if info["size"] > self.max_bytes:
+            return
+        staging = self.cache_dir / f".{key}-{uuid.uuid4().hex}.apk"
+        try:
+            self._link(path, staging)
+            os.replace(staging, self.cache_dir / f"{key}.apk")
+        except OSError as e:
+            staging.unlink(missing_ok=True)
+            print(f"[SourceCache] Could not cache {url}: {e}")
+            return
+        meta = {"url": url, "sha256": info["sha256"], "size": info["size"], "etag": info.get("etag"),
+                "last_modified": info.get("last_modified"), "last_used": time.time()}
+        self._write_meta(key, meta)
+        with self.lock:
+            self.entries[key] = meta
+            self.entries.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        victims = []
+        with self.lock:
+            total = self.total_bytes()
+            for key in list(self.entries):
+                if total <= self.max_bytes:
+                    break
+                total -= self.entries.pop(key)["size"]
+                victims.append(key)
+        for key in victims:
+            # meta first, so a crash never leaves an entry pointing at a missing APK
+            (self.cache_dir / f"{key}.json").unlink(missing_ok=True)
+            (self.cache_dir / f"{key}.apk").unlink(missing_ok=True)
+            print(f"[SourceCache] Evicted {key[:12]}")
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes(),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
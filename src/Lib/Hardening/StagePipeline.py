@@ -0,0 +1,332 @@
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.Lib.Hardening.Autoscaler import ConcurrencyLimit
+from src.Lib.Hardening.FairScheduler import TEST, FairScheduler
+from src.Lib.Hardening.JobRegistry import JobRegistry
+from src.Lib.Hardening.RetryPolicy import RetryPolicy
+
+RETRY = object()  # _advance result: run the same stage again after a backoff
+
+
+class Stage:
+    def __init__(self, name: str, handler: Callable, workers: int):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"Stage-{name}")
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+
+
+class _Task:
+    """A whole job run as one callable (the /test-harden path) admitted alongside staged jobs."""
+    __slots__ = ("job", "run", "result", "admitted_at", "admission_class")
+
+    def __init__(self, job, run: Callable[[], Optional[dict]]):
+        self.job = job
+        self.run = run
+        self.result: Optional[dict] = None
+        self.admitted_at = 0.0
+        self.admission_class: Optional[str] = None
+
+
+class StagePipeline:
+    """
+    Runs jobs through an ordered list of stages, each on its own bounded thread pool, so
+    one job's network phase overlaps another job's JVM/CPU phase. A handler returns None
+    to continue with the next stage or a stage name to jump to; an exception hands the
+    job to `on_error` and then to the last stage, which always runs (callback/cleanup).
+    At most `max_in_flight` jobs are inside the pipeline; the rest wait in a FairScheduler
+    (per-domain queues, interactive before bulk, per-domain caps), up to `max_pending`. An optional shared
+    ConcurrencyLimit (resized by the Autoscaler) further bounds admissions.
+
+    Stages with a RetryPolicy are re-run on failure against the retained workspace, after
+    a backoff that does not hold a worker thread.
+
+    It is also the one admission point for test traffic: `submit_task` queues a job as a
+    single callable in the lowest ("test") class, which is only admitted while at least
+    `test_reserved_slots` slots stay free for production and `memory_guard` allows it.
+    """
+
+    MEMORY_RETRY_SEC = 5.0
+
+    def __init__(self, stages: List[Tuple[str, Callable, int]], on_error: Callable, max_in_flight: int,
+                 scheduler: Optional[FairScheduler] = None, limit: Optional[ConcurrencyLimit] = None,
+                 test_reserved_slots: int = 1, memory_guard: Optional[Callable[[], bool]] = None,
+                 max_pending: int = 0, registry: Optional[JobRegistry] = None,
+                 retry_policies: Optional[Dict[str, RetryPolicy]] = None):
+        self.stages = [Stage(name, handler, workers) for name, handler, workers in stages]
+        self.by_name = {stage.name: stage for stage in self.stages}
+        self.final = self.stages[-1]
+        self.on_error = on_error
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self.registry = registry
+        self.retry_policies = retry_policies or {}
+        self.retried = 0
+        self.scheduler = scheduler if scheduler is not None else FairScheduler()  # empty one is falsy
+        self.limit = limit
+        self.test_reserved_slots = test_reserved_slots
+        self.memory_guard = memory_guard
+        self.task_executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="PipelineTask")
+        self.tests_deferred = 0
+        self.memory_retry: Optional[threading.Timer] = None
+        if limit is not None:
+            limit.listeners.append(self._admit)
+
+        self.lock = threading.Condition()
+        self.in_flight = 0
+        self.closed = False
+        self.avg_job_seconds: Optional[float] = None
+
+    # --- admission ------------------------------------------------------------
+
+    def submit(self, ctx):
+        if not self.submit_many([ctx]):
+            raise RuntimeError("Queue is full")
+
+    def submit_many(self, ctxs: List, partial: bool = True, bounded: bool = True) -> int:
+        """
+        Queues `ctxs` in order under one lock hold and admits once. Stops at `max_pending`
+        (unless bounded=False) and returns how many were queued; with partial=False it
+        queues all or none.
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Pipeline is shut down")
+            room = self._room() if bounded else len(ctxs)
+            if not partial and room < len(ctxs):
+                return 0
+            for ctx in ctxs[:room]:
+                self.scheduler.push(ctx.job.job_id, ctx.job.domain, ctx.job.priority, ctx)
+                if self.registry is not None:
+                    self.registry.submitted(ctx.job)
+        self._admit()
+        return min(room, len(ctxs))
+
+    def submit_task(self, job, run: Callable[[], Optional[dict]]):
+        """Queues `run()` as one test-class job; it only gets capacity production is not using."""
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Pipeline is shut down")
+            if not self._room():
+                raise RuntimeError("Queue is full")
+            self.scheduler.push(job.job_id, job.domain, TEST, _Task(job, run))
+            if self.registry is not None:
+                self.registry.submitted(job)
+        self._admit()
+
+    def _room(self) -> int:
+        if self.max_pending <= 0:
+            return sys.maxsize
+        return max(0, self.max_pending - len(self.scheduler))
+
+    def _skipped_classes(self) -> tuple:
+        """Called with one slot already taken: test work must leave the reserve untouched."""
+        free = self.capacity() - self.in_flight - 1
+        if self.limit is not None:
+            free = min(free, self.limit.limit - self.limit.active)
+        if free < self.test_reserved_slots:
+            return (TEST,)
+        if self.memory_guard is not None and self.scheduler.class_queued(TEST) and not self.memory_guard():
+            self.tests_deferred += 1
+            if self.memory_retry is None or not self.memory_retry.is_alive():
+                # nothing else may finish soon; look again once memory had a chance to free up
+                self.memory_retry = threading.Timer(self.MEMORY_RETRY_SEC, self._admit)
+                self.memory_retry.daemon = True
+                self.memory_retry.start()
+            return (TEST,)
+        return ()
+
+    def _admit(self):
+        admitted = []
+        with self.lock:
+            while self.in_flight < self.max_in_flight:
+                if self.limit is not None and not self.limit.try_acquire():
+                    break
+                picked = self.scheduler.pop(skip_classes=self._skipped_classes())
+                if picked is None:
+                    if self.limit is not None:
+                        self.limit.release(wake_listeners=False)
+                    break
+                self.in_flight += 1
+                item = picked[3]
+                item.admission_class = picked[2]
+                admitted.append(item)
+        for item in admitted:
+            item.admitted_at = time.perf_counter()
+            if self.registry is not None:
+                self.registry.started(item.job.job_id)
+            if isinstance(item, _Task):
+                self.task_executor.submit(self._run_task, item)
+            else:
+                self._enqueue(item, self.by_name[item.resume_from] if item.resume_from else self.stages[0])
+
+    def _run_task(self, task: _Task):
+        try:
+            task.result = task.run()
+        except Exception as e:
+            print(f"[Pipeline] Task failed for job {task.job.job_id}: {e}")
+        finally:
+            self._finish(task)
+
+    def _finish(self, ctx):
+        with self.lock:
+            self.in_flight -= 1
+            self.scheduler.done(ctx.job.domain, ctx.admission_class)
+            if ctx.admitted_at and not isinstance(ctx, _Task):
+                took = time.perf_counter() - ctx.admitted_at
+                self.avg_job_seconds = took if self.avg_job_seconds is None else \
+                    0.8 * self.avg_job_seconds + 0.2 * took
+            self.lock.notify_all()
+        if self.registry is not None:
+            self.registry.finished_job(ctx.job.job_id, ctx.result)
+        if self.limit is not None:
+            self.limit.release(wake_listeners=False)
+        self._admit()
+
+    def capacity(self) -> int:
+        return min(self.max_in_flight, self.limit.limit) if self.limit is not None else self.max_in_flight
+
+    def queue_status(self, job_id: str) -> dict:
+        """Queue position of a waiting job and a rough wait estimate from recent job durations."""
+        with self.lock:
+            position = self.scheduler.position(job_id)
+            if position is None:
+                return {"queue_position": 0, "estimated_wait_sec": 0.0}
+            wait = None
+            if self.avg_job_seconds is not None:
+                # jobs leave the pipeline roughly max_in_flight at a time every avg_job_seconds
+                wait = round((position // max(1, self.capacity()) + 1) * self.avg_job_seconds, 1)
+            return {"queue_position": position + 1, "estimated_wait_sec": wait}
+
+    # --- stage flow -------------------------------------------------------------
+
+    def _enqueue(self, ctx, stage: Stage):
+        ctx.stage = stage.name
+        ctx.enqueued_at = time.perf_counter()
+        with self.lock:
+            stage.queued += 1
+        if self.registry is not None:
+            self.registry.stage(ctx.job.job_id, stage.name)
+        stage.executor.submit(self._run, ctx, stage)
+
+    def _advance(self, ctx, stage: Stage) -> Optional[Stage]:
+        """Runs one stage for `ctx` and returns the stage to run next (None when done)."""
+        try:
+            target = stage.handler(ctx)
+        except Exception as e:
+            with self.lock:
+                stage.failed += 1
+            if self._should_retry(ctx, stage, e):
+                return RETRY
+            if stage is self.final:
+                print(f"[Pipeline] {stage.name} failed for job {ctx.job.job_id}: {e}")
+                return None
+            self.on_error(ctx, e)
+            return self.final
+        with self.lock:
+            stage.completed += 1
+        if stage is self.final:
+            return None
+        if target is not None:
+            return self.by_name[target]
+        return self.stages[self.stages.index(stage) + 1]
+
+    def _should_retry(self, ctx, stage: Stage, error: Exception) -> bool:
+        policy = self.retry_policies.get(stage.name)
+        failures = ctx.retries.get(stage.name, 0) + 1
+        if policy is None or failures >= policy.attempts or not policy.retryable(error):
+            return False
+        ctx.retries[stage.name] = failures
+        # what a resubmission would have redone: every stage that already completed
+        saved = sum(seconds for name, seconds in ctx.stage_seconds.items() if name != stage.name)
+        ctx.timings[f"retry_{stage.name}"] = failures
+        ctx.timings["retry_saved"] = ctx.timings.get("retry_saved", 0.0) + saved
+        with self.lock:
+            self.retried += 1
+        print(f"[Pipeline] {stage.name} failed for job {ctx.job.job_id} ({error}) — "
+              f"retry {failures}/{policy.attempts - 1}, reusing {saved:.1f}s of completed work")
+        return True
+
+    def _run(self, ctx, stage: Stage):
+        waited = time.perf_counter() - ctx.enqueued_at
+        key = f"queue_{stage.name}"
+        ctx.timings[key] = ctx.timings.get(key, 0.0) + waited
+        with self.lock:
+            stage.queued -= 1
+            stage.active += 1
+        start = time.perf_counter()
+        try:
+            next_stage = self._advance(ctx, stage)
+        finally:
+            took = time.perf_counter() - start
+            ctx.stage_seconds[stage.name] = ctx.stage_seconds.get(stage.name, 0.0) + took
+            with self.lock:
+                stage.active -= 1
+            if self.registry is not None:
+                self.registry.stage_done(ctx.job.job_id, stage.name, took)
+        if next_stage is RETRY:
+            delay = self.retry_policies[stage.name].delay(ctx.retries[stage.name])
+            timer = threading.Timer(delay, self._enqueue, (ctx, stage))
+            timer.daemon = True
+            timer.start()
+        elif next_stage is None:
+            self._finish(ctx)
+        else:
+            self._enqueue(ctx, next_stage)
+
+    def run_inline(self, ctx):
+        """Runs every stage for `ctx` on the calling thread."""
+        stage = self.stages[0]
+        while stage is not None:
+            start = time.perf_counter()
+            next_stage = self._advance(ctx, stage)
+            ctx.stage_seconds[stage.name] = ctx.stage_seconds.get(stage.name, 0.0) + time.perf_counter() - start
+            if next_stage is RETRY:
+                time.sleep(self.retry_policies[stage.name].delay(ctx.retries[stage.name]))
+                continue
+            stage = next_stage
+
+    # --- introspection / lifecycle ---------------------------------------------
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "in_flight": self.in_flight,
+                "pending": len(self.scheduler),
+                "max_in_flight": self.max_in_flight,
+                "max_pending": self.max_pending,
+                "stage_retries": self.retried,
+                "retry_policies": {name: repr(policy) for name, policy in self.retry_policies.items()},
+                "capacity": self.capacity(),
+                "avg_job_seconds": round(self.avg_job_seconds, 2) if self.avg_job_seconds is not None else None,
+                "tests_deferred_for_memory": self.tests_deferred,
+                "test_reserved_slots": self.test_reserved_slots,
+                **self.scheduler.stats(),
+                "stages": {
+                    stage.name: {
+                        "workers": stage.workers,
+                        "queued": stage.queued,
+                        "active": stage.active,
+                        "completed": stage.completed,
+                        "failed": stage.failed,
+                    }
+                    for stage in self.stages
+                },
+            }
+
+    def shutdown(self, wait: bool = True):
+        with self.lock:
+            self.closed = True
+            while wait and (self.in_flight or len(self.scheduler)):
+                self.lock.wait()
+        for stage in self.stages:
+            stage.executor.shutdown(wait=wait)
+        self.task_executor.shutdown(wait=wait)
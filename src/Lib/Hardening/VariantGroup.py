@@ -0,0 +1,47 @@
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+from src.Lib.Hardening.DecodeCache import DecodeCache
+
+
+class VariantGroup:
+    """
+    Variants of one source APK submitted together. The first variant to need the source
+    downloads it into the group folder and the others hardlink it; decodes go through
+    `decode_cache` (the shared one, else a cache private to the group) so the tree is
+    decoded once and cloned per variant. The group folder goes when the last variant ends.
+    """
+
+    def __init__(self, group_id: str, folder: Path, size: int, decode_cache: Optional[DecodeCache] = None):
+        self.group_id = group_id
+        self.folder = folder
+        self.size = size
+        self.private_cache = decode_cache is None
+        self.decode_cache = decode_cache or DecodeCache(str(folder / "decoded"), max_bytes=1 << 62)
+        self.lock = threading.Lock()
+        self.remaining = size
+        self.source: Optional[dict] = None
+
+    def fetch_source(self, download: Callable[[Path], dict], dest: Path) -> dict:
+        """Links the group's copy of the source APK to `dest`, downloading it on first use."""
+        source_path = self.folder / "source.apk"
+        with self.lock:
+            shared = self.source is not None
+            if not shared:
+                self.folder.mkdir(parents=True, exist_ok=True)
+                self.source = download(source_path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(source_path, dest)
+        except OSError:
+            shutil.copy2(source_path, dest)
+        return dict(self.source, variant_shared=shared)
+
+    def finish(self) -> bool:
+        """Marks one variant done; True for the last one."""
+        with self.lock:
+            self.remaining -= 1
+            return self.remaining == 0
@@ -0,0 +1,257 @@
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Set
+
+TRASH_DIR = ".trash"
+JOB_ID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+JOB_ENTRY = re.compile(rf"^(?:temp_)?({JOB_ID})(?:\.apk)?$")
+RESUMABLE = re.compile(rf"^temp_({JOB_ID})\.apk\.part(?:\.json)?$")
+
+
+class WorkspaceJanitor:
+    """
+    Deletes finished job workspaces off the request path: `discard()` only renames them
+    into a `.trash` directory on the same filesystem (atomic, constant time), and
+    background threads running at the lowest CPU priority (which the CFQ/BFQ schedulers
+    also apply to IO) unlink the trash level by level in parallel, throttled to
+    `files_per_sec`. Job dirs and apktool temp dirs left behind by a crash are swept once
+    they are older than `orphan_age`; partial downloads are kept for resume until then.
+    A discard with `on_purged` (tmpfs workspaces, whose memory is only freed by the
+    unlink) is deleted right away without throttling and then reports back.
+    """
+
+    def __init__(self, roots: Iterable[str], workers: int = 2, files_per_sec: int = 5000,
+                 orphan_age: float = 3600, sweep_interval: float = 900):
+        self.roots = [Path(root) for root in roots]
+        self.workers = max(1, workers)
+        self.files_per_sec = files_per_sec
+        self.orphan_age = orphan_age
+        self.sweep_interval = sweep_interval
+
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.live: Set[str] = set()
+        self.tokens = float(files_per_sec)
+        self.refilled_at = time.monotonic()
+        self.discarded = 0
+        self.orphans = 0
+        self.files_deleted = 0
+        self.bytes_deleted = 0
+
+        for root in self.roots:
+            (root / TRASH_DIR).mkdir(parents=True, exist_ok=True)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="Janitor",
+                                           initializer=self._lower_priority)
+        threading.Thread(target=self._loop, name="janitor", daemon=True).start()
+
+    @staticmethod
+    def _lower_priority():
+        # on Linux the nice value is per thread; the rest of the process keeps its priority
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+
+    # --- job lifecycle ---------------------------------------------------------
+
+    def track(self, job_id: str):
+        """Marks `job_id` as running so the orphan sweep leaves its files alone."""
+        with self.lock:
+            self.live.add(job_id)
+
+    def discard(self, job_id: Optional[str], paths: Iterable[Optional[Path]],
+                on_purged: Optional[Callable[[], None]] = None):
+        """Moves `paths` to the trash and releases `job_id`; `on_purged` runs once they are deleted."""
+        trashed = []
+        for path in paths:
+            if path is not None:
+                moved = self._to_trash(Path(path))
+                if moved is not None:
+                    trashed.append(moved)
+        if job_id is not None:
+            with self.lock:
+                self.live.discard(job_id)
+        if on_purged is not None:
+            threading.Thread(target=self._purge_now, args=(trashed, on_purged),
+                             name="janitor-purge", daemon=True).start()
+        else:
+            self.wakeup.set()
+
+    def _to_trash(self, path: Path) -> Optional[Path]:
+        if not path.exists():
+            return None
+        trash = path.parent / TRASH_DIR
+        target = trash / f"{uuid.uuid4().hex}-{path.name}"
+        try:
+            trash.mkdir(exist_ok=True)
+            os.rename(path, target)
+        except OSError as e:
+            print(f"[Janitor] Could not move {path} to trash: {e}")
+            return None
+        with self.lock:
+            self.discarded += 1
+        return target
+
+    # --- orphans ---------------------------------------------------------------
+
+    def sweep_orphans(self) -> int:
+        """Trashes job dirs/files under the roots that no running job owns and that are stale."""
+        cutoff = time.time() - self.orphan_age
+        with self.lock:
+            live = set(self.live)
+        moved = 0
+        for root in self.roots:
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                match = JOB_ENTRY.match(entry.name) or RESUMABLE.match(entry.name)
+                if match is None or match.group(1) in live:
+                    continue
+                try:
+                    if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                        continue
+                except OSError:
+                    continue
+                if self._to_trash(Path(entry.path)) is not None:
+                    moved += 1
+        if moved:
+            with self.lock:
+                self.orphans += moved
+            print(f"[Janitor] Reclaimed {moved} orphaned workspaces")
+        return moved
+
+    # --- deletion ----------------------------------------------------------------
+
+    def _loop(self):
+        self._lower_priority()
+        # give the processors a moment to re-track jobs they resume after a restart
+        next_sweep = time.monotonic() + min(self.sweep_interval, 60.0)
+        while True:
+            if time.monotonic() >= next_sweep:
+                try:
+                    self.sweep_orphans()
+                except Exception as e:
+                    print(f"[Janitor] Orphan sweep failed: {e}")
+                next_sweep = time.monotonic() + self.sweep_interval
+            try:
+                self._empty_trash()
+            except Exception as e:
+                print(f"[Janitor] Emptying trash failed: {e}")
+            self.wakeup.wait(timeout=max(1.0, next_sweep - time.monotonic()))
+            self.wakeup.clear()
+
+    def _empty_trash(self):
+        for root in self.roots:
+            trash = root / TRASH_DIR
+            try:
+                entries = list(os.scandir(trash))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    self._purge_tree(entry.path)
+                else:
+                    self._unlink(entry.path)
+
+    def _purge_now(self, paths: List[Path], on_purged: Callable[[], None]):
+        try:
+            for path in paths:
+                if path.is_dir() and not path.is_symlink():
+                    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+                        for name in filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]:
+                            self._unlink(os.path.join(dirpath, name))
+                        try:
+                            os.rmdir(dirpath)
+                        except OSError:
+                            pass
+                else:
+                    self._unlink(str(path))
+        except Exception as e:
+            print(f"[Janitor] Purging {paths} failed: {e}")
+        finally:
+            on_purged()
+
+    def _throttle(self, count: int):
+        if self.files_per_sec <= 0:
+            return
+        count = min(count, self.files_per_sec)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(float(self.files_per_sec),
+                                  self.tokens + (now - self.refilled_at) * self.files_per_sec)
+                self.refilled_at = now
+                if self.tokens >= count:
+                    self.tokens -= count
+                    return
+                wait = (count - self.tokens) / self.files_per_sec
+            time.sleep(min(wait, 1.0))
+
+    def _unlink(self, path: str):
+        try:
+            size = os.lstat(path).st_size
+            os.unlink(path)
+        except FileNotFoundError:
+            return
+        with self.lock:
+            self.files_deleted += 1
+            self.bytes_deleted += size
+
+    def _clear_dir(self, path: str) -> List[str]:
+        """Unlinks the files directly in `path` and returns its subdirectories."""
+        subdirs, files = [], []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    (subdirs if entry.is_dir(follow_symlinks=False) else files).append(entry.path)
+        except FileNotFoundError:
+            return []
+        for start in range(0, len(files), 64):
+            batch = files[start:start + 64]
+            self._throttle(len(batch))
+            for file_path in batch:
+                self._unlink(file_path)
+        return subdirs
+
+    def _purge_tree(self, root: str):
+        # breadth-first: each level's directories are cleared in parallel, then removed deepest first
+        levels = [[root]]
+        while levels[-1]:
+            found = self.executor.map(self._clear_dir, levels[-1])
+            levels.append([subdir for subdirs in found for subdir in subdirs])
+        for level in reversed(levels):
+            for directory in level:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    pass
+
+    # --- introspection -------------------------------------------------------------
+
+    def stats(self) -> dict:
+        pending = 0
+        for root in self.roots:
+            try:
+                pending += sum(1 for _ in os.scandir(root / TRASH_DIR))
+            except OSError:
+                pass
+        with self.lock:
+            return {
+                "live_jobs": len(self.live),
+                "trash_entries": pending,
+                "discarded": self.discarded,
+                "orphans_reclaimed": self.orphans,
+                "files_deleted": self.files_deleted,
+                "bytes_deleted": self.bytes_deleted,
+                "files_per_sec": self.files_per_sec,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,81 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+RAM = "ram"
+DISK = "disk"
+
+
+class WorkspaceTiers:
+    """
+    Chooses where a job's working folder lives. Jobs go to `ram_dir` (a tmpfs such as
+    /dev/shm) while their estimated footprint — APK size times `size_factor` — fits in
+    `ram_budget` alongside the other running jobs and in the filesystem's free space;
+    everything else stays in `disk_dir`. Reservations are released when the job ends.
+    """
+
+    def __init__(self, disk_dir: str, ram_dir: Optional[str] = None, ram_budget: int = 0,
+                 size_factor: float = 6.0):
+        self.disk_dir = Path(disk_dir)
+        self.ram_dir = Path(ram_dir) if ram_dir and ram_budget > 0 else None
+        self.ram_budget = ram_budget if self.ram_dir else 0
+        self.size_factor = size_factor
+
+        self.lock = threading.Lock()
+        self.reservations: Dict[str, int] = {}
+        self.reserved = 0
+        self.placed = {RAM: 0, DISK: 0}
+        self.spilled = 0
+
+        if self.ram_dir is not None:
+            try:
+                self.ram_dir.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                print(f"[WorkspaceTiers] RAM tier unavailable ({e}) — using disk only")
+                self.ram_dir = None
+                self.ram_budget = 0
+
+    def _free_ram_tier(self) -> int:
+        st = os.statvfs(self.ram_dir)
+        return st.f_bavail * st.f_frsize
+
+    def place(self, job_id: str, apk_size: int, size_factor: Optional[float] = None,
+              prefer_disk: bool = False) -> Tuple[Path, str]:
+        """Returns (job folder, tier) for a job whose source APK is `apk_size` bytes."""
+        need = int(apk_size * (size_factor or self.size_factor))
+        with self.lock:
+            if self.ram_dir is not None and not prefer_disk:
+                if self.reserved + need <= self.ram_budget and need <= self._free_ram_tier():
+                    self.reservations[job_id] = need
+                    self.reserved += need
+                    self.placed[RAM] += 1
+                    return self.ram_dir / job_id, RAM
+                self.spilled += 1
+            self.placed[DISK] += 1
+        return self.disk_dir / job_id, DISK
+
+    def adopt(self, job_id: str, apk_size: int, tier: str, size_factor: Optional[float] = None):
+        """Re-reserves a RAM workspace left by a previous process for a job being resumed."""
+        if tier != RAM:
+            return
+        need = int(apk_size * (size_factor or self.size_factor))
+        with self.lock:
+            self.reservations[job_id] = need
+            self.reserved += need
+
+    def release(self, job_id: str):
+        with self.lock:
+            self.reserved -= self.reservations.pop(job_id, 0)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "ram_dir": str(self.ram_dir) if self.ram_dir else None,
+                "ram_budget": self.ram_budget,
+                "ram_reserved": self.reserved,
+                "ram_jobs": len(self.reservations),
+                "placed_ram": self.placed[RAM],
+                "placed_disk": self.placed[DISK],
+                "spilled_to_disk": self.spilled,
+            }
@@ -0,0 +1,109 @@
+"""Builds small compiled AndroidManifest.xml / resources.arsc files for the parser tests."""
+import struct
+from typing import List, Tuple
+
+ANDROID_NS = "http://schemas.android.com/apk/res/android"
+NO_INDEX = 0xFFFFFFFF
+
+
+def string_pool(strings: List[str], utf8: bool = False) -> bytes:
+    data = b""
+    offsets = []
+    for value in strings:
+        offsets.append(len(data))
+        if utf8:
+            encoded = value.encode("utf-8")
+            data += bytes([len(value), len(encoded)]) + encoded + b"\0"
+        else:
+            data += struct.pack("<H", len(value)) + value.encode("utf-16-le") + b"\0\0"
+    data += b"\0" * (-len(data) % 4)
+    header_size = 28
+    strings_start = header_size + 4 * len(strings)
+    return (struct.pack("<HHIIIIII", 0x0001, header_size, strings_start + len(data), len(strings), 0,
+                        0x100 if utf8 else 0, strings_start, 0)
+            + struct.pack(f"<{len(strings)}I", *offsets) + data)
+
+
+def manifest(utf8: bool = False) -> bytes:
+    """
+    <manifest package="com.old.app" android:versionCode="7" android:versionName="1.2.3">
+      <uses-permission android:name="android.permission.CAMERA"/>
+      <uses-permission android:name="android.permission.INTERNET"/>
+      <application android:label="My App" android:debuggable="true" android:allowBackup="true">
+        <activity android:name=".MainActivity">
+          <intent-filter><action MAIN/><category LAUNCHER/></intent-filter>
+        </activity>
+      </application>
+    </manifest>
+    """
+    # attribute names first, matching the resource map
+    strings = ["label", "name", "versionCode", "versionName", "debuggable", "allowBackup",
+               "android", ANDROID_NS, "manifest", "package", "com.old.app", "1.2.3", "uses-permission",
+               "android.permission.CAMERA", "android.permission.INTERNET", "application", "My App",
+               "activity", ".MainActivity", "intent-filter", "action", "android.intent.action.MAIN",
+               "category", "android.intent.category.LAUNCHER"]
+    index = {value: i for i, value in enumerate(strings)}
+    resource_ids = [0x01010001, 0x01010003, 0x0101021B, 0x0101021C, 0x0101000F, 0x01010280]
+    ns = index[ANDROID_NS]
+
+    def attr(attr_ns: int, name: str, raw: int, data_type: int, data: int) -> bytes:
+        return struct.pack("<IIIHBBI", attr_ns, index[name], raw, 8, 0, data_type, data)
+
+    def string_attr(name: str, value: str, attr_ns: int = ns) -> bytes:
+        return attr(attr_ns, name, index[value], 0x03, index[value])
+
+    def start(tag: str, attrs: List[bytes]) -> bytes:
+        ext = struct.pack("<IIHHHHHH", NO_INDEX, index[tag], 20, 20, len(attrs), 0, 0, 0) + b"".join(attrs)
+        return struct.pack("<HHIII", 0x0102, 16, 16 + len(ext), 1, NO_INDEX) + ext
+
+    def end(tag: str) -> bytes:
+        return struct.pack("<HHIIIII", 0x0103, 16, 24, 1, NO_INDEX, NO_INDEX, index[tag])
+
+    body = struct.pack("<HHIIIII", 0x0100, 16, 24, 1, NO_INDEX, index["android"], ns)
+    body += start("manifest", [attr(ns, "versionCode", NO_INDEX, 0x10, 7), string_attr("versionName", "1.2.3"),
+                               string_attr("package", "com.old.app", NO_INDEX)])
+    for permission in ("android.permission.CAMERA", "android.permission.INTERNET"):
+        body += start("uses-permission", [string_attr("name", permission)]) + end("uses-permission")
+    body += start("application", [string_attr("label", "My App"), attr(ns, "debuggable", NO_INDEX, 0x12, NO_INDEX),
+                                  attr(ns, "allowBackup", NO_INDEX, 0x12, NO_INDEX)])
+    body += start("activity", [string_attr("name", ".MainActivity")])
+    body += start("intent-filter", [])
+    body += start("action", [string_attr("name", "android.intent.action.MAIN")]) + end("action")
+    body += start("category", [string_attr("name", "android.intent.category.LAUNCHER")]) + end("category")
+    body += end("intent-filter") + end("activity") + end("application") + end("manifest")
+    body += struct.pack("<HHIIIII", 0x0101, 16, 24, 1, NO_INDEX, index["android"], ns)
+
+    resource_map = struct.pack("<HHI", 0x0180, 8, 8 + 4 * len(resource_ids)) + struct.pack(
+        f"<{len(resource_ids)}I", *resource_ids)
+    content = string_pool(strings, utf8) + resource_map + body
+    return struct.pack("<HHI", 0x0003, 8, 8 + len(content)) + content
+
+
+def _type_chunk(type_id: int, values: List[Tuple[int, int]], language: bytes = b"\0\0") -> bytes:
+    config = struct.pack("<I", 64) + b"\0" * 4 + language + b"\0" * 54
+    header_size = 20 + len(config)
+    offsets = b""
+    entries = b""
+    for key, value in values:
+        offsets += struct.pack("<I", len(entries))
+        entries += struct.pack("<HHI", 8, 0, key) + struct.pack("<HBBI", 8, 0, 0x03, value)
+    entries_start = header_size + len(offsets)
+    header = struct.pack("<HHIBBHII", 0x0201, header_size, entries_start + len(entries), type_id, 0, 0,
+                         len(values), entries_start) + config
+    return header + offsets + entries
+
+
+def resource_table() -> bytes:
+    """Package 0x7f with string/app_name ("Old App", fr "Ancien") and string/hello ("Hello")."""
+    global_pool = string_pool(["Old App", "Hello", "Ancien"], utf8=True)
+    type_strings = string_pool(["string"], utf8=True)
+    key_strings = string_pool(["app_name", "hello"], utf8=True)
+    types = _type_chunk(1, [(0, 0), (1, 1)]) + _type_chunk(1, [(0, 2), (1, 1)], b"fr")
+    header_size = 288
+    package = (struct.pack("<HHII", 0x0200, header_size,
+                           header_size + len(type_strings) + len(key_strings) + len(types), 0x7F)
+               + b"\0" * 256
+               + struct.pack("<IIIII", header_size, 1, header_size + len(type_strings), 2, 0)
+               + type_strings + key_strings + types)
+    body = global_pool + package
+    return struct.pack("<HHII", 0x0002, 12, 12 + len(body), 1) + body
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the code under test is imported as `src.Lib...`, relative to the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,80 @@
+import datetime
+import struct
+import zipfile
+
+import pytest
+
+from chunk_builders import manifest
+from src.Lib.Hardening.ApkSigner import (
+    APK_SIG_BLOCK_MAGIC, APK_SIGNATURE_SCHEME_V2_BLOCK_ID, APK_SIGNATURE_SCHEME_V3_BLOCK_ID, SIGNING_BLOCK_ALIGNMENT,
+    VERITY_PADDING_BLOCK_ID, ApkSigner)
+from src.Lib.Hardening.ApkZip import zipalign
+
+pytest.importorskip("cryptography")
+
+
+@pytest.fixture(scope="module")
+def keystore(tmp_path_factory):
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.hazmat.primitives.serialization import pkcs12
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "Hardening")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+                   .serial_number(x509.random_serial_number()).not_valid_before(now)
+                   .not_valid_after(now + datetime.timedelta(days=365)).sign(key, hashes.SHA256()))
+    path = tmp_path_factory.mktemp("keystore") / "key.p12"
+    path.write_bytes(pkcs12.serialize_key_and_certificates(
+        b"androiddebugkey", key, certificate, None, serialization.BestAvailableEncryption(b"android")))
+    return path
+
+
+def _signing_block(data: bytes):
+    """Returns (block_start, leading size, trailing size, pairs) of the block before the central directory."""
+    eocd = data.rindex(b"PK\x05\x06")
+    cd_offset = struct.unpack_from("<I", data, eocd + 16)[0]
+    assert data[cd_offset - 16:cd_offset] == APK_SIG_BLOCK_MAGIC
+    trailing_size = struct.unpack_from("<Q", data, cd_offset - 24)[0]
+    start = cd_offset - trailing_size - 8
+    leading_size = struct.unpack_from("<Q", data, start)[0]
+
+    pairs = []
+    pos = start + 8
+    while pos < cd_offset - 24:
+        length, block_id = struct.unpack_from("<QI", data, pos)
+        pairs.append((block_id, length))
+        pos += 8 + length
+    assert pos == cd_offset - 24
+    return start, leading_size, trailing_size, pairs
+
+
+def test_sign(tmp_path, keystore):
+    source, aligned, signed = tmp_path / "in.apk", tmp_path / "aligned.apk", tmp_path / "signed.apk"
+    with zipfile.ZipFile(source, "w") as z:
+        z.writestr("AndroidManifest.xml", manifest(), zipfile.ZIP_DEFLATED)
+        z.writestr("classes.dex", b"dex\n035\0" + bytes(5000), zipfile.ZIP_DEFLATED)
+        z.writestr("res/drawable/a.png", bytes(range(256)) * 3, zipfile.ZIP_STORED)
+    zipalign(source, aligned)
+
+    signer = ApkSigner()
+    try:
+        signer.sign(aligned, signed, keystore)
+    finally:
+        signer.shutdown()
+
+    data = signed.read_bytes()
+    _, leading_size, trailing_size, pairs = _signing_block(data)
+    assert leading_size == trailing_size
+    assert (8 + leading_size) % SIGNING_BLOCK_ALIGNMENT == 0
+    assert [block_id for block_id, _ in pairs] == [
+        APK_SIGNATURE_SCHEME_V2_BLOCK_ID, APK_SIGNATURE_SCHEME_V3_BLOCK_ID, VERITY_PADDING_BLOCK_ID]
+
+    with zipfile.ZipFile(signed) as z:
+        assert z.testzip() is None
+        assert z.read("AndroidManifest.xml") == manifest()
+        # the manifest declares no minSdkVersion, so the v1 signature is added as well
+        assert {"META-INF/MANIFEST.MF", "META-INF/CERT.SF", "META-INF/CERT.RSA"} <= set(z.namelist())
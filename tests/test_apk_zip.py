@@ -0,0 +1,53 @@
+import os
+import zipfile
+
+from src.Lib.Hardening.ApkZip import ApkZip, alignment_for, zipalign
+
+CONTENTS = {
+    "AndroidManifest.xml": (b"<manifest/>" * 50, zipfile.ZIP_DEFLATED),
+    "res/drawable/a.png": (os.urandom(1001), zipfile.ZIP_STORED),
+    "res/raw/b.ogg": (os.urandom(333), zipfile.ZIP_STORED),
+    "lib/arm64-v8a/libfoo.so": (os.urandom(5000), zipfile.ZIP_STORED),
+    "assets/odd_name_.txt": (b"x", zipfile.ZIP_STORED),
+    "lib/x86_64/libbar.so": (os.urandom(7), zipfile.ZIP_STORED),
+}
+
+
+def _write_unaligned(path):
+    with zipfile.ZipFile(path, "w") as z:
+        for name, (data, method) in CONTENTS.items():
+            z.writestr(name, data, method)
+
+
+def test_zipalign(tmp_path):
+    source, aligned = tmp_path / "in.apk", tmp_path / "out.apk"
+    _write_unaligned(source)
+    with ApkZip(source) as apk:
+        assert not apk.is_aligned()
+
+    assert zipalign(source, aligned) is True
+
+    with ApkZip(aligned) as apk:
+        assert apk.is_aligned()
+        for entry in apk.entries:
+            data_offset = apk.local_header(entry)[1]
+            if entry.method == zipfile.ZIP_STORED:
+                assert data_offset % 4 == 0, entry.name
+            if entry.name.endswith(".so"):
+                assert alignment_for(entry.name, entry.method) == 4096
+                assert data_offset % 4096 == 0, entry.name
+    with zipfile.ZipFile(aligned) as z:
+        assert z.testzip() is None
+        assert z.namelist() == list(CONTENTS)
+        for name, (data, method) in CONTENTS.items():
+            assert z.read(name) == data
+            assert z.getinfo(name).compress_type == method
+
+
+def test_zipalign_keeps_an_aligned_input(tmp_path):
+    source, aligned, again = tmp_path / "in.apk", tmp_path / "aligned.apk", tmp_path / "again.apk"
+    _write_unaligned(source)
+    zipalign(source, aligned)
+
+    assert zipalign(aligned, again) is False
+    assert again.read_bytes() == aligned.read_bytes()
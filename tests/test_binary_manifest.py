@@ -0,0 +1,62 @@
+import pytest
+
+from chunk_builders import manifest
+from src.Lib.Hardening.BinaryManifest import BinaryManifest, BinaryManifestError
+
+
+@pytest.mark.parametrize("utf8", [False, True])
+def test_parse(utf8):
+    parsed = BinaryManifest(manifest(utf8))
+    assert parsed.summary() == {"package": "com.old.app", "versionCode": 7, "versionName": "1.2.3"}
+    application = parsed.root.find("application")
+    assert parsed.get_attr(application, "label") == "My App"
+    assert [parsed.get_attr(p, "name") for p in parsed.root.findall("uses-permission")] == [
+        "android.permission.CAMERA", "android.permission.INTERNET"]
+    assert [parsed.get_attr(a, "name") for a in parsed.launcher_components()] == [".MainActivity"]
+
+
+@pytest.mark.parametrize("utf8", [False, True])
+def test_unchanged_round_trip_is_byte_identical(utf8):
+    data = manifest(utf8)
+    assert BinaryManifest(data).to_bytes() == data
+
+
+def test_edits_survive_a_rewrite():
+    parsed = BinaryManifest(manifest())
+    root = parsed.root
+    application = root.find("application")
+    parsed.remove_element(root.findall("uses-permission")[0])
+    parsed.remove_attr(application, "debuggable")
+    parsed.set_string_attr(application, "label", "New App")
+    parsed.set_int_attr(root, "versionCode", 42)
+    parsed.rename_package("com.new.app")
+
+    reread = BinaryManifest(parsed.to_bytes())
+    root = reread.root
+    application = root.find("application")
+    assert reread.summary() == {"package": "com.new.app", "versionCode": 42, "versionName": "1.2.3"}
+    assert [reread.get_attr(p, "name") for p in root.findall("uses-permission")] == ["android.permission.INTERNET"]
+    assert reread.get_attr(application, "debuggable") is None
+    assert reread.get_attr(application, "allowBackup") == 0xFFFFFFFF
+    assert reread.get_attr(application, "label") == "New App"
+    # relative class names are expanded against the old package before the rename
+    assert reread.get_attr(root.find("application").find("activity"), "name") == "com.old.app.MainActivity"
+
+
+@pytest.mark.parametrize("cut", [0, 4, 12, 40, 200, -30])
+def test_truncated_input_raises_binary_manifest_error(cut):
+    data = manifest()
+    with pytest.raises(BinaryManifestError):
+        BinaryManifest(data[:cut])
+
+
+def test_corrupt_string_pool_raises_binary_manifest_error():
+    data = bytearray(manifest())
+    data[8 + 8:8 + 12] = (0x7FFFFFFF).to_bytes(4, "little")  # string count
+    with pytest.raises(BinaryManifestError):
+        BinaryManifest(bytes(data))
+
+
+def test_not_a_manifest():
+    with pytest.raises(BinaryManifestError):
+        BinaryManifest(b"PK\x03\x04" + b"\0" * 64)
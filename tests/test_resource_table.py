@@ -0,0 +1,47 @@
+import pytest
+
+from chunk_builders import resource_table
+from src.Lib.Hardening.ResourceTable import ResourceTable, ResourceTableError
+
+APP_NAME = 0x7F010000
+HELLO = 0x7F010001
+
+
+def test_parse():
+    table = ResourceTable(resource_table())
+    assert [(e.key, e.locale, table.value(e)) for e in table.string_entries()] == [
+        ("app_name", "", "Old App"), ("hello", "", "Hello"), ("app_name", "fr", "Ancien"), ("hello", "fr", "Hello")]
+    assert table.resolve(APP_NAME) == "Old App"
+    assert table.key_for(HELLO) == "hello"
+
+
+def test_unchanged_round_trip_is_byte_identical():
+    data = resource_table()
+    assert ResourceTable(data).to_bytes() == data
+
+
+def test_set_value_then_reread():
+    table = ResourceTable(resource_table())
+    for entry in table.entries_for(APP_NAME):
+        table.set_value(entry, "Neue App" if entry.default_config else "Nouvelle")
+
+    data = table.to_bytes()
+    reread = ResourceTable(data)
+    assert int.from_bytes(data[4:8], "little") == len(data)
+    assert {e.locale: reread.value(e) for e in reread.entries_for(APP_NAME)} == {"": "Neue App", "fr": "Nouvelle"}
+    # "Hello" is shared by both configurations and must not move
+    assert [reread.value(e) for e in reread.entries_for(HELLO)] == ["Hello", "Hello"]
+
+
+@pytest.mark.parametrize("cut", [0, 6, 20, 100, 400, -10])
+def test_truncated_input_raises_resource_table_error(cut):
+    with pytest.raises(ResourceTableError):
+        ResourceTable(resource_table()[:cut])
+
+
+def test_corrupt_package_raises_resource_table_error():
+    data = bytearray(resource_table())
+    package = data.index(b"\x00\x02\x20\x01")  # RES_TABLE_PACKAGE_TYPE, header size 288
+    data[package + 268:package + 272] = (0x00FFFFFF).to_bytes(4, "little")  # type strings offset
+    with pytest.raises(ResourceTableError):
+        ResourceTable(bytes(data))